@@ -0,0 +1,616 @@
+"""
+DocSearch Hook commands run by hand: doctor, extract-keywords, stats,
+experiment-report and profile-report (see docsearch_hook.run).
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import re
+import sys
+from pathlib import Path
+
+from docsearch_hook import (
+    DECISION_LOG_FIELDS,
+    STOPWORDS,
+    find_project_files,
+    get_claude_json_path,
+    get_config_path,
+    get_config_sources,
+    get_decision_log_file,
+    get_profile_dir,
+    hash_session_id,
+    load_config_sources,
+    load_mcp_servers,
+    mcp_server_name,
+    parse_transcript_timestamp,
+    validate_config,
+)
+
+
+def find_database(databases: list[dict], selector: str) -> dict | None:
+    """Find a database by its name, or by its index in the config."""
+    for db in databases:
+        if db.get("name") == selector:
+            return db
+    if selector.isdigit() and int(selector) < len(databases):
+        return databases[int(selector)]
+    return None
+
+
+# Source document extensions read by extract-keywords
+SOURCE_EXTENSIONS = {".md", ".markdown", ".mdx", ".rst", ".txt", ".html", ".htm"}
+
+HTML_TAG_RE = re.compile(r"<[^>]*>")
+HTML_SKIP_RE = re.compile(r"<(script|style)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+TERM_RE = re.compile(r"[a-z][a-z0-9+#]*(?:[.-][a-z0-9+#]+)*")
+
+
+def iter_source_files(root: Path):
+    """Yield source documents under root, without listing the whole tree up front."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            if path.suffix.lower() in SOURCE_EXTENSIONS:
+                yield path
+
+
+def extract_document_terms(path: Path) -> list[str]:
+    """Return the distinct terms and two-word phrases in a source document."""
+    try:
+        text = path.read_text(errors="ignore")
+    except OSError:
+        return []
+    if path.suffix.lower() in (".html", ".htm"):
+        text = HTML_TAG_RE.sub(" ", HTML_SKIP_RE.sub(" ", text))
+    terms = set()
+    previous = None
+    for token in TERM_RE.findall(text.lower()):
+        if token in STOPWORDS or len(token) < 2:
+            previous = None
+            continue
+        terms.add(token)
+        if previous is not None:
+            terms.add(f"{previous} {token}")
+        previous = token
+    return list(terms)
+
+
+class TermCounter:
+    """Approximate document frequencies in bounded memory.
+
+    When more than `capacity` terms are tracked, the rarest are dropped and
+    the floor is raised, like lossy counting: a dropped term that reappears
+    starts from the floor, so counts overestimate by at most `floor`.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+        self.floor = 0
+        self.documents = 0
+
+    def add_document(self, terms: list[str]) -> None:
+        self.documents += 1
+        counts = self.counts
+        for term in terms:
+            counts[term] = counts.get(term, self.floor) + 1
+        if len(counts) > self.capacity:
+            self.prune()
+
+    def prune(self) -> None:
+        while len(self.counts) > self.capacity // 2:
+            self.floor += 1
+            self.counts = {term: count for term, count in self.counts.items() if count > self.floor}
+
+    def get(self, term: str) -> int:
+        return self.counts.get(term, self.floor)
+
+
+def count_document_terms(root: Path, capacity: int, workers: int) -> TermCounter:
+    """Count document frequencies of terms under root.
+
+    With workers > 1, tokenization runs in a process pool over fixed-size
+    batches of files, so memory stays bounded however large the tree is.
+    """
+    counter = TermCounter(capacity)
+    files = iter_source_files(root)
+    if workers <= 1:
+        for path in files:
+            counter.add_document(extract_document_terms(path))
+        return counter
+
+    from multiprocessing import Pool
+
+    batch_size = 64 * workers
+    with Pool(workers) as pool:
+        while batch := list(itertools.islice(files, batch_size)):
+            for terms in pool.imap_unordered(extract_document_terms, batch, chunksize=16):
+                counter.add_document(terms)
+    return counter
+
+
+def rank_keywords(foreground: TermCounter, background: TermCounter | None, min_df: int) -> list[dict]:
+    """Rank terms by how distinctive they are for the foreground corpus.
+
+    With a background corpus the score is the foreground document frequency
+    weighted by the log-ratio of foreground to background frequency, so
+    terms common everywhere sink. Without one, terms rank by frequency.
+    """
+    ranked = []
+    n_fg = max(foreground.documents, 1)
+    for term, df in foreground.counts.items():
+        if df < min_df:
+            continue
+        p_fg = df / n_fg
+        if background is not None:
+            p_bg = (background.get(term) + 1) / (background.documents + 2)
+            if p_fg <= p_bg:
+                continue
+            score = p_fg * math.log(p_fg / p_bg)
+        else:
+            score = p_fg
+        ranked.append({"keyword": term, "score": round(score, 6), "document_frequency": df})
+    ranked.sort(key=lambda item: (-item["score"], item["keyword"]))
+    return ranked
+
+
+def extract_keywords(args: list[str]) -> int:
+    """extract-keywords command: suggest keywords from a database's source documents."""
+    parser = argparse.ArgumentParser(
+        prog="docsearch.py extract-keywords",
+        description="Rank distinctive terms and phrases from a database's source documents.",
+    )
+    parser.add_argument("database", help="database name, or its index in the config")
+    parser.add_argument("--sources", help="source document directory (default: the database's 'sources')")
+    parser.add_argument("--background", help="directory of unrelated documents to contrast against")
+    parser.add_argument("--top", type=int, default=50, help="number of candidates to write (default: 50)")
+    parser.add_argument("--min-df", type=int, default=3, help="minimum document frequency (default: 3)")
+    parser.add_argument("--capacity", type=int, default=200000, help="maximum terms tracked per corpus (default: 200000)")
+    parser.add_argument("--workers", type=int, default=1, help="tokenizer processes (default: 1)")
+    parser.add_argument("--output", help="write the candidates here instead of stdout")
+    options = parser.parse_args(args)
+
+    config, _ = load_config_sources(get_config_sources(os.getcwd()))
+    if config is None:
+        print(f"Error: No usable config at {get_config_path()}", file=sys.stderr)
+        return 1
+    db = find_database(validate_config(config), options.database)
+    if db is None:
+        print(f"Error: No database '{options.database}' in config", file=sys.stderr)
+        return 1
+    sources = options.sources or db.get("sources")
+    if not sources or not Path(sources).is_dir():
+        print(f"Error: Source directory '{sources}' not found; set 'sources' or pass --sources", file=sys.stderr)
+        return 1
+
+    foreground = count_document_terms(Path(sources), options.capacity, options.workers)
+    background = None
+    if options.background:
+        background = count_document_terms(Path(options.background), options.capacity, options.workers)
+
+    existing = {keyword.lower() for keyword in db["keywords"]}
+    candidates = [
+        item for item in rank_keywords(foreground, background, options.min_df)
+        if item["keyword"] not in existing
+    ][: options.top]
+
+    output = json.dumps(candidates, indent=2)
+    if options.output:
+        Path(options.output).write_text(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+def doctor(args: list[str]) -> int:
+    """doctor command: check the config and that each database's MCP server is configured."""
+    parser = argparse.ArgumentParser(
+        prog="docsearch.py doctor",
+        description="Report config problems and databases whose MCP server isn't configured.",
+    )
+    parser.add_argument("--cwd", default=os.getcwd(), help="project directory to check (default: current directory)")
+    options = parser.parse_args(args)
+
+    find_project_files(options.cwd, refresh=True)
+    sources = get_config_sources(options.cwd)
+    if not sources:
+        print(f"No config found (looked for {get_config_path()})")
+        return 1
+    print("Config files:")
+    for path in sources:
+        print(f"  {path}")
+
+    config, _ = load_config_sources(sources)
+    if config is None:
+        return 1
+    databases = validate_config(config)
+    servers = load_mcp_servers(options.cwd)
+    if servers is None:
+        print(f"No MCP config found (looked for {get_claude_json_path()} and .mcp.json); can't verify MCP tools")
+        return 0 if databases else 1
+    print(f"MCP servers: {', '.join(sorted(servers)) or '(none)'}")
+
+    problems = len(config.get("databases", [])) - len(databases)
+    for i, db in enumerate(databases):
+        label = db.get("name") or f"#{i} {db['description']}"
+        server = mcp_server_name(db["mcp_tool_name"])
+        if server in servers:
+            print(f"OK       {label}: {db['mcp_tool_name']}")
+        else:
+            problems += 1
+            print(f"MISSING  {label}: MCP server '{server}' is not configured; matching searches won't be redirected")
+    return 1 if problems else 0
+
+
+# Latency quantiles are read from a log-scale histogram: bucket i holds
+# durations up to LATENCY_HISTOGRAM_BASE ** i microseconds (~5% resolution)
+LATENCY_HISTOGRAM_BASE = 1.05
+
+
+def iter_decision_records(log_file: Path):
+    """Yield decision log records as dicts, oldest first, skipping malformed lines."""
+    for path in (log_file.with_name(log_file.name + ".1"), log_file):
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    # Records written before the arm field was added
+                    if len(fields) == len(DECISION_LOG_FIELDS) - 1:
+                        fields.append("")
+                    if len(fields) == len(DECISION_LOG_FIELDS):
+                        yield dict(zip(DECISION_LOG_FIELDS, fields))
+        except FileNotFoundError:
+            continue
+
+
+def latency_quantile(histogram: dict[int, int], total: int, quantile: float) -> float:
+    """Return the upper bound, in microseconds, of the bucket holding a quantile."""
+    rank = math.ceil(total * quantile)
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return LATENCY_HISTOGRAM_BASE ** bucket
+    return 0.0
+
+
+def summarize_decisions(records) -> dict:
+    """Aggregate decision records in one pass.
+
+    Memory is bounded by the number of distinct decisions, databases and
+    latency buckets, not by the number of records. Only enforce-mode denies
+    count as redirected; shadow-mode denies are counted separately, as
+    redirects that would have happened.
+    """
+    decisions: dict[str, int] = {}
+    databases: dict[str, int] = {}
+    arms: dict[str, dict[str, int]] = {}
+    histogram: dict[int, int] = {}
+    total = escapes = redirected = shadow_total = shadow_redirects = 0
+    first = last = None
+    for record in records:
+        try:
+            timestamp = int(record["timestamp"])
+            duration_us = max(int(record["duration_us"]), 1)
+        except ValueError:
+            continue
+        total += 1
+        first = timestamp if first is None else min(first, timestamp)
+        last = timestamp if last is None else max(last, timestamp)
+        decision = record["decision"] if record["mode"] == "enforce" else f"{record['mode']}_{record['decision']}"
+        decisions[decision] = decisions.get(decision, 0) + 1
+        redirect = record["mode"] == "enforce" and record["decision"] == "deny"
+        shadow_redirect = record["mode"] == "shadow" and record["decision"] == "deny"
+        redirected += redirect
+        shadow_total += record["mode"] == "shadow"
+        shadow_redirects += shadow_redirect
+        if record["escape_hatch"] == "1":
+            escapes += 1
+        for label in filter(None, record["databases"].split(",")):
+            databases[label] = databases.get(label, 0) + 1
+        if record["arm"]:
+            arm = arms.setdefault(
+                record["arm"], {"invocations": 0, "redirected": 0, "shadow_redirects": 0, "escape_hatches": 0}
+            )
+            arm["invocations"] += 1
+            arm["redirected"] += redirect
+            arm["shadow_redirects"] += shadow_redirect
+            arm["escape_hatches"] += record["escape_hatch"] == "1"
+        bucket = math.ceil(math.log(duration_us, LATENCY_HISTOGRAM_BASE))
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    return {
+        "invocations": total,
+        "first_timestamp": first,
+        "last_timestamp": last,
+        "decisions": dict(sorted(decisions.items(), key=lambda item: -item[1])),
+        "hit_rate": redirected / total if total else 0.0,
+        "escape_hatch_rate": escapes / redirected if redirected else 0.0,
+        "shadow_redirects": shadow_redirects,
+        "shadow_hit_rate": shadow_redirects / shadow_total if shadow_total else 0.0,
+        "databases": dict(sorted(databases.items(), key=lambda item: -item[1])),
+        "arms": dict(sorted(arms.items())),
+        "latency_us": {
+            name: round(latency_quantile(histogram, total, quantile))
+            for name, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+        },
+    }
+
+
+def stats(args: list[str]) -> int:
+    """stats command: summarize the decision log."""
+    parser = argparse.ArgumentParser(
+        prog="docsearch.py stats",
+        description="Report hit rates, per-database traffic, escape-hatch rates and hook latency from the decision log.",
+    )
+    parser.add_argument("--log", help="decision log to read (default: DOCSEARCH_DECISION_LOG or the state directory)")
+    parser.add_argument("--json", action="store_true", help="write the summary as JSON")
+    options = parser.parse_args(args)
+
+    log_file = Path(options.log) if options.log else get_decision_log_file()
+    summary = summarize_decisions(iter_decision_records(log_file))
+    if options.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+    if not summary["invocations"]:
+        print(f"No decisions logged in {log_file}")
+        return 0
+
+    print(f"Invocations:       {summary['invocations']}")
+    print(f"Hit rate:          {summary['hit_rate']:.1%} of calls redirected")
+    print(f"Escape-hatch rate: {summary['escape_hatch_rate']:.1%} of redirected calls retried")
+    if summary["shadow_redirects"]:
+        print(
+            f"Shadow mode:       {summary['shadow_redirects']} calls would have been redirected "
+            f"({summary['shadow_hit_rate']:.1%} of shadow-mode calls)"
+        )
+    latency = summary["latency_us"]
+    print(f"Hook latency:      p50 {latency['p50']} us, p95 {latency['p95']} us, p99 {latency['p99']} us")
+    print("Decisions:")
+    for decision, count in summary["decisions"].items():
+        print(f"  {decision:<24} {count}")
+    if summary["databases"]:
+        print("Databases:")
+        for label, count in summary["databases"].items():
+            print(f"  {label:<40} {count}")
+    if summary["arms"]:
+        print("Experiment arms:")
+        for name, arm in summary["arms"].items():
+            shadow = f", {arm['shadow_redirects']} would have been" if arm["shadow_redirects"] else ""
+            print(
+                f"  {name:<24} {arm['invocations']} calls, {arm['redirected']} redirected{shadow}, "
+                f"{arm['escape_hatches']} escape hatches"
+            )
+    return 0
+
+
+def get_transcript_dir() -> Path:
+    """Get the directory Claude Code keeps session transcripts in."""
+    return Path.home() / ".claude" / "projects"
+
+
+def load_session_arms(records) -> dict[str, str | None]:
+    """Map session hashes to the experiment arm their decisions were logged with.
+
+    A session logged under more than one arm (the experiment changed while
+    it ran) maps to None, and is left out of the comparison.
+    """
+    arms: dict[str, str | None] = {}
+    for record in records:
+        if not record["arm"]:
+            continue
+        session = record["session"]
+        if arms.setdefault(session, record["arm"]) != record["arm"]:
+            arms[session] = None
+    return arms
+
+
+def is_user_prompt(entry: dict) -> bool:
+    """Check if a transcript entry is a prompt typed by the user.
+
+    Tool results, subagent messages, meta entries and slash-command output
+    are also recorded as user entries, and don't start a turn.
+    """
+    if entry.get("type") != "user" or entry.get("isSidechain") or entry.get("isMeta"):
+        return False
+    content = entry.get("message", {}).get("content")
+    if isinstance(content, list):
+        if any(isinstance(block, dict) and block.get("type") == "tool_result" for block in content):
+            return False
+        content = " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return isinstance(content, str) and not content.lstrip().startswith(("<command-", "<local-command-"))
+
+
+def summarize_transcript(path: Path) -> dict:
+    """Measure the turns of one session transcript.
+
+    A turn runs from a user prompt to the last assistant message before the
+    next prompt; its time to answer is the time between the two. Tool calls,
+    including a subagent's, count toward the turn they were made in.
+    """
+    turns = []
+    turn = None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(entry, dict) or not isinstance(entry.get("message"), dict):
+                continue
+            timestamp = parse_transcript_timestamp(entry.get("timestamp"))
+            if is_user_prompt(entry):
+                turn = {"started": timestamp, "answered": None, "tool_calls": 0, "web_searches": 0, "web_fetches": 0}
+                turns.append(turn)
+                continue
+            if turn is None or entry.get("type") != "assistant":
+                continue
+            if not entry.get("isSidechain"):
+                turn["answered"] = timestamp
+            content = entry["message"].get("content")
+            for block in content if isinstance(content, list) else []:
+                if isinstance(block, dict) and block.get("type") == "tool_use":
+                    turn["tool_calls"] += 1
+                    turn["web_searches"] += block.get("name") == "WebSearch"
+                    turn["web_fetches"] += block.get("name") == "WebFetch"
+    return {
+        "turns": len(turns),
+        "answer_seconds": [
+            turn["answered"] - turn["started"]
+            for turn in turns
+            if turn["started"] is not None and turn["answered"] is not None
+        ],
+        "tool_calls": sum(turn["tool_calls"] for turn in turns),
+        "web_searches": sum(turn["web_searches"] for turn in turns),
+        "web_fetches": sum(turn["web_fetches"] for turn in turns),
+    }
+
+
+def nearest_rank(sorted_values: list[float], quantile: float) -> float | None:
+    """Nearest-rank quantile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(len(sorted_values) * quantile), 1) - 1]
+
+
+def summarize_experiment(records, transcript_dir: Path) -> dict:
+    """Join the decision log with session transcripts and compare the arms.
+
+    Transcripts are named after their session ID, so only the transcripts
+    of sessions in the log are read.
+    """
+    session_arms = load_session_arms(records)
+    arms: dict[str, dict] = {}
+    for session, arm in session_arms.items():
+        if arm is not None:
+            arms.setdefault(arm, {"logged_sessions": 0, "sessions": 0, "turns": 0, "answer_seconds": [],
+                                  "tool_calls": 0, "web_searches": 0, "web_fetches": 0})
+            arms[arm]["logged_sessions"] += 1
+    for path in transcript_dir.rglob("*.jsonl"):
+        arm = session_arms.get(hash_session_id(path.stem))
+        if arm is None:
+            continue
+        try:
+            transcript = summarize_transcript(path)
+        except OSError as e:
+            print(f"Warning: Skipping unreadable transcript {path}: {e}", file=sys.stderr)
+            continue
+        totals = arms[arm]
+        totals["sessions"] += 1
+        for key in ("turns", "tool_calls", "web_searches", "web_fetches"):
+            totals[key] += transcript[key]
+        totals["answer_seconds"] += transcript["answer_seconds"]
+
+    report = {}
+    for name, totals in sorted(arms.items()):
+        answers = sorted(totals["answer_seconds"])
+        turns = totals["turns"]
+        report[name] = {
+            "logged_sessions": totals["logged_sessions"],
+            "sessions": totals["sessions"],
+            "turns": turns,
+            "answer_seconds_p50": nearest_rank(answers, 0.5),
+            "answer_seconds_p90": nearest_rank(answers, 0.9),
+            "tool_calls_per_turn": totals["tool_calls"] / turns if turns else None,
+            "web_searches_per_turn": totals["web_searches"] / turns if turns else None,
+            "web_fetches_per_turn": totals["web_fetches"] / turns if turns else None,
+        }
+    return {
+        "mixed_sessions": sum(arm is None for arm in session_arms.values()),
+        "arms": report,
+    }
+
+
+def experiment_report(args: list[str]) -> int:
+    """experiment-report command: compare experiment arms using session transcripts."""
+    parser = argparse.ArgumentParser(
+        prog="docsearch.py experiment-report",
+        description="Join the decision log's experiment arms with Claude Code transcripts and compare "
+        "time to answer, tool calls and web searches per arm.",
+    )
+    parser.add_argument("--log", help="decision log to read (default: DOCSEARCH_DECISION_LOG or the state directory)")
+    parser.add_argument("--transcripts", help="transcript directory, searched recursively (default: ~/.claude/projects)")
+    parser.add_argument("--json", action="store_true", help="write the report as JSON")
+    options = parser.parse_args(args)
+
+    log_file = Path(options.log) if options.log else get_decision_log_file()
+    transcript_dir = Path(options.transcripts) if options.transcripts else get_transcript_dir()
+    report = summarize_experiment(iter_decision_records(log_file), transcript_dir)
+    if options.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    if not report["arms"]:
+        print(f"No experiment arms logged in {log_file}")
+        return 0
+
+    def show(value, spec: str) -> str:
+        return "-" if value is None else format(value, spec)
+
+    print(
+        f"{'arm':<20} {'sessions':>8} {'turns':>6} {'answer p50 s':>12} {'answer p90 s':>12} "
+        f"{'tools/turn':>10} {'searches/turn':>13} {'fetches/turn':>12}"
+    )
+    for name, arm in report["arms"].items():
+        print(
+            f"{name:<20} {arm['sessions']:>8} {arm['turns']:>6} {show(arm['answer_seconds_p50'], '.1f'):>12} "
+            f"{show(arm['answer_seconds_p90'], '.1f'):>12} {show(arm['tool_calls_per_turn'], '.2f'):>10} "
+            f"{show(arm['web_searches_per_turn'], '.2f'):>13} {show(arm['web_fetches_per_turn'], '.2f'):>12}"
+        )
+    missing = sum(arm["logged_sessions"] - arm["sessions"] for arm in report["arms"].values())
+    if missing:
+        print(f"{missing} logged sessions had no transcript in {transcript_dir}")
+    if report["mixed_sessions"]:
+        print(f"{report['mixed_sessions']} sessions were logged under more than one arm and are left out")
+    return 0
+
+
+def profile_report(args: list[str]) -> int:
+    """profile-report command: merge sampled profiles into one hotspot listing."""
+    import pstats
+
+    parser = argparse.ArgumentParser(
+        prog="docsearch.py profile-report",
+        description="Merge the .pstats files written by DOCSEARCH_PROFILE_SAMPLE and rank hotspots.",
+    )
+    parser.add_argument("--dir", help="profile directory (default: DOCSEARCH_PROFILE_DIR or the state directory)")
+    parser.add_argument(
+        "--sort", default="cumulative", choices=["cumulative", "tottime", "ncalls"], help="ranking (default: cumulative)"
+    )
+    parser.add_argument("--top", type=int, default=30, help="number of functions to list (default: 30)")
+    parser.add_argument("--output", help="also write the merged profile here, for snakeviz and friends")
+    options = parser.parse_args(args)
+
+    profile_dir = Path(options.dir) if options.dir else get_profile_dir()
+    merged = None
+    count = 0
+    for profile_file in sorted(profile_dir.glob("docsearch-*.pstats")):
+        try:
+            if merged is None:
+                merged = pstats.Stats(str(profile_file), stream=sys.stdout)
+            else:
+                merged.add(str(profile_file))
+        except (OSError, EOFError, TypeError, ValueError) as e:
+            print(f"Warning: Skipping unreadable profile {profile_file}: {e}", file=sys.stderr)
+            continue
+        count += 1
+    if merged is None:
+        print(f"No profiles in {profile_dir}")
+        return 1
+
+    print(f"Merged {count} profiles from {profile_dir}")
+    if options.output:
+        merged.dump_stats(options.output)
+    merged.sort_stats(options.sort).print_stats(options.top)
+    return 0
+
+
+COMMANDS = {
+    "doctor": doctor,
+    "extract-keywords": extract_keywords,
+    "stats": stats,
+    "experiment-report": experiment_report,
+    "profile-report": profile_report,
+}
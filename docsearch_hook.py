@@ -0,0 +1,2679 @@
+"""
+DocSearch Hook - PreToolUse hook that redirects documentation queries to RAG databases.
+
+This hook intercepts WebSearch tool calls and checks if the query matches configured
+documentation keywords. If matched, it denies the search and guides Claude to use
+LEANN MCP tools instead. WebFetch calls to configured documentation domains are
+redirected the same way. Includes an escape hatch for retrying web search if RAG fails.
+
+docsearch.py runs this module; keeping the code here lets Python reuse its
+cached bytecode instead of compiling it on every call. Commands run by hand
+are in docsearch_cli, Prometheus rendering in docsearch_metrics and the Redis
+state backend in docsearch_redis, each imported only when needed.
+"""
+import difflib
+import hashlib
+import json
+import mmap
+import os
+import re
+import signal
+import struct
+import sys
+import time
+import unicodedata
+import zlib
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows - metrics need flock and are disabled
+    fcntl = None
+
+
+def get_config_path() -> Path:
+    """Get the configuration file path."""
+    if env_path := os.environ.get("DOCSEARCH_CONFIG_PATH"):
+        return Path(env_path)
+    return Path.home() / ".claude" / "hooks" / "docsearch-config.json"
+
+
+def get_state_dir() -> Path:
+    """Get the state directory path."""
+    if env_path := os.environ.get("DOCSEARCH_STATE_DIR"):
+        return Path(env_path)
+    return Path.home() / ".claude" / "hooks"
+
+
+def sanitize_session_id(session_id: str) -> str:
+    """Sanitize session ID to prevent path traversal attacks.
+
+    Only allows alphanumeric characters, dashes, and underscores.
+    Any other characters are removed.
+    """
+    # Remove any character that isn't alphanumeric, dash, or underscore
+    sanitized = re.sub(r"[^a-zA-Z0-9\-_]", "", session_id)
+    # Ensure we have at least some content
+    return sanitized if sanitized else "default"
+
+
+def get_state_file(session_id: str) -> Path:
+    """Get the state file path for a session."""
+    safe_id = sanitize_session_id(session_id)
+    return get_state_dir() / f"docsearch-state-{safe_id}.json"
+
+
+def read_json_index(path: Path) -> dict:
+    """Read a JSON cache or index file; a missing, unreadable or malformed one reads as {}."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, OSError, UnicodeDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_file_atomic(path: Path, data: bytes) -> bool:
+    """Replace a file's contents atomically: write a temp file next to it, then rename.
+
+    Creates the directory if needed. Returns False rather than raising if
+    the file can't be written, since the callers' files are optional caches.
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+    except OSError:
+        return False
+    return True
+
+
+def write_json_atomic(path: Path, data) -> bool:
+    """Atomically replace a file with data as JSON (see write_file_atomic)."""
+    return write_file_atomic(path, json.dumps(data).encode())
+
+
+# Project-local config, looked up in cwd and its ancestors
+PROJECT_CONFIG_NAME = Path(".claude") / "docsearch-config.json"
+
+
+# Project-scoped MCP servers, looked up the same way
+PROJECT_MCP_CONFIG_NAME = ".mcp.json"
+
+# Resolved project files are re-resolved after this long, picking up new ones
+PROJECT_FILES_TTL_SECONDS = 60
+
+# Project files resolved by this process, by cwd
+PROJECT_FILES: dict[str, dict[str, Path | None]] = {}
+
+
+def get_project_index_file() -> Path:
+    """Get the path of the cached project file index."""
+    return get_state_dir() / "docsearch-projects.json"
+
+
+def walk_project_files(cwd: str) -> dict[str, str | None]:
+    """Find the nearest project config and .mcp.json at or above cwd, in one walk up."""
+    found = {"config": None, "mcp": None}
+    directory = Path(cwd)
+    for candidate_dir in (directory, *directory.parents):
+        if found["config"] is None and (candidate := candidate_dir / PROJECT_CONFIG_NAME).is_file():
+            found["config"] = str(candidate)
+        if found["mcp"] is None and (candidate := candidate_dir / PROJECT_MCP_CONFIG_NAME).is_file():
+            found["mcp"] = str(candidate)
+        if found["config"] and found["mcp"]:
+            break
+    return found
+
+
+def find_project_files(cwd: str, refresh: bool = False) -> dict[str, Path | None]:
+    """Return the nearest project config ("config") and .mcp.json ("mcp") for cwd.
+
+    Each cwd is resolved once: the result is kept in an index in the state
+    directory for PROJECT_FILES_TTL_SECONDS, and in memory for the rest of
+    the process. A cached file that has since been removed is re-resolved at
+    once; a newly created one is picked up when the entry expires, or
+    straight away with refresh (session-start and doctor).
+    """
+    if not refresh and cwd in PROJECT_FILES:
+        return PROJECT_FILES[cwd]
+    index_file = get_project_index_file()
+    index = read_json_index(index_file)
+    now = time.time()
+
+    def current(entry) -> bool:
+        checked = entry.get("checked") if isinstance(entry, dict) else None
+        return isinstance(checked, (int, float)) and 0 <= now - checked <= PROJECT_FILES_TTL_SECONDS
+
+    entry = index.get(cwd)
+    if refresh or not current(entry) or not all(
+        path is None or os.path.isfile(path) for path in (entry.get("config"), entry.get("mcp"))
+    ):
+        entry = {**walk_project_files(cwd), "checked": now}
+        index = {key: value for key, value in index.items() if current(value)}
+        index[cwd] = entry
+        write_json_atomic(index_file, index)
+    files = {name: Path(entry[name]) if isinstance(entry.get(name), str) else None for name in ("config", "mcp")}
+    PROJECT_FILES[cwd] = files
+    return files
+
+
+def get_config_fragment_dir() -> Path:
+    """Get the directory of config fragments next to the global config (docsearch-config.d)."""
+    return get_config_path().with_suffix(".d")
+
+
+def get_config_sources(cwd: str | None = None) -> list[Path]:
+    """Get the existing config files that apply in cwd, lowest precedence first.
+
+    That is the global config, the config fragments in name order, then the
+    nearest project config.
+    """
+    sources = []
+    global_path = get_config_path()
+    if global_path.exists():
+        sources.append(global_path)
+    try:
+        sources += sorted(get_config_fragment_dir().glob("*.json"))
+    except OSError:
+        pass
+    if cwd:
+        project_path = find_project_files(cwd)["config"]
+        if project_path is not None and project_path != global_path:
+            sources.append(project_path)
+    return sources
+
+
+def merge_configs(base: dict, override: dict) -> dict:
+    """Layer one config over another.
+
+    Databases of the overriding config come first. One with the same 'name'
+    as a base database replaces it, with unset fields taken from the base
+    entry. Top-level options of the overriding config win.
+    """
+    base_databases = base.get("databases", [])
+    by_name = {db.get("name"): db for db in base_databases if isinstance(db, dict) and db.get("name")}
+    databases = []
+    overridden = set()
+    for db in override.get("databases", []):
+        name = db.get("name") if isinstance(db, dict) else None
+        if name in by_name:
+            databases.append({**by_name[name], **db})
+            overridden.add(name)
+        else:
+            databases.append(db)
+    databases += [
+        db for db in base_databases
+        if not (isinstance(db, dict) and db.get("name") in overridden)
+    ]
+    return {**base, **override, "databases": databases}
+
+
+def load_config_sources(sources: list[Path]) -> tuple[dict | None, dict[int, list]]:
+    """Load and merge config files in precedence order.
+
+    Fragments add their databases after the global config's; the project
+    config is then layered over both with merge_configs. A file that fails
+    to load is skipped (its error is logged).
+
+    Returns the merged config (None if nothing loaded) and the precompiled
+    routes of fragment databases, keyed by id() of the database dict, so
+    unchanged fragments are not revalidated or recompiled.
+    """
+    fragment_dir = get_config_fragment_dir()
+    fragments = [path for path in sources if path.parent == fragment_dir]
+    layers = [path for path in sources if path.parent != fragment_dir]
+
+    merged = None
+    precompiled: dict[int, list] = {}
+    if fragments:
+        merged = {"databases": []}
+        for path in fragments:
+            fragment = load_config_fragment(path)
+            for db, raw_route in zip(fragment["databases"], fragment["routes"]):
+                merged["databases"].append(db)
+                precompiled[id(db)] = raw_route
+
+    global_path = get_config_path()
+    for path in layers:
+        config = load_config(path)
+        if config is None:
+            continue
+        if merged is None:
+            merged = config
+        elif path == global_path:
+            merged = {**config, "databases": config.get("databases", []) + merged["databases"]}
+        else:
+            merged = merge_configs(merged, config)
+    return merged, precompiled
+
+
+def get_fragment_cache_file(path: Path) -> Path:
+    """Get the path of a config fragment's compiled file."""
+    return get_state_dir() / f"docsearch-fragment-{hashlib.sha256(str(path).encode()).hexdigest()[:16]}.json"
+
+
+def compile_config_fragment(path: Path) -> dict:
+    """Load, validate and compile the databases of one config fragment."""
+    config = load_config(path) or {}
+    databases = []
+    routes = []
+    for i, db in enumerate(config.get("databases", [])):
+        if validate_database_entry(db, f"{i} in {path.name}"):
+            databases.append(db)
+            routes.append(compile_routes(db))
+    return {"databases": databases, "routes": routes}
+
+
+def load_config_fragment(path: Path) -> dict:
+    """Return the compiled databases of one config fragment.
+
+    Each fragment has its own compiled file and keyword index, used while
+    the fragment's signature is unchanged. Otherwise the fragment alone is
+    validated and compiled again, and its keyword routes are pointed at its
+    new index as [index path, index key, slot], so the merged matcher reuses
+    them as they are.
+    """
+    cache_file = get_fragment_cache_file(path)
+    index_file = get_keyword_index_file(cache_file)
+    signature = get_file_signature(path)
+    payload = read_json_index(cache_file)
+    if signature is not None and payload.get("version") == COMPILED_CACHE_VERSION and payload.get("signature") == signature:
+        try:
+            KeywordIndex(index_file, payload["index_key"])
+            return payload
+        except (OSError, KeyError, TypeError, ValueError):
+            pass
+
+    fragment = compile_config_fragment(path)
+    index_data = build_keyword_index(fragment["databases"], fragment["routes"])
+    if signature is None or not write_file_atomic(index_file, index_data):
+        return fragment
+    index_key = get_keyword_index_key(index_data)
+    routes = [
+        [[name, [str(index_file), index_key, i] if name == "keyword" else state] for name, state in db_routes]
+        for i, db_routes in enumerate(fragment["routes"])
+    ]
+    payload = {
+        "version": COMPILED_CACHE_VERSION,
+        "signature": signature,
+        "index_key": index_key,
+        "databases": fragment["databases"],
+        "routes": routes,
+    }
+    write_json_atomic(cache_file, payload)
+    return payload
+
+
+def load_config(config_path: Path | None = None) -> dict | None:
+    """Load and parse the configuration file. Returns None on any error."""
+    config_path = config_path or get_config_path()
+    try:
+        with open(config_path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return None  # Silent - expected during first-time setup
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON in config file {config_path}: {e}", file=sys.stderr)
+        return None
+    except OSError as e:
+        print(f"Error: Could not read config file {config_path}: {e}", file=sys.stderr)
+        return None
+    if not isinstance(config, dict):
+        print(f"Error: Config file {config_path} must contain a JSON object", file=sys.stderr)
+        return None
+    return config
+
+
+def load_state(session_id: str, deadline: float | None = None) -> dict:
+    """Load session state. Returns empty dict on any error."""
+    check_deadline(deadline, "load_state")
+    return get_state_backend().load(session_id)
+
+
+def save_state(session_id: str, state: dict) -> None:
+    """Save session state."""
+    get_state_backend().save(session_id, state)
+
+
+def state_backend_down() -> bool:
+    """Check if the state backend is unreachable, so saved state is being dropped."""
+    return get_state_backend().is_down()
+
+
+def state_slot_exists(session_id: str) -> bool:
+    """Check if a session already has state (or a slot pre-created by session-start)."""
+    return get_state_backend().exists(session_id)
+
+
+# State expiry timeout in seconds (5 minutes)
+STATE_EXPIRY_SECONDS = 300
+
+# Empty session slots (pre-created by session-start) are kept for a day
+SESSION_SLOT_EXPIRY_SECONDS = 86400
+
+
+def is_state_expired(last_denied: dict) -> bool:
+    """Check if the state entry has expired (older than 5 minutes)."""
+    timestamp = last_denied.get("timestamp", 0)
+    return (int(time.time()) - timestamp) > STATE_EXPIRY_SECONDS
+
+
+class BudgetExceeded(Exception):
+    """Raised when the hook runs past its latency budget."""
+
+
+def check_deadline(deadline: float | None, phase: str) -> None:
+    """Raise BudgetExceeded if the monotonic deadline has passed."""
+    if deadline is not None and time.monotonic() > deadline:
+        raise BudgetExceeded(phase)
+
+
+def arm_budget_timer(deadline: float | None) -> None:
+    """Arm a SIGALRM backstop that raises BudgetExceeded at the deadline.
+
+    Phase checks can't interrupt a single slow step (a hung read, a runaway
+    regex); the timer can. No-op where setitimer is unavailable.
+    """
+    if deadline is None or not hasattr(signal, "setitimer"):
+        return
+
+    def on_alarm(signum, frame):
+        raise BudgetExceeded("timer")
+
+    signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, max(deadline - time.monotonic(), 0.001))
+
+
+def disarm_budget_timer() -> None:
+    """Cancel the budget timer armed by arm_budget_timer."""
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def get_budget_ms(options: dict | None = None) -> float | None:
+    """Get the hook's latency budget in milliseconds, or None if unbounded.
+
+    DOCSEARCH_BUDGET_MS takes precedence over the config's budget_ms.
+    """
+    if env_budget := os.environ.get("DOCSEARCH_BUDGET_MS"):
+        try:
+            budget = float(env_budget)
+        except ValueError:
+            return None
+        return budget if budget > 0 else None
+    return (options or {}).get("budget_ms")
+
+
+def cleanup_stale_state_files(deadline: float | None = None) -> None:
+    """Clean up stale state from other sessions (see the state backend's cleanup)."""
+    get_state_backend().cleanup(deadline)
+
+
+class FileStateBackend:
+    """Session state as one JSON file per session in the state directory."""
+
+    def load(self, session_id: str) -> dict:
+        try:
+            with open(get_state_file(session_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return {}
+
+    def save(self, session_id: str, state: dict) -> None:
+        state_file = get_state_file(session_id)
+        try:
+            state_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(state_file, "w") as f:
+                json.dump(state, f)
+        except OSError:
+            pass  # Fail silently - state is optional
+
+    def exists(self, session_id: str) -> bool:
+        return get_state_file(session_id).exists()
+
+    def is_down(self) -> bool:
+        # A state file that can't be written is skipped; the directory is never "down"
+        return False
+
+    def cleanup(self, deadline: float | None = None) -> None:
+        """Remove expired state files and stale empty session slots.
+
+        Removes state files with expired timestamps (older than STATE_EXPIRY_SECONDS),
+        and empty session slots untouched for SESSION_SLOT_EXPIRY_SECONDS.
+        This is a complementary mechanism to timestamp-based expiry.
+        """
+        state_dir = get_state_dir()
+        now = time.time()
+        try:
+            for state_file in state_dir.glob("docsearch-state-*.json"):
+                check_deadline(deadline, "cleanup")
+                try:
+                    with open(state_file) as f:
+                        state = json.load(f)
+                    last_denied = state.get("last_denied")
+                    if last_denied and is_state_expired(last_denied):
+                        state_file.unlink()
+                    elif not last_denied and now - state_file.stat().st_mtime > SESSION_SLOT_EXPIRY_SECONDS:
+                        state_file.unlink()
+                except (json.JSONDecodeError, OSError, KeyError):
+                    # If we can't read or parse the file, leave it alone
+                    pass
+        except OSError:
+            pass  # State directory doesn't exist or isn't accessible
+
+
+# Backends by DOCSEARCH_STATE_BACKEND value, so connections are reused within a process
+STATE_BACKENDS: dict[str, object] = {}
+
+
+def get_state_backend():
+    """Get the session state backend named by DOCSEARCH_STATE_BACKEND.
+
+    "file" (the default) keeps state in the state directory; a
+    redis://[:password@]host[:port][/db] URL keeps it in Redis.
+    """
+    name = os.environ.get("DOCSEARCH_STATE_BACKEND") or "file"
+    if name == "file":
+        return FileStateBackend()
+    if (backend := STATE_BACKENDS.get(name)) is not None:
+        return backend
+    if urlsplit(name).scheme == "redis":
+        # Imported here so the default file backend doesn't pay for it
+        from docsearch_redis import DEFAULT_REDIS_TIMEOUT_MS, RedisStateBackend
+
+        try:
+            timeout_ms = float(os.environ.get("DOCSEARCH_REDIS_TIMEOUT_MS", DEFAULT_REDIS_TIMEOUT_MS))
+        except ValueError:
+            timeout_ms = DEFAULT_REDIS_TIMEOUT_MS
+        backend = RedisStateBackend(name, timeout_ms / 1000)
+    else:
+        print(f"Warning: Unknown state backend {name!r}; using files", file=sys.stderr)
+        backend = FileStateBackend()
+    STATE_BACKENDS[name] = backend
+    return backend
+
+
+# Bump when the persisted compiled matcher layout changes
+COMPILED_CACHE_VERSION = 10
+
+
+def get_compiled_cache_file(signatures: list[list], strategies: list[str] | None = None) -> Path:
+    """Get the path of the compiled matcher for a set of config files.
+
+    A matcher compiled with the strategies of an experiment arm gets its own file.
+    """
+    key = "\0".join(path for path, signature in signatures)
+    if strategies:
+        key += "\0strategies=" + ",".join(strategies)
+    return get_state_dir() / f"docsearch-compiled-{hashlib.sha256(key.encode()).hexdigest()[:16]}.json"
+
+
+def get_keyword_index_file(cache_file: Path) -> Path:
+    """Get the path of the binary keyword index stored next to a compiled matcher."""
+    return cache_file.with_suffix(".idx")
+
+
+def get_file_signature(path: Path) -> list[int] | None:
+    """Return [mtime_ns, size] for a file, or None if it cannot be stat'ed."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def get_source_signatures(sources: list[Path]) -> list[list]:
+    """Return [path, signature] for each config file."""
+    return [[str(path), get_file_signature(path)] for path in sources]
+
+
+def save_compiled_config(compiled: dict, signatures: list[list], strategies: list[str] | None = None) -> None:
+    """Persist a compiled matcher, keyed by the signatures of its config files.
+
+    Keywords go into a binary keyword index next to the JSON cache, and are
+    left out of the JSON, so loading the cache costs the same however many
+    keywords the config has. The signatures must be taken before the files
+    are read, so a file edited while compiling leaves a cache that is
+    already out of date.
+    """
+    if not signatures or any(signature is None for path, signature in signatures):
+        return
+    cache_file = get_compiled_cache_file(signatures, strategies)
+    index_data = build_keyword_index(compiled["databases"], compiled["raw_routes"])
+    routes = [
+        [[name, i if name == "keyword" and isinstance(state, str) else state] for name, state in db_routes]
+        for i, db_routes in enumerate(compiled["raw_routes"])
+    ]
+    payload = {
+        "version": COMPILED_CACHE_VERSION,
+        "sources": signatures,
+        "index_key": get_keyword_index_key(index_data),
+        "databases": [{key: value for key, value in db.items() if key != "keywords"} for db in compiled["databases"]],
+        "routes": routes,
+        "domain_index": compiled["domain_index"],
+        "stem_index": compiled["stem_index"],
+        "options": compiled["options"],
+    }
+    # The index goes first: a JSON cache is only written once its index exists
+    if write_file_atomic(get_keyword_index_file(cache_file), index_data):
+        write_json_atomic(cache_file, payload)
+
+
+def load_compiled_config(signatures: list[list], strategies: list[str] | None = None) -> dict | None:
+    """Load the persisted compiled matcher if it is still current.
+
+    Returns None if there is no cache, or if any config file it was built
+    from has changed since. The keyword index is mapped, not read.
+    """
+    if not signatures:
+        return None
+    try:
+        cache_file = get_compiled_cache_file(signatures, strategies)
+        payload = read_json_index(cache_file)
+        if payload.get("version") != COMPILED_CACHE_VERSION or payload.get("sources") != signatures:
+            return None
+        keyword_index = KeywordIndex(get_keyword_index_file(cache_file), payload["index_key"])
+        keyword_indexes = {None: keyword_index, **open_keyword_indexes(payload["routes"])}
+        return {
+            "databases": payload["databases"],
+            "raw_routes": payload["routes"],
+            "routes": load_routes(payload["routes"]),
+            "domain_index": payload["domain_index"],
+            "stem_index": payload["stem_index"],
+            "options": payload["options"],
+            "keyword_indexes": keyword_indexes,
+        }
+    except (FileNotFoundError, json.JSONDecodeError, OSError, KeyError, TypeError, ValueError, re.error):
+        return None
+
+
+REQUIRED_DATABASE_FIELDS = ["keywords", "path", "mcp_tool_name", "description"]
+
+
+def validate_database_entry(db: dict, index: int | str) -> bool:
+    """Validate a database entry has all required fields and correct types.
+
+    Logs warnings to stderr for invalid entries. Returns True if valid.
+    """
+    # Check required fields
+    for field in REQUIRED_DATABASE_FIELDS:
+        if field not in db:
+            print(f"Warning: Database entry {index} missing required field '{field}'", file=sys.stderr)
+            return False
+
+    # Validate keywords is a list
+    keywords = db.get("keywords")
+    if not isinstance(keywords, list):
+        print(f"Warning: Database entry {index} 'keywords' must be a list, got {type(keywords).__name__}", file=sys.stderr)
+        return False
+
+    # Validate keywords is not empty
+    if len(keywords) == 0:
+        print(f"Warning: Database entry {index} 'keywords' is empty", file=sys.stderr)
+        return False
+
+    # Validate all keywords are strings
+    for i, keyword in enumerate(keywords):
+        if not isinstance(keyword, str):
+            print(f"Warning: Database entry {index} keyword {i} must be a string, got {type(keyword).__name__}", file=sys.stderr)
+            return False
+
+    # Validate optional name and sources directory are strings
+    for field in ("name", "sources"):
+        if field in db and not isinstance(db[field], str):
+            print(f"Warning: Database entry {index} '{field}' must be a string, got {type(db[field]).__name__}", file=sys.stderr)
+            return False
+
+    # Validate optional domains is a list of strings
+    domains = db.get("domains", [])
+    if not isinstance(domains, list) or not all(isinstance(domain, str) for domain in domains):
+        print(f"Warning: Database entry {index} 'domains' must be a list of strings", file=sys.stderr)
+        return False
+
+    # Validate optional routing strategies are known names
+    strategies = db.get("strategies", [])
+    if not isinstance(strategies, list) or not all(name in ROUTING_STRATEGIES for name in strategies):
+        known = ", ".join(ROUTING_STRATEGIES)
+        print(f"Warning: Database entry {index} 'strategies' must be a list of: {known}", file=sys.stderr)
+        return False
+
+    # Validate optional regex patterns compile
+    patterns = db.get("patterns", [])
+    if not isinstance(patterns, list) or not all(isinstance(pattern, str) for pattern in patterns):
+        print(f"Warning: Database entry {index} 'patterns' must be a list of strings", file=sys.stderr)
+        return False
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            print(f"Warning: Database entry {index} pattern '{pattern}' is invalid: {e}", file=sys.stderr)
+            return False
+
+    # Validate optional fuzzy threshold is a ratio
+    threshold = db.get("fuzzy_threshold", DEFAULT_FUZZY_THRESHOLD)
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 < threshold <= 1:
+        print(f"Warning: Database entry {index} 'fuzzy_threshold' must be a number in (0, 1]", file=sys.stderr)
+        return False
+
+    # Validate optional RAG call hints
+    top_k = db.get("top_k", 1)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+        print(f"Warning: Database entry {index} 'top_k' must be a positive integer", file=sys.stderr)
+        return False
+    if not isinstance(db.get("filters", {}), dict):
+        print(f"Warning: Database entry {index} 'filters' must be an object", file=sys.stderr)
+        return False
+
+    # Validate optional RAG load limits
+    for field in ("max_per_minute", "max_concurrent"):
+        limit = db.get(field, 1)
+        if isinstance(limit, bool) or not isinstance(limit, (int, float)) or limit < 1:
+            print(f"Warning: Database entry {index} '{field}' must be a number of at least 1", file=sys.stderr)
+            return False
+
+    # Validate optional freshness settings
+    max_age = db.get("max_age", 1)
+    if isinstance(max_age, bool) or not isinstance(max_age, (int, float)) or max_age <= 0:
+        print(f"Warning: Database entry {index} 'max_age' must be a positive number of days", file=sys.stderr)
+        return False
+    if "version" in db and (not isinstance(db["version"], str) or parse_version(db["version"]) is None):
+        print(f"Warning: Database entry {index} 'version' must be a dotted version string like \"17.5\"", file=sys.stderr)
+        return False
+
+    # Warn about relative paths (but still valid)
+    path = db.get("path", "")
+    if path and not path.startswith("/"):
+        print(f"Warning: Database entry {index} 'path' should be absolute, got relative path '{path}'", file=sys.stderr)
+        # Don't return False - relative path is a warning, not an error
+
+    return True
+
+
+# Hook modes: "enforce" denies matching calls, "shadow" only records what it would do
+MODES = ["enforce", "shadow"]
+
+# Experiment arms may also turn the hook "off": every call goes through untouched
+ARM_MODES = ["off", *MODES]
+
+ARM_NAME_RE = re.compile(r"[\w.-]+")
+
+
+def validate_experiment(experiment) -> dict | None:
+    """Validate an 'experiment' option and return it with defaults filled in.
+
+    Returns None, with a warning, if any part of it is invalid: running a
+    subset of the arms would skew the comparison.
+    """
+    def invalid(message: str) -> None:
+        print(f"Warning: 'experiment' {message}; running without the experiment", file=sys.stderr)
+
+    if not isinstance(experiment, dict):
+        return invalid("must be an object")
+    name = experiment.get("name", "experiment")
+    if not isinstance(name, str) or not name:
+        return invalid("'name' must be a non-empty string")
+    arms = experiment.get("arms")
+    if not isinstance(arms, list) or not arms:
+        return invalid("'arms' must be a non-empty list")
+    valid_arms = []
+    for i, arm in enumerate(arms):
+        if not isinstance(arm, dict):
+            return invalid(f"arm {i} must be an object")
+        arm_name = arm.get("name")
+        if not isinstance(arm_name, str) or not ARM_NAME_RE.fullmatch(arm_name):
+            return invalid(f"arm {i} 'name' must be letters, digits, '_', '.' or '-'")
+        if any(arm_name == other["name"] for other in valid_arms):
+            return invalid(f"arm name {arm_name!r} is used twice")
+        weight = arm.get("weight", 1)
+        if not isinstance(weight, int) or isinstance(weight, bool) or weight <= 0:
+            return invalid(f"arm {arm_name!r} 'weight' must be a positive integer")
+        valid_arm = {"name": arm_name, "weight": weight}
+        if "mode" in arm:
+            if arm["mode"] not in ARM_MODES:
+                return invalid(f"arm {arm_name!r} 'mode' must be one of {', '.join(ARM_MODES)}")
+            valid_arm["mode"] = arm["mode"]
+        if "strategies" in arm:
+            strategies = arm["strategies"]
+            if not isinstance(strategies, list) or not strategies or not all(s in ROUTING_STRATEGIES for s in strategies):
+                return invalid(f"arm {arm_name!r} 'strategies' must be a non-empty list of: {', '.join(ROUTING_STRATEGIES)}")
+            valid_arm["strategies"] = list(dict.fromkeys(strategies))
+        valid_arms.append(valid_arm)
+    return {"name": name, "arms": valid_arms}
+
+
+def assign_arm(experiment: dict, session_id: str) -> dict:
+    """Pick a session's experiment arm, in proportion to the arm weights.
+
+    The choice is a hash of the session ID salted with the experiment name,
+    so a session stays in one arm for its lifetime and a renamed experiment
+    reshuffles sessions.
+    """
+    digest = hashlib.sha256(f"{experiment['name']}\0{session_id}".encode()).digest()
+    point = int.from_bytes(digest[:8], "big") % sum(arm["weight"] for arm in experiment["arms"])
+    for arm in experiment["arms"]:
+        point -= arm["weight"]
+        if point < 0:
+            return arm
+    return experiment["arms"][-1]
+
+
+def validate_options(config: dict) -> dict:
+    """Validate top-level config options and return the valid ones.
+
+    Invalid options are dropped and warnings logged to stderr.
+    """
+    options = {}
+    budget_ms = config.get("budget_ms")
+    if budget_ms is not None:
+        if isinstance(budget_ms, (int, float)) and not isinstance(budget_ms, bool) and budget_ms > 0:
+            options["budget_ms"] = budget_ms
+        else:
+            print(f"Warning: 'budget_ms' must be a positive number, got {budget_ms!r}", file=sys.stderr)
+    scan_bytes = config.get("transcript_scan_bytes")
+    if scan_bytes is not None:
+        if isinstance(scan_bytes, int) and not isinstance(scan_bytes, bool) and scan_bytes >= 0:
+            options["transcript_scan_bytes"] = scan_bytes
+        else:
+            print(f"Warning: 'transcript_scan_bytes' must be a non-negative integer, got {scan_bytes!r}", file=sys.stderr)
+    verify_mcp_tools = config.get("verify_mcp_tools")
+    if verify_mcp_tools is not None:
+        if isinstance(verify_mcp_tools, bool):
+            options["verify_mcp_tools"] = verify_mcp_tools
+        else:
+            print(f"Warning: 'verify_mcp_tools' must be true or false, got {verify_mcp_tools!r}", file=sys.stderr)
+    mode = config.get("mode")
+    if mode is not None:
+        if mode in MODES:
+            options["mode"] = mode
+        else:
+            print(f"Warning: 'mode' must be one of {', '.join(MODES)}, got {mode!r}", file=sys.stderr)
+    similarity = config.get("retry_similarity")
+    if similarity is not None:
+        if isinstance(similarity, (int, float)) and not isinstance(similarity, bool) and 0 < similarity <= 1:
+            options["retry_similarity"] = similarity
+        else:
+            print(f"Warning: 'retry_similarity' must be a number in (0, 1], got {similarity!r}", file=sys.stderr)
+    if "experiment" in config and (experiment := validate_experiment(config["experiment"])):
+        options["experiment"] = experiment
+    return options
+
+
+def validate_config(config: dict) -> list[dict]:
+    """Validate config and return list of valid database entries.
+
+    Invalid entries are filtered out and warnings logged to stderr.
+    """
+    valid_databases = []
+    for i, db in enumerate(config.get("databases", [])):
+        if validate_database_entry(db, i):
+            valid_databases.append(db)
+    return valid_databases
+
+
+def params_match(current: dict, previous: dict) -> bool:
+    """Check if current tool_input matches previous denied params.
+
+    Compares query exactly and domains as sets (order-independent).
+    """
+    if current.get("query") != previous.get("query"):
+        return False
+
+    # Compare domains as sets (order-independent)
+    current_allowed = set(current.get("allowed_domains", []) or [])
+    previous_allowed = set(previous.get("allowed_domains", []) or [])
+    if current_allowed != previous_allowed:
+        return False
+
+    current_blocked = set(current.get("blocked_domains", []) or [])
+    previous_blocked = set(previous.get("blocked_domains", []) or [])
+    if current_blocked != previous_blocked:
+        return False
+
+    return True
+
+
+def fetch_params_match(current: dict, previous: dict) -> bool:
+    """Check if a WebFetch tool_input matches previous denied params.
+
+    Only the URL is compared; Claude usually rewords the prompt on retry.
+    """
+    if previous.get("tool_name") != "WebFetch":
+        return False
+    return current.get("url") == previous.get("url")
+
+
+def denied_params_match(tool_name: str, current: dict, previous: dict) -> bool:
+    """Check if a tool call is a retry of the previously denied one.
+
+    Denied WebSearch params carry no tool_name (the original state format).
+    """
+    if tool_name == "WebFetch":
+        return fetch_params_match(current, previous)
+    if previous.get("tool_name", "WebSearch") != "WebSearch":
+        return False
+    return params_match(current, previous)
+
+
+def build_denied_params(tool_name: str, tool_input: dict) -> dict:
+    """Build the last_denied state entry used by the escape hatch."""
+    if tool_name == "WebFetch":
+        return {
+            "tool_name": "WebFetch",
+            "url": tool_input.get("url", ""),
+            "timestamp": int(time.time()),
+        }
+    return {
+        "query": tool_input.get("query", ""),
+        "allowed_domains": tool_input.get("allowed_domains", []),
+        "blocked_domains": tool_input.get("blocked_domains", []),
+        "timestamp": int(time.time()),
+    }
+
+# Common English words that never make useful keywords
+STOPWORDS = frozenset("""
+a about above after again all also an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he
+her here hers how i if in into is it its itself just more most my no nor not now of off on once only
+or other our out over own same see she should so some such than that the their them then there these
+they this those through to too under until up use used using very via was we were what when where
+which while who whom why will with would you your yours example examples following new may must one
+two need set get make like e.g i.e etc
+""".split())
+
+
+# Words that rewordings of a search add or drop without changing what it is about
+RETRY_FILLER_WORDS = frozenset(["doc", "docs", "documentation", "guide", "manual", "reference", "tutorial", "official"])
+
+
+def query_fingerprint(query: str) -> list[int]:
+    """Fingerprint a query as the sorted hashes of its normalized content stems.
+
+    Stopwords and filler words are dropped before stemming, so "gitlab ci
+    cache docs" and "GitLab CI caching documentation" share a fingerprint.
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    return sorted({
+        zlib.crc32(stem_token(token).encode())
+        for token in NORMALIZED_TOKEN_RE.findall(text)
+        if token not in STOPWORDS and token not in RETRY_FILLER_WORDS
+    })
+
+
+def fingerprint_similarity(first: list[int], second: list[int]) -> float:
+    """Jaccard similarity of two query fingerprints."""
+    first_set, second_set = set(first), set(second)
+    union = len(first_set | second_set)
+    return len(first_set & second_set) / union if union else 0.0
+
+
+def near_duplicate_retry(current: dict, previous: dict, threshold: float) -> bool:
+    """Check if a WebSearch is a reworded retry of the previously denied one.
+
+    Domains must match as in params_match; the query only needs a
+    fingerprint similarity of at least threshold to the one saved on deny.
+    """
+    if previous.get("tool_name", "WebSearch") != "WebSearch" or "fingerprint" not in previous:
+        return False
+    if not params_match({**current, "query": previous.get("query")}, previous):
+        return False
+    return fingerprint_similarity(query_fingerprint(current.get("query", "")), previous["fingerprint"]) >= threshold
+
+
+def build_keyword_pattern(keyword: str) -> str:
+    """Build a regex pattern for keyword matching.
+
+    Uses word boundaries when possible, but handles keywords that start/end
+    with non-word characters (like c++, .net, c#) by using lookahead/lookbehind
+    for whitespace or string boundaries instead.
+    """
+    escaped = re.escape(keyword.lower())
+
+    # Check if keyword starts with a word character
+    if re.match(r"^\w", keyword):
+        prefix = r"\b"
+    else:
+        # Use lookbehind for start of string or whitespace
+        prefix = r"(?:^|(?<=\s))"
+
+    # Check if keyword ends with a word character
+    if re.match(r".*\w$", keyword):
+        suffix = r"\b"
+    else:
+        # Use lookahead for end of string or whitespace
+        suffix = r"(?=\s|$)"
+
+    return prefix + escaped + suffix
+
+
+def normalize_domain(domain: str) -> str:
+    """Normalize a configured domain or URL to a bare lowercase host name.
+
+    Accepts "docs.gitlab.com", ".gitlab.com", "*.gitlab.com" or a full URL.
+    """
+    domain = domain.strip().lower()
+    if "://" in domain:
+        domain = urlsplit(domain).hostname or ""
+    if domain.startswith("*."):
+        domain = domain[2:]
+    return domain.strip(".")
+
+
+# Trie key holding the databases whose domain ends at a node. Labels are
+# split on ".", so no label can collide with it.
+DOMAIN_TERMINAL = "."
+
+
+def domain_labels(domain: str) -> list[str] | None:
+    """Split a host name into labels, rightmost first; None if a label is empty."""
+    labels = domain.lower().strip(".").split(".")
+    if not all(labels):
+        return None
+    return labels[::-1]
+
+
+def build_domain_index(databases: list[dict]) -> dict:
+    """Build a reversed-label suffix trie of database domains.
+
+    "docs.gitlab.com" is stored under com -> gitlab -> docs, and the
+    DOMAIN_TERMINAL key of a node holds the indices of the databases whose
+    domain ends there. Lookups walk one node per host label, so they are
+    independent of the number of configured domains. Domains with an empty
+    label ("docs..gitlab.com") are skipped.
+    """
+    root: dict = {}
+    for index, db in enumerate(databases):
+        for domain in db.get("domains", []):
+            labels = domain_labels(normalize_domain(domain))
+            if labels is None:
+                continue
+            node = root
+            for label in labels:
+                node = node.setdefault(label, {})
+            terminals = node.setdefault(DOMAIN_TERMINAL, [])
+            if index not in terminals:
+                terminals.append(index)
+    return root
+
+
+def lookup_domain_index(host: str, domain_index: dict) -> list[int]:
+    """Return the indices of databases whose domain is a suffix of host."""
+    labels = domain_labels(host)
+    if labels is None:
+        return []
+    found: set[int] = set()
+    node = domain_index
+    for label in labels:
+        node = node.get(label)
+        if node is None:
+            break
+        found.update(node.get(DOMAIN_TERMINAL, ()))
+    return sorted(found)
+
+
+def lookup_domain_subtree(domain: str, domain_index: dict) -> list[int]:
+    """Return the indices of databases whose domain is domain or one of its subdomains."""
+    labels = domain_labels(domain)
+    if labels is None:
+        return []
+    node = domain_index
+    for label in labels:
+        node = node.get(label)
+        if node is None:
+            return []
+    found: set[int] = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for label, child in node.items():
+            if label == DOMAIN_TERMINAL:
+                found.update(child)
+            else:
+                stack.append(child)
+    return sorted(found)
+
+
+def match_url(url: str, compiled: dict) -> list[dict]:
+    """Find all databases with a domain covering the URL's host."""
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return []
+    if not host:
+        return []
+    databases = compiled["databases"]
+    return [databases[index] for index in lookup_domain_index(host, compiled["domain_index"])]
+
+
+def compile_keyword_strategy(db: dict) -> str:
+    """Fold a database's keywords into one alternation pattern.
+
+    Longer keywords come first, so "gitlab-ci" wins over "gitlab" where both match.
+    """
+    keywords = sorted(db["keywords"], key=len, reverse=True)
+    return "|".join(f"(?:{build_keyword_pattern(keyword)})" for keyword in keywords)
+
+
+# A strategy's match function returns its hits: what fired and where. Each hit
+# names the strategy, the keyword or domain that fired (for stem hits, the
+# query words that normalize to a keyword), the query text it matched and
+# that text's offsets in the lowercased query (None when the match has no
+# position, as for allowed_domains). No hits means no match.
+def make_hit(strategy: str, keyword: str, text: str, start: int | None = None, end: int | None = None) -> dict:
+    """Build a hit record for a strategy match."""
+    return {"strategy": strategy, "keyword": keyword, "text": text, "start": start, "end": end}
+
+
+def match_keyword_strategy(state: re.Pattern | int | tuple[str, int], request: dict) -> list[dict]:
+    """Match the query against the database's keyword pattern.
+
+    A loaded compiled cache has the database's slot in its keyword index
+    instead of a pattern, or (index path, slot) for a config fragment's
+    index; each index is then searched once for all its databases.
+    """
+    if isinstance(state, (int, tuple)):
+        source, slot = (None, state) if isinstance(state, int) else state
+        hits = request.setdefault("keyword_index_hits", {})
+        if source not in hits:
+            hits[source] = request["keyword_indexes"][source].find(request["query"])
+        return hits[source].get(slot, [])
+    return [make_hit("keyword", m.group(), m.group(), m.start(), m.end()) for m in state.finditer(request["query"])]
+
+
+# Binary keyword index layout, all little-endian: a header ending in a key
+# (a hash of the rest of the file, which the JSON it belongs to records), then
+#   hashes:   sorted (token hash u64, first posting u32, posting count u32)
+#   postings: keyword ids (u32), grouped by token hash
+#   always:   ids (u32) of keywords with no word characters, checked on every query
+#   keywords: (database slot u32, string offset u32, string length u32) per keyword id
+#   strings:  the keywords, UTF-8
+# A keyword is filed under its anchor, the first run of word characters of
+# the lowercased keyword. Any match of the keyword covers its anchor as a
+# whole word of the query, so looking up each query word finds every keyword
+# that can match; those few are then confirmed with the keyword's pattern.
+KEYWORD_INDEX_MAGIC = b"DSKX"
+KEYWORD_INDEX_VERSION = 2
+KEYWORD_INDEX_HEADER = struct.Struct("<4s10I16s")
+KEYWORD_INDEX_HASH = struct.Struct("<QII")
+KEYWORD_INDEX_KEYWORD = struct.Struct("<III")
+WORD_RE = re.compile(r"\w+")
+
+
+def token_hash(token: str) -> int:
+    """Hash a query word or keyword anchor to 64 bits, stably across processes."""
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+def build_keyword_index(databases: list[dict], raw_routes: list[list]) -> bytes:
+    """Build the binary keyword index for the databases using the keyword strategy.
+
+    Databases whose keyword routes already point into another index (a
+    config fragment's) are left out.
+    """
+    postings: dict[int, list[int]] = {}
+    always = []
+    entries = []
+    strings = bytearray()
+    for slot, (db, db_routes) in enumerate(zip(databases, raw_routes)):
+        if not any(name == "keyword" and not isinstance(state, list) for name, state in db_routes):
+            continue
+        for keyword in dict.fromkeys(db["keywords"]):
+            keyword_id = len(entries)
+            data = keyword.encode()
+            entries.append((slot, len(strings), len(data)))
+            strings += data
+            if anchor := WORD_RE.search(keyword.lower()):
+                postings.setdefault(token_hash(anchor.group()), []).append(keyword_id)
+            else:
+                always.append(keyword_id)
+
+    hashes = bytearray()
+    posting_data = bytearray()
+    count = 0
+    for value in sorted(postings):
+        ids = postings[value]
+        hashes += KEYWORD_INDEX_HASH.pack(value, count, len(ids))
+        posting_data += struct.pack(f"<{len(ids)}I", *ids)
+        count += len(ids)
+    always_data = struct.pack(f"<{len(always)}I", *always)
+    keyword_data = b"".join(KEYWORD_INDEX_KEYWORD.pack(*entry) for entry in entries)
+    body = b"".join([hashes, posting_data, always_data, keyword_data, strings])
+
+    hashes_offset = KEYWORD_INDEX_HEADER.size
+    postings_offset = hashes_offset + len(hashes)
+    always_offset = postings_offset + len(posting_data)
+    keywords_offset = always_offset + len(always_data)
+    strings_offset = keywords_offset + len(keyword_data)
+    header = KEYWORD_INDEX_HEADER.pack(
+        KEYWORD_INDEX_MAGIC, KEYWORD_INDEX_VERSION, len(databases), len(postings), len(entries), len(always),
+        hashes_offset, postings_offset, always_offset, keywords_offset, strings_offset,
+        hashlib.sha256(body).digest()[:16],
+    )
+    return header + body
+
+
+def get_keyword_index_key(data: bytes) -> str:
+    """Return the key of a built keyword index, as recorded in its JSON."""
+    return KEYWORD_INDEX_HEADER.unpack_from(data)[-1].hex()
+
+
+class KeywordIndex:
+    """A memory-mapped binary keyword index (see build_keyword_index).
+
+    Opening it reads only the header; a query touches only the hash entries
+    it binary-searches and the keywords filed under its words, so the cost
+    doesn't grow with the number of keywords. Raises ValueError if the file
+    isn't a valid index, or if key is given and isn't the index's.
+    """
+
+    def __init__(self, path: Path, key: str | None = None):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < KEYWORD_INDEX_HEADER.size:
+            raise ValueError(f"{path} is not a keyword index")
+        (magic, version, self.database_count, self.hash_count, self.keyword_count, self.always_count,
+         self.hashes_offset, self.postings_offset, self.always_offset, self.keywords_offset,
+         self.strings_offset, index_key) = KEYWORD_INDEX_HEADER.unpack_from(self.data)
+        if magic != KEYWORD_INDEX_MAGIC or version != KEYWORD_INDEX_VERSION or self.strings_offset > len(self.data):
+            raise ValueError(f"{path} is not a keyword index")
+        if key is not None and index_key.hex() != key:
+            raise ValueError(f"{path} belongs to another compiled matcher")
+        # Patterns of the keywords queries have touched
+        self.patterns: dict[str, re.Pattern] = {}
+
+    def postings(self, value: int) -> tuple[int, ...]:
+        """Return the ids of the keywords filed under a token hash."""
+        low, high = 0, self.hash_count
+        while low < high:
+            middle = (low + high) // 2
+            found, start, count = KEYWORD_INDEX_HASH.unpack_from(
+                self.data, self.hashes_offset + middle * KEYWORD_INDEX_HASH.size
+            )
+            if found < value:
+                low = middle + 1
+            elif found > value:
+                high = middle
+            else:
+                return struct.unpack_from(f"<{count}I", self.data, self.postings_offset + start * 4)
+        return ()
+
+    def keyword(self, keyword_id: int) -> tuple[int, str]:
+        """Return a keyword's database slot and text."""
+        slot, offset, length = KEYWORD_INDEX_KEYWORD.unpack_from(
+            self.data, self.keywords_offset + keyword_id * KEYWORD_INDEX_KEYWORD.size
+        )
+        start = self.strings_offset + offset
+        return slot, self.data[start:start + length].decode()
+
+    def find(self, query: str) -> dict[int, list[dict]]:
+        """Return keyword hits for a lowercased query, by database slot.
+
+        Hits are what a database's keyword alternation would find: at each
+        position the longest keyword, then on from its end.
+        """
+        candidates = set(struct.unpack_from(f"<{self.always_count}I", self.data, self.always_offset))
+        for word in set(WORD_RE.findall(query)):
+            candidates.update(self.postings(token_hash(word)))
+
+        # Many databases can share a keyword; each distinct keyword is searched once
+        matches: dict[str, list[re.Match]] = {}
+        spans: dict[int, list[tuple]] = {}
+        for keyword_id in candidates:
+            slot, keyword = self.keyword(keyword_id)
+            if keyword not in matches:
+                if (pattern := self.patterns.get(keyword)) is None:
+                    pattern = self.patterns[keyword] = re.compile(build_keyword_pattern(keyword))
+                matches[keyword] = list(pattern.finditer(query))
+            for m in matches[keyword]:
+                spans.setdefault(slot, []).append((m.start(), -len(keyword), keyword_id, m.end(), m.group()))
+
+        hits = {}
+        for slot, db_spans in spans.items():
+            position = 0
+            for start, _, _, end, text in sorted(db_spans):
+                if start >= position:
+                    hits.setdefault(slot, []).append(make_hit("keyword", text, text, start, end))
+                    position = end
+        return hits
+
+
+def compile_domain_strategy(db: dict) -> list[str]:
+    """Normalize a database's domains."""
+    return [domain for domain in map(normalize_domain, db.get("domains", [])) if domain]
+
+
+def match_domain_strategy(domains: set[str], request: dict) -> list[dict]:
+    """Match allowed_domains that are one of the database's domains or a subdomain of one."""
+    for allowed in request["tool_input"].get("allowed_domains") or []:
+        if not isinstance(allowed, str):
+            continue
+        labels = domain_labels(normalize_domain(allowed))
+        if labels is None:
+            continue
+        for count in range(len(labels), 0, -1):
+            if (domain := ".".join(reversed(labels[:count]))) in domains:
+                return [make_hit("domain", domain, allowed)]
+    return []
+
+
+def compile_regex_strategy(db: dict) -> str:
+    """Fold a database's phrase/regex patterns into one pattern."""
+    return "|".join(f"(?:{pattern})" for pattern in db.get("patterns", []))
+
+
+def match_regex_strategy(pattern: re.Pattern, request: dict) -> list[dict]:
+    """Match the query against the database's phrase/regex patterns."""
+    if (m := pattern.search(request["query"])) is None:
+        return []
+    return [make_hit("regex", m.group(), m.group(), m.start(), m.end())]
+
+
+# Default similarity ratio for fuzzy keyword matching
+DEFAULT_FUZZY_THRESHOLD = 0.85
+
+# Keywords shorter than this are too ambiguous to match fuzzily
+FUZZY_MIN_KEYWORD_LENGTH = 4
+
+
+def compile_fuzzy_strategy(db: dict) -> dict:
+    """Select the keywords long enough for fuzzy matching."""
+    return {
+        "keywords": [kw.lower() for kw in db["keywords"] if len(kw) >= FUZZY_MIN_KEYWORD_LENGTH],
+        "threshold": db.get("fuzzy_threshold", DEFAULT_FUZZY_THRESHOLD),
+    }
+
+
+def match_fuzzy_strategy(state: dict, request: dict) -> list[dict]:
+    """Match query tokens within a similarity ratio of a keyword (catches typos)."""
+    if "tokens" not in request:
+        request["tokens"] = list(re.finditer(r"[\w+#.-]+", request["query"]))
+    threshold = state["threshold"]
+    for keyword in state["keywords"]:
+        for token in request["tokens"]:
+            if abs(len(token.group()) - len(keyword)) > 2:
+                continue
+            matcher = difflib.SequenceMatcher(None, token.group(), keyword)
+            if matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold:
+                return [make_hit("fuzzy", keyword, token.group(), token.start(), token.end())]
+    return []
+
+
+# Tokens for normalized matching: words, keeping inner . - + # (gitlab-ci, c++, node.js)
+NORMALIZED_TOKEN_RE = re.compile(r"[^\W_][\w+#]*(?:[.-][^\W_][\w+#]*)*")
+
+
+def stem_token(token: str) -> str:
+    """Strip inflectional suffixes from a token with a few light rules.
+
+    Plural and verb endings go, then a final silent e, so "pipelines",
+    "pipeline" and "caching", "caches", "cache" each share a stem. Short
+    and non-alphabetic tokens (k8s, c++) are left alone.
+    """
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        token = token[:-3] + "y"
+    elif token.endswith(("sses", "shes", "ches", "xes", "zes")):
+        token = token[:-2]
+    elif token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        token = token[:-1]
+    elif token.endswith("ing") and len(token) > 5:
+        token = token[:-3]
+    elif token.endswith("ed") and len(token) > 4:
+        token = token[:-2]
+    if len(token) > 3 and token[-1] == token[-2] and token[-1] not in "lsz":
+        token = token[:-1]
+    if token.endswith("e") and len(token) > 3:
+        token = token[:-1]
+    return token
+
+
+def normalize_stems(text: str) -> list[str]:
+    """Normalize text to a list of stems: NFKC, casefold, tokenize, stem."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return [stem_token(token) for token in NORMALIZED_TOKEN_RE.findall(text)]
+
+
+def compile_stem_strategy(db: dict) -> list[str]:
+    """Normalize a database's keywords to space-joined stem phrases."""
+    phrases = (" ".join(normalize_stems(keyword)) for keyword in db["keywords"])
+    return sorted({phrase for phrase in phrases if phrase})
+
+
+def build_stem_index(raw_routes: list[list]) -> dict:
+    """Map each stem phrase's first stem to the phrases starting with it."""
+    index: dict[str, list[str]] = {}
+    for db_routes in raw_routes:
+        for name, phrases in db_routes:
+            if name != "stem":
+                continue
+            for phrase in phrases:
+                first = phrase.split(" ", 1)[0]
+                if phrase not in index.setdefault(first, []):
+                    index[first].append(phrase)
+    return index
+
+
+def find_stem_phrases(query: str, stem_index: dict) -> dict[str, tuple[str, int, int]]:
+    """Return the indexed stem phrases that occur in the query.
+
+    The query is normalized once; each of its stems is looked up in the
+    index, so the work is linear in the number of query tokens. Each phrase
+    maps to its first occurrence: the normalized text and its offsets.
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    tokens = list(NORMALIZED_TOKEN_RE.finditer(text))
+    stems = [stem_token(token.group()) for token in tokens]
+    found = {}
+    for i, stem in enumerate(stems):
+        for phrase in stem_index.get(stem, ()):
+            words = phrase.split(" ")
+            if phrase not in found and stems[i:i + len(words)] == words:
+                start, end = tokens[i].start(), tokens[i + len(words) - 1].end()
+                found[phrase] = (text[start:end], start, end)
+    return found
+
+
+def match_stem_strategy(phrases: frozenset, request: dict) -> list[dict]:
+    """Match normalized, stemmed query tokens against the database's keyword stems."""
+    if "stem_phrases" not in request:
+        request["stem_phrases"] = find_stem_phrases(request["tool_input"].get("query", ""), request["stem_index"])
+    # Offsets into the normalized query only apply when normalizing kept its shape
+    aligned = len(request["query"]) == len(request["tool_input"].get("query", ""))
+    hits = []
+    for phrase in phrases.intersection(request["stem_phrases"]):
+        text, start, end = request["stem_phrases"][phrase]
+        aligned_here = aligned and request["query"][start:end] == text
+        hits.append(make_hit("stem", text, text, *((start, end) if aligned_here else ())))
+    return sorted(hits, key=lambda hit: hit["start"] if hit["start"] is not None else -1)
+
+
+def load_pattern(pattern: str) -> re.Pattern:
+    """Compile a persisted pattern; an empty pattern never matches."""
+    return re.compile(pattern or r"(?!)")
+
+
+def load_keyword_state(state: str | int | list) -> re.Pattern | int | tuple[str, int]:
+    """Load keyword strategy state: a pattern, a slot in the matcher's
+    keyword index, or [index path, index key, slot] in a config fragment's
+    index (loaded as (index path, slot))."""
+    if isinstance(state, list):
+        return state[0], state[2]
+    return state if isinstance(state, int) else load_pattern(state)
+
+
+def open_keyword_indexes(raw_routes: list[list]) -> dict[str, "KeywordIndex"]:
+    """Map the config fragment keyword indexes the routes point into, by path.
+
+    Raises ValueError if an index has been rebuilt since the routes were.
+    """
+    indexes = {}
+    for db_routes in raw_routes:
+        for name, state in db_routes:
+            if name == "keyword" and isinstance(state, list) and state[0] not in indexes:
+                indexes[state[0]] = KeywordIndex(Path(state[0]), state[1])
+    return indexes
+
+
+# Routing strategies, by name. "cost" orders strategies cheapest-first when a
+# database doesn't choose its own order; "compile" builds JSON-serializable
+# state once per config, and "load" turns it into what "match" uses.
+ROUTING_STRATEGIES = {
+    "keyword": {"cost": 1, "compile": compile_keyword_strategy, "load": load_keyword_state, "match": match_keyword_strategy},
+    "domain": {"cost": 2, "compile": compile_domain_strategy, "load": set, "match": match_domain_strategy},
+    "stem": {"cost": 3, "compile": compile_stem_strategy, "load": frozenset, "match": match_stem_strategy},
+    "regex": {"cost": 5, "compile": compile_regex_strategy, "load": load_pattern, "match": match_regex_strategy},
+    "fuzzy": {"cost": 50, "compile": compile_fuzzy_strategy, "load": dict, "match": match_fuzzy_strategy},
+}
+
+
+def select_strategies(db: dict) -> list[str]:
+    """Return the strategy names to run for a database, in order.
+
+    A database's 'strategies' list picks strategies and their order. The
+    default is keyword and domain (plus regex when 'patterns' is set),
+    cheapest first. Stem and fuzzy matching are opt-in.
+    """
+    if "strategies" in db:
+        return list(dict.fromkeys(db["strategies"]))
+    names = ["keyword", "domain"]
+    if db.get("patterns"):
+        names.append("regex")
+    return sorted(names, key=lambda name: ROUTING_STRATEGIES[name]["cost"])
+
+
+def load_routes(raw_routes: list[list]) -> list[list[tuple]]:
+    """Turn persisted per-database strategy state into matchable state."""
+    return [
+        [(name, ROUTING_STRATEGIES[name]["load"](state)) for name, state in db_routes]
+        for db_routes in raw_routes
+    ]
+
+
+def compile_routes(db: dict) -> list[list]:
+    """Compile a database's routing strategies, in the order they run."""
+    return [[name, ROUTING_STRATEGIES[name]["compile"](db)] for name in select_strategies(db)]
+
+
+def compile_config(databases: list[dict], options: dict | None = None, raw_routes: list[list] | None = None) -> dict:
+    """Compile validated databases into a matcher.
+
+    Each database gets its routing strategies' compiled state, in the order
+    they should run, and domains go into a suffix trie for WebFetch URLs.
+    """
+    if raw_routes is None:
+        raw_routes = [compile_routes(db) for db in databases]
+    return {
+        "databases": databases,
+        "raw_routes": raw_routes,
+        "routes": load_routes(raw_routes),
+        "domain_index": build_domain_index(databases),
+        "stem_index": build_stem_index(raw_routes),
+        "options": options or {},
+        "keyword_indexes": open_keyword_indexes(raw_routes),
+    }
+
+
+def route_search_hits(tool_input: dict, compiled: dict, deadline: float | None = None) -> list[tuple[dict, list]]:
+    """Find all databases a WebSearch should be redirected to, with their hits.
+
+    Each database's strategies run in order and stop at the first match, so
+    expensive strategies only run for databases the cheap ones missed. A
+    blocked domain then suppresses every database whose domain lies under it,
+    since results from it were explicitly unwanted.
+    """
+    request = {
+        "query": tool_input.get("query", "").lower(),
+        "tool_input": tool_input,
+        "stem_index": compiled["stem_index"],
+        "keyword_indexes": compiled.get("keyword_indexes", {}),
+    }
+    selected = {}
+    for i, db_routes in enumerate(compiled["routes"]):
+        for name, state in db_routes:
+            if hits := ROUTING_STRATEGIES[name]["match"](state, request):
+                selected[i] = hits
+                break
+        check_deadline(deadline, "match")
+
+    domain_index = compiled["domain_index"]
+    for domain in tool_input.get("blocked_domains") or []:
+        if isinstance(domain, str):
+            for i in lookup_domain_subtree(normalize_domain(domain), domain_index):
+                selected.pop(i, None)
+
+    databases = compiled["databases"]
+    return [(databases[i], selected[i]) for i in sorted(selected)]
+
+
+def route_search(tool_input: dict, compiled: dict, deadline: float | None = None) -> list[dict]:
+    """Find all databases a WebSearch should be redirected to."""
+    return [db for db, _ in route_search_hits(tool_input, compiled, deadline)]
+
+
+def find_matching_databases(query: str, config: dict) -> list[dict]:
+    """Find all databases with keywords matching the query.
+
+    Uses word boundary matching (case-insensitive).
+    Returns list of matching database configs.
+    """
+    matches = []
+    query_lower = query.lower()
+
+    for db in config.get("databases", []):
+        for keyword in db.get("keywords", []):
+            pattern = build_keyword_pattern(keyword)
+            if re.search(pattern, query_lower):
+                matches.append(db)
+                break  # Only add each database once
+
+    return matches
+
+
+# Tool names as shown to Claude in deny guidance
+TOOL_LABELS = {"WebSearch": "Web Search", "WebFetch": "Web Fetch"}
+
+
+# Hits from these strategies are routing words, not part of what is being asked
+STRIPPED_HIT_STRATEGIES = {"keyword", "stem", "fuzzy"}
+
+
+def suggest_rag_query(query: str, hits: list[dict]) -> str:
+    """Suggest a RAG query: the search query without the words that routed it.
+
+    Hits are removed by their offsets when lowercasing kept the query's shape,
+    otherwise by their text. A query that was nothing but routing words is
+    returned as is.
+    """
+    stripped = [hit for hit in hits if hit["strategy"] in STRIPPED_HIT_STRATEGIES]
+    suggestion = query
+    if len(query.lower()) == len(query):
+        for hit in sorted((h for h in stripped if h["start"] is not None), key=lambda h: h["start"], reverse=True):
+            suggestion = suggestion[:hit["start"]] + " " + suggestion[hit["end"]:]
+    for hit in stripped:
+        if hit["start"] is None or len(query.lower()) != len(query):
+            suggestion = re.sub(build_keyword_pattern(hit["text"]), " ", suggestion, flags=re.IGNORECASE)
+    suggestion = " ".join(suggestion.split()).strip(" ,;:-")
+    return suggestion if re.search(r"\w", suggestion) else query.strip()
+
+
+def format_rag_hints(db: dict, query: str, hits: list[dict]) -> str:
+    """Describe the suggested first RAG call for a database: query, top_k and filters."""
+    hints = []
+    if query:
+        hints.append(f"query '{suggest_rag_query(query, hits)}'")
+    if "top_k" in db:
+        hints.append(f"top_k {db['top_k']}")
+    if db.get("filters"):
+        hints.append(f"filters {json.dumps(db['filters'], sort_keys=True)}")
+    return ", ".join(hints)
+
+
+def build_deny_response(
+    matches: list[dict], tool_name: str = "WebSearch", query: str = "", hits: list[list[dict]] | None = None
+) -> dict:
+    """Build the JSON response for denying a WebSearch or WebFetch.
+
+    hits, when given, lists what fired for each match (see make_hit): the
+    reason cites the keyword that actually matched, and the context suggests
+    a RAG query built from query plus the database's top_k and filters.
+    """
+    if tool_name == "WebFetch":
+        subject, request, cite_field = "URL", "This page", "domains"
+    else:
+        subject, request, cite_field = "Query", "This query", "keywords"
+    retry = f"Repeat the {TOOL_LABELS[tool_name]} tool call with the exact same parameters if the RAG search fails."
+    hits = hits or [[] for _ in matches]
+    # Cite the keyword that fired, or the first configured one
+    cited = [
+        db_hits[0]["keyword"] if db_hits else (db.get(cite_field) or [db["description"]])[0]
+        for db, db_hits in zip(matches, hits)
+    ]
+    rag_hints = [format_rag_hints(db, query, db_hits) for db, db_hits in zip(matches, hits)]
+
+    if len(matches) == 1:
+        db = matches[0]
+        reason = f"{subject} matches '{cited[0]}' - using RAG database instead"
+        suggestion = f"Suggested first RAG call: {rag_hints[0]}. " if rag_hints[0] else ""
+        context = (
+            f"{request} should use the LEANN MCP tool '{db['mcp_tool_name']}' "
+            f"to search the {db['description']} RAG database instead of web search. "
+            f"{suggestion}{retry}"
+        )
+    else:
+        keyword_list = " and ".join(f"'{keyword}'" for keyword in cited)
+        reason = f"{subject} matches {keyword_list} - using RAG databases instead"
+        lines = [f"{request} matches multiple documentation databases. Please use these LEANN MCP tools IN PARALLEL:"]
+        for i, (db, hint) in enumerate(zip(matches, rag_hints), 1):
+            suggestion = f" ({hint})" if hint else ""
+            lines.append(f"{i}. '{db['mcp_tool_name']}' for {db['description']} at {db['path']}{suggestion}")
+        lines.append(retry)
+        context = "\n".join(lines)
+
+    return {
+        "hookSpecificOutput": {
+            "hookEventName": "PreToolUse",
+            "permissionDecision": "deny",
+            "permissionDecisionReason": reason,
+            "additionalContext": context,
+        }
+    }
+
+
+class Router:
+    """Route tool calls to documentation databases, for use as a library.
+
+    Built once from a config dict or config file path, then immutable: the
+    compiled matcher is never modified, so one Router can be shared across
+    threads. It applies the config's routing strategies and domain rules
+    only, and never reads the environment, session state or transcripts.
+
+        router = Router("/etc/docsearch-config.json")
+        router.route({"query": "gitlab ci cache"})        # -> [database, ...]
+        router.route_many(tool_inputs)                    # -> [[database, ...], ...]
+
+    Raises ValueError if the config can't be loaded or has no valid database.
+    """
+
+    def __init__(self, config: dict | str | Path):
+        if not isinstance(config, dict):
+            loaded = load_config(Path(config).expanduser())
+            if loaded is None:
+                raise ValueError(f"Could not load config file {config}")
+            config = loaded
+        compiled = build_compiled_config(json.loads(json.dumps(config)))
+        if compiled is None:
+            raise ValueError("Config has no valid database entries")
+        self._compiled = compiled
+
+    @property
+    def databases(self) -> list[dict]:
+        """The valid databases, in config order (copies)."""
+        return [dict(db) for db in self._compiled["databases"]]
+
+    def route(self, tool_input: dict, tool_name: str = "WebSearch") -> list[dict]:
+        """Return copies of the databases a WebSearch (or WebFetch) call should go to."""
+        if tool_name == "WebFetch":
+            matches = match_url(tool_input.get("url", ""), self._compiled)
+        elif tool_input.get("query"):
+            matches = route_search(tool_input, self._compiled)
+        else:
+            matches = []
+        return [dict(db) for db in matches]
+
+    def route_many(self, tool_inputs, tool_name: str = "WebSearch") -> list[list[dict]]:
+        """Route a batch of tool inputs; returns one database list per input."""
+        return [self.route(tool_input, tool_name) for tool_input in tool_inputs]
+
+    def explain(self, tool_input: dict) -> list[tuple[dict, list[dict]]]:
+        """Route a WebSearch input, returning each database with what fired (see make_hit)."""
+        if not tool_input.get("query"):
+            return []
+        return [(dict(db), hits) for db, hits in route_search_hits(tool_input, self._compiled)]
+
+    def deny_response(
+        self, matches: list[dict], tool_name: str = "WebSearch", query: str = "", hits: list[list[dict]] | None = None
+    ) -> dict:
+        """Build the PreToolUse deny response the hook would print for matches."""
+        return build_deny_response(matches, tool_name, query, hits)
+
+
+def get_compiled_config(
+    sources: list[Path], strategies: list[str] | None = None, deadline: float | None = None
+) -> dict | None:
+    """Return the compiled matcher for a set of config files.
+
+    Uses the persisted compiled matcher while none of the files has changed;
+    otherwise loads, merges, validates and compiles them and persists the
+    result. Returns None if there is no usable config.
+
+    With strategies (an experiment arm's), every database runs those
+    strategies instead of its own. With a deadline, the budget timer is
+    paused while a changed config is compiled and persisted: a cut-short
+    compile would never be saved, and every later call would hit the same
+    wall. The timer is re-armed afterwards, so an overrun still fails open.
+    """
+    signatures = get_source_signatures(sources)
+    compiled = load_compiled_config(signatures, strategies)
+    if compiled is not None:
+        return compiled
+
+    disarm_budget_timer()
+    try:
+        return compile_config_sources(sources, signatures, strategies)
+    finally:
+        arm_budget_timer(deadline)
+
+
+def compile_config_sources(
+    sources: list[Path], signatures: list[list], strategies: list[str] | None = None
+) -> dict | None:
+    """Load, merge, validate and compile config files, and persist the result."""
+    config, precompiled = load_config_sources(sources)
+    if config is None:
+        return None
+    if strategies:
+        databases = [{**db, "strategies": strategies} if isinstance(db, dict) else db for db in config.get("databases", [])]
+        # Fragment routes were compiled for the databases' own strategies
+        config, precompiled = {**config, "databases": databases}, {}
+    compiled = build_compiled_config(config, precompiled)
+    if compiled is not None:
+        save_compiled_config(compiled, signatures, strategies)
+    return compiled
+
+
+def build_compiled_config(config: dict, precompiled: dict[int, list] | None = None) -> dict | None:
+    """Validate and compile a loaded config. Returns None if no database is valid.
+
+    Databases in precompiled (keyed by id()) are already validated and
+    compiled, and are used as they are.
+    """
+    precompiled = precompiled or {}
+    valid_databases = []
+    raw_routes = []
+    for i, db in enumerate(config.get("databases", [])):
+        if id(db) in precompiled:
+            valid_databases.append(db)
+            raw_routes.append(precompiled[id(db)])
+        elif validate_database_entry(db, i):
+            valid_databases.append(db)
+            raw_routes.append(compile_routes(db))
+    if not valid_databases:
+        return None
+    return compile_config(valid_databases, validate_options(config), raw_routes)
+
+
+def read_hook_input() -> dict | None:
+    """Read and parse the hook input from stdin. Returns None on invalid JSON."""
+    try:
+        hook_input = json.loads(sys.stdin.read())
+    except json.JSONDecodeError:
+        return None
+    return hook_input if isinstance(hook_input, dict) else None
+
+
+def session_start(args: list[str]) -> int:
+    """SessionStart entry point: do the per-session setup work once.
+
+    Validates and compiles the config for the session's cwd (and, in an
+    experiment, for the session's arm), persists the compiled matcher for
+    the PreToolUse path, prunes expired state and
+    pre-creates the session's state slot. Always exits 0 - a failed setup
+    just leaves PreToolUse to do it.
+    """
+    hook_input = read_hook_input() or {}
+    session_id = hook_input.get("session_id", "default")
+
+    # A new session picks up project files created since the last one
+    if hook_input.get("cwd"):
+        find_project_files(hook_input["cwd"], refresh=True)
+    sources = get_config_sources(hook_input.get("cwd"))
+    compiled = get_compiled_config(sources)
+    if compiled and (experiment := compiled["options"].get("experiment")):
+        arm = assign_arm(experiment, session_id)
+        if "strategies" in arm:
+            get_compiled_config(sources, arm["strategies"])
+
+    cleanup_stale_state_files()
+
+    if not state_slot_exists(session_id):
+        save_state(session_id, {"last_denied": None})
+    return 0
+
+
+def get_claude_json_path() -> Path:
+    """Get the path of Claude Code's user config, which holds user and per-project MCP servers."""
+    if env_path := os.environ.get("DOCSEARCH_CLAUDE_JSON"):
+        return Path(env_path)
+    return Path.home() / ".claude.json"
+
+
+def read_mcp_servers(path: Path) -> dict:
+    """Read the MCP server names configured in a Claude config file.
+
+    Returns {"servers": [...], "projects": {project_dir: [...]}}; "projects"
+    is only filled from ~/.claude.json. Unreadable files yield no servers.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {"servers": [], "projects": {}}
+    if not isinstance(data, dict):
+        return {"servers": [], "projects": {}}
+
+    def server_names(section) -> list[str]:
+        servers = section.get("mcpServers") if isinstance(section, dict) else None
+        return sorted(servers) if isinstance(servers, dict) else []
+
+    projects = data.get("projects")
+    return {
+        "servers": server_names(data),
+        "projects": {
+            project_dir: names
+            for project_dir, section in (projects.items() if isinstance(projects, dict) else [])
+            if (names := server_names(section))
+        },
+    }
+
+
+def get_mcp_index_file() -> Path:
+    """Get the path of the cached MCP server index."""
+    return get_state_dir() / "docsearch-mcp-index.json"
+
+
+def load_mcp_servers(cwd: str | None) -> set[str] | None:
+    """Return the MCP server names available in cwd, or None if unknown.
+
+    Reads ~/.claude.json (user servers, plus servers of cwd's project and its
+    parents) and the nearest .mcp.json. Parsed files are cached in an index
+    keyed by path, mtime and size, since ~/.claude.json can be large. Returns
+    None when none of the files exists, so nothing can be verified.
+    """
+    paths = [get_claude_json_path()]
+    if cwd and (project_mcp := find_project_files(cwd)["mcp"]) is not None:
+        paths.append(project_mcp)
+
+    index = read_json_index(get_mcp_index_file())
+
+    found = False
+    changed = False
+    servers: set[str] = set()
+    ancestors = {str(directory) for directory in (Path(cwd), *Path(cwd).parents)} if cwd else set()
+    for path in paths:
+        signature = get_file_signature(path)
+        if signature is None:
+            continue
+        found = True
+        entry = index.get(str(path))
+        if entry is None or entry.get("signature") != signature:
+            entry = {"signature": signature, **read_mcp_servers(path)}
+            index[str(path)] = entry
+            changed = True
+        servers.update(entry["servers"])
+        for project_dir, names in entry["projects"].items():
+            if project_dir in ancestors:
+                servers.update(names)
+
+    if changed:
+        write_json_atomic(get_mcp_index_file(), index)
+    return servers if found else None
+
+
+def mcp_server_name(mcp_tool_name: str) -> str:
+    """Get the MCP server a configured mcp_tool_name refers to.
+
+    Accepts a server name or a full mcp__<server>__<tool> name.
+    """
+    if mcp_tool_name.startswith("mcp__"):
+        return mcp_tool_name.split("__")[1]
+    return mcp_tool_name
+
+
+def drop_unavailable_databases(matches: list[dict], servers: set[str] | None) -> list[dict]:
+    """Remove databases whose MCP server isn't configured, warning about each."""
+    if servers is None:
+        return matches
+    available = []
+    for db in matches:
+        server = mcp_server_name(db["mcp_tool_name"])
+        if server in servers:
+            available.append(db)
+        else:
+            print(
+                f"Warning: Not redirecting to {database_label(db)}: MCP server '{server}' is not in "
+                f"~/.claude.json or .mcp.json (set \"verify_mcp_tools\": false if it comes from elsewhere)",
+                file=sys.stderr,
+            )
+    return available
+
+
+# How much of the end of the transcript to scan for failed RAG calls
+DEFAULT_TRANSCRIPT_SCAN_BYTES = 256 * 1024
+
+# Failed RAG calls older than this no longer affect routing
+RAG_FAILURE_MAX_AGE_SECONDS = 15 * 60
+
+# Share of its topic words a failed RAG call must have in common with a search
+RAG_FAILURE_TOPIC_OVERLAP = 0.5
+
+# Input fields a RAG tool call may carry its search text in
+RAG_QUERY_FIELDS = ("query", "q", "question")
+
+# Tool results that mean the RAG search came back empty-handed
+RAG_FAILURE_RE = re.compile(r"\bno (?:relevant )?(?:results|matches|documents)\b|\bnothing found\b", re.IGNORECASE)
+
+
+def iter_lines_reversed(path: str, max_bytes: int):
+    """Yield the complete lines in the last max_bytes of a file, newest first.
+
+    The file is mmap'ed and scanned backwards, so only the tail is touched
+    however large the file is. A line cut by the byte cap is skipped.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            floor = max(0, size - max_bytes)
+            end = size
+            while end > floor:
+                start = mm.rfind(b"\n", floor, end - 1) + 1
+                if start == 0 and floor > 0:
+                    return  # Line starts before the byte cap
+                line = mm[start:end].strip()
+                if line:
+                    yield line
+                end = start - 1 if start > 0 else 0
+
+
+def is_rag_tool(name: str, mcp_tool_name: str) -> bool:
+    """Check if a transcript tool name refers to a configured MCP tool.
+
+    Claude Code names MCP tools mcp__<server>__<tool>; mcp_tool_name may be
+    the full name, the server or the tool.
+    """
+    return (
+        name == mcp_tool_name
+        or name.startswith(f"mcp__{mcp_tool_name}__")
+        or name.endswith(f"__{mcp_tool_name}")
+    )
+
+
+def tool_result_failed(result: dict) -> bool:
+    """Check if a transcript tool_result shows an error or no useful results."""
+    if result.get("is_error"):
+        return True
+    content = result.get("content")
+    if isinstance(content, list):
+        content = " ".join(item.get("text", "") for item in content if isinstance(item, dict))
+    text = str(content or "").strip()
+    return not text or RAG_FAILURE_RE.search(text[:500]) is not None
+
+
+def parse_transcript_timestamp(value) -> float | None:
+    """Parse a transcript entry's ISO 8601 timestamp to epoch seconds."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def find_failed_rag_calls(transcript_path: str, matches: list[dict], max_bytes: int,
+                          deadline: float | None = None) -> list[dict]:
+    """Find recent failed calls to the matched databases' MCP tools.
+
+    Scans the transcript tail newest-first, stopping at the first entry
+    older than RAG_FAILURE_MAX_AGE_SECONDS. Tool results come after their
+    tool_use in the file, so failed result IDs are collected first and then
+    matched against the tool_use blocks that issued them. Returns the inputs
+    of the failed calls.
+    """
+    tool_names = {db["mcp_tool_name"] for db in matches}
+    cutoff = time.time() - RAG_FAILURE_MAX_AGE_SECONDS
+    failed_ids = set()
+    failed_inputs = []
+    for count, line in enumerate(iter_lines_reversed(transcript_path, max_bytes)):
+        if count % 64 == 0:
+            check_deadline(deadline, "transcript")
+        if b'"tool_result"' not in line and b'"tool_use"' not in line:
+            continue
+        try:
+            entry = json.loads(line)
+            content = entry.get("message", {}).get("content")
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        timestamp = parse_transcript_timestamp(entry.get("timestamp"))
+        if timestamp is not None and timestamp < cutoff:
+            break  # Entries are in time order, so the rest are older still
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if not isinstance(block, dict):
+                continue
+            if block.get("type") == "tool_result" and tool_result_failed(block):
+                failed_ids.add(block.get("tool_use_id"))
+            elif (
+                block.get("type") == "tool_use"
+                and block.get("id") in failed_ids
+                and any(is_rag_tool(str(block.get("name", "")), name) for name in tool_names)
+            ):
+                input_ = block.get("input")
+                failed_inputs.append({"name": str(block["name"]), "input": input_ if isinstance(input_, dict) else {}})
+    return failed_inputs
+
+
+# Input fields a RAG tool call may use to select a database
+RAG_INDEX_FIELDS = ("index_name", "index", "database", "db")
+
+
+def rag_call_covers_database(call: dict, db: dict) -> bool:
+    """Check if a failed RAG call was for this database.
+
+    A call that selects an index (by the database's 'name', 'path' or the
+    basename of its path) covers only that database; one that selects none
+    covers every database served by the tool.
+    """
+    if not is_rag_tool(call["name"], db["mcp_tool_name"]):
+        return False
+    selectors = {call["input"][key] for key in RAG_INDEX_FIELDS if isinstance(call["input"].get(key), str)}
+    if not selectors:
+        return True
+    identifiers = {db.get("name"), db["path"], Path(db["path"]).name} - {None, ""}
+    return not selectors.isdisjoint(identifiers)
+
+
+def rag_call_on_topic(call: dict, query: str, hits: list[dict]) -> bool:
+    """Check if a failed RAG call searched for the same topic as a query.
+
+    Topic words are the query's fingerprint (see query_fingerprint) without
+    the words that routed the query to the database, which name the product
+    rather than the question. The call is on topic if at least
+    RAG_FAILURE_TOPIC_OVERLAP of the shorter side's topic words are shared,
+    or if either side has none left. A call without search text can't be
+    tied to a topic, and never is.
+    """
+    routing = {stem for hit in hits for stem in query_fingerprint(hit["keyword"])}
+    topic = set(query_fingerprint(query)) - routing
+    for key in RAG_QUERY_FIELDS:
+        if not isinstance(text := call["input"].get(key), str):
+            continue
+        call_topic = set(query_fingerprint(text)) - routing
+        if not topic or not call_topic:
+            return True
+        if len(topic & call_topic) / min(len(topic), len(call_topic)) >= RAG_FAILURE_TOPIC_OVERLAP:
+            return True
+    return False
+
+
+def drop_failed_rag_databases(transcript_path: str, query: str, matches: list[dict], hits: list[list[dict]],
+                              max_bytes: int, deadline: float | None = None) -> list[dict]:
+    """Remove databases the transcript shows a recent failed RAG call on this topic for.
+
+    hits holds each matched database's hits; query is the search, or for
+    WebFetch the fetch prompt.
+    """
+    try:
+        failed_calls = find_failed_rag_calls(transcript_path, matches, max_bytes, deadline)
+    except (OSError, ValueError):
+        return matches
+    if not failed_calls:
+        return matches
+    return [
+        db for db, db_hits in zip(matches, hits)
+        if not any(
+            rag_call_covers_database(call, db) and rag_call_on_topic(call, query, db_hits) for call in failed_calls
+        )
+    ]
+
+
+# Query words that ask for something newer than a local index may hold
+RECENCY_CUE_RE = re.compile(
+    r"\b(?:latest|newest|recent|recently|upcoming|just released|what'?s new|new features?"
+    r"|release notes|changelog|this (?:week|month|year)|today|yesterday)\b"
+)
+VERSION_RE = re.compile(r"(?<![\w.])v?(\d+(?:\.\d+)+)\b")
+YEAR_RE = re.compile(r"\b(20\d\d)\b")
+
+# A version number is the database's when it is one of this many words after a hit
+VERSION_HIT_WINDOW_WORDS = 2
+
+# Database build times are re-read at most this often
+DB_STAT_TTL_SECONDS = 600
+
+
+def parse_version(text: str) -> tuple[int, ...] | None:
+    """Parse a dotted version like "18.4" or "v1.31.2" into a tuple of ints."""
+    if (m := VERSION_RE.search(text)) is None:
+        return None
+    return tuple(int(part) for part in m.group(1).split("."))
+
+
+def get_db_stat_index_file() -> Path:
+    """Get the path of the cached database build-time index."""
+    return get_state_dir() / "docsearch-db-stats.json"
+
+
+def read_database_build_time(path: str) -> float | None:
+    """Return the newest mtime of a database directory and its direct entries."""
+    try:
+        newest = os.stat(path).st_mtime
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    newest = max(newest, entry.stat(follow_symlinks=False).st_mtime)
+        return newest
+    except OSError:
+        return None
+
+
+def load_database_build_times(databases: list[dict]) -> dict[str, float | None]:
+    """Return each database path's build time, from the stat index when fresh.
+
+    Rebuilding a database rewrites files inside its directory without
+    necessarily touching the directory itself, so entries expire after
+    DB_STAT_TTL_SECONDS rather than being keyed by the directory's mtime.
+    """
+    index = read_json_index(get_db_stat_index_file())
+
+    now = time.time()
+    changed = False
+    build_times = {}
+    for db in databases:
+        entry = index.get(db["path"])
+        if not isinstance(entry, dict) or now - entry.get("checked", 0) > DB_STAT_TTL_SECONDS:
+            entry = {"mtime": read_database_build_time(db["path"]), "checked": now}
+            index[db["path"]] = entry
+            changed = True
+        build_times[db["path"]] = entry["mtime"]
+
+    if changed:
+        write_json_atomic(get_db_stat_index_file(), index)
+    return build_times
+
+
+def versions_near_hits(query: str, hits: list[dict]) -> list[tuple[int, ...]]:
+    """Return the version numbers in the words right after a database's hits.
+
+    "gitlab 18.4" or "gitlab runner 18.4" name a GitLab version, while the
+    20.1 in "gitlab runner on node 20.1" belongs to another product. Hits
+    without offsets (allowed_domains, unaligned stems) carry no version.
+    """
+    words = list(re.finditer(r"\S+", query))
+    versions = []
+    for hit in hits:
+        if hit["end"] is None:
+            continue
+        following = [word for word in words if word.start() >= hit["end"]][:VERSION_HIT_WINDOW_WORDS]
+        for word in following:
+            if version := parse_version(word.group()):
+                versions.append(version)
+    return versions
+
+
+def query_outdates_database(query: str, db: dict, build_time: float | None, hits: list[dict]) -> bool:
+    """Check if a query asks for something newer than a database holds.
+
+    A version number above the database's 'version', next to one of the
+    database's hits, always does. A recency cue, or a year after the
+    database was built, does when the database is older than its 'max_age'
+    in days.
+    """
+    if "version" in db:
+        indexed = parse_version(db["version"])
+        if any(version > indexed for version in versions_near_hits(query, hits)):
+            return True
+    if "max_age" not in db or build_time is None:
+        return False
+    if time.time() - build_time <= db["max_age"] * 86400:
+        return False
+    if RECENCY_CUE_RE.search(query):
+        return True
+    build_year = time.gmtime(build_time).tm_year
+    return any(int(year) > build_year for year in YEAR_RE.findall(query))
+
+
+def drop_stale_databases(query: str, matches: list[dict], hits: list[list[dict]]) -> list[dict]:
+    """Remove databases too old to answer the query, so it goes to the web.
+
+    hits holds each matched database's hits, with offsets into the lowercased query.
+    """
+    query = query.lower()
+    candidates = [db for db in matches if "version" in db or "max_age" in db]
+    if not candidates or not (RECENCY_CUE_RE.search(query) or VERSION_RE.search(query) or YEAR_RE.search(query)):
+        return matches
+    aging = [db for db in candidates if "max_age" in db]
+    build_times = load_database_build_times(aging) if aging else {}
+    db_hits = {id(db): db_hits for db, db_hits in zip(matches, hits)}
+    stale = [
+        db for db in candidates
+        if query_outdates_database(query, db, build_times.get(db["path"]), db_hits[id(db)])
+    ]
+    return [db for db in matches if not any(db is stale_db for stale_db in stale)]
+
+
+# A redirect counts against max_concurrent for this long, about one RAG call
+RAG_CALL_LEASE_SECONDS = 30
+
+
+def get_limits_file() -> Path:
+    """Get the path of the shared per-database rate limit state."""
+    return get_state_dir() / "docsearch-limits.json"
+
+
+def take_rag_capacity(db: dict, entry: dict, now: float) -> bool:
+    """Take one redirect's worth of a database's limits, updating entry.
+
+    max_per_minute is a token bucket holding up to that many redirects and
+    refilling at that rate; max_concurrent caps redirects made in the last
+    RAG_CALL_LEASE_SECONDS, standing in for RAG calls still running.
+    """
+    tokens = None
+    if "max_per_minute" in db:
+        capacity = db["max_per_minute"]
+        elapsed = max(now - entry.get("updated", now), 0)
+        tokens = min(capacity, entry.get("tokens", capacity) + elapsed * capacity / 60)
+        if tokens < 1:
+            return False
+    leases = [expiry for expiry in entry.get("leases", []) if expiry > now]
+    if "max_concurrent" in db and len(leases) >= db["max_concurrent"]:
+        return False
+
+    if tokens is not None:
+        entry["tokens"] = tokens - 1
+    entry["updated"] = now
+    entry["leases"] = [*leases, now + RAG_CALL_LEASE_SECONDS]
+    return True
+
+
+def drop_saturated_databases(matches: list[dict], consume: bool = True) -> list[dict]:
+    """Remove databases over their max_per_minute or max_concurrent limit.
+
+    Limits are shared by every hook on the host through a flock'd file, and
+    the databases kept are charged for the redirect unless consume is False.
+    Without flock, or if the file can't be used, nothing is limited.
+    """
+    if fcntl is None or not any("max_per_minute" in db or "max_concurrent" in db for db in matches):
+        return matches
+    limits_file = get_limits_file()
+    try:
+        try:
+            fd = os.open(limits_file, os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            limits_file.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(limits_file, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                limits = json.load(f)
+            except json.JSONDecodeError:
+                limits = {}
+            if not isinstance(limits, dict):
+                limits = {}
+
+            now = time.time()
+            kept = []
+            for db in matches:
+                if "max_per_minute" not in db and "max_concurrent" not in db:
+                    kept.append(db)
+                    continue
+                entry = dict(limits.get(db["path"]) or {})
+                if take_rag_capacity(db, entry, now):
+                    kept.append(db)
+                    limits[db["path"]] = entry
+            if consume:
+                f.seek(0)
+                f.truncate()
+                json.dump(limits, f)
+    except OSError:
+        return matches
+    return kept
+
+
+def get_metrics_file() -> Path | None:
+    """Get the Prometheus textfile path, or None if metrics are disabled."""
+    if fcntl is None:
+        return None
+    if env_path := os.environ.get("DOCSEARCH_METRICS_FILE"):
+        return Path(env_path)
+    return None
+
+
+def get_metrics_interval() -> float:
+    """Get the minimum number of seconds between .prom renders."""
+    try:
+        return float(os.environ.get("DOCSEARCH_METRICS_INTERVAL", "60"))
+    except ValueError:
+        return 60.0
+
+
+def database_label(db: dict) -> str:
+    """Get the label identifying a database in metrics and logs."""
+    return db.get("name") or db["description"]
+
+
+def append_record(path: Path, fields: list[str], max_bytes: int = 0) -> None:
+    """Append one tab-separated record line to path.
+
+    Uses a single O_APPEND write under a short flock so concurrent hooks
+    never interleave lines, and readers that truncate the file never lose one.
+    With max_bytes, a file that reaches that size is rotated to path.1
+    (replacing the previous generation) while the lock is still held.
+    """
+    line = "\t".join(field.replace("\t", " ").replace("\n", " ") for field in fields) + "\n"
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, line.encode())
+        if max_bytes:
+            stat = os.fstat(fd)
+            # Another hook may have rotated this file while we waited for the lock
+            if stat.st_size >= max_bytes and os.stat(path).st_ino == stat.st_ino:
+                os.replace(path, path.with_name(path.name + ".1"))
+    finally:
+        os.close(fd)
+
+
+def record_metrics(outcome: dict, elapsed: float) -> None:
+    """Spool one invocation's metrics and render the .prom file when it is due.
+
+    Each call costs one small append; aggregation happens at most once per
+    DOCSEARCH_METRICS_INTERVAL seconds. Never raises - metrics are optional.
+    """
+    metrics_file = get_metrics_file()
+    if metrics_file is None:
+        return
+    try:
+        spool_file = get_state_dir() / "docsearch-metrics.spool"
+        decision = outcome["decision"]
+        record = [
+            f"shadow_{decision}" if outcome["mode"] == "shadow" else decision,
+            str(int(elapsed * 1_000_000)),
+            *(database_label(db) for db in outcome["matches"]),
+        ]
+        try:
+            append_record(spool_file, record)
+        except FileNotFoundError:
+            spool_file.parent.mkdir(parents=True, exist_ok=True)
+            append_record(spool_file, record)
+        try:
+            rendered_at = metrics_file.stat().st_mtime
+        except FileNotFoundError:
+            rendered_at = 0
+        if time.time() - rendered_at >= get_metrics_interval():
+            # Imported here so only the hook that renders pays for it
+            from docsearch_metrics import render_metrics
+
+            render_metrics(metrics_file)
+    except (OSError, ValueError):
+        pass
+
+
+# Fields of a decision log record, in order
+DECISION_LOG_FIELDS = ["timestamp", "session", "mode", "decision", "databases", "escape_hatch", "duration_us", "arm"]
+
+
+DEFAULT_DECISION_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+
+def get_decision_log_file() -> Path:
+    """Get the decision log path."""
+    if env_path := os.environ.get("DOCSEARCH_DECISION_LOG"):
+        return Path(env_path)
+    return get_state_dir() / "docsearch-decisions.log"
+
+
+def get_decision_log_max_bytes() -> int:
+    """Get the size at which the decision log rotates (0 disables the log)."""
+    value = os.environ.get("DOCSEARCH_DECISION_LOG_MAX_BYTES", "")
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        return DEFAULT_DECISION_LOG_MAX_BYTES
+
+
+def hash_session_id(session_id: str) -> str:
+    """Return a short, stable, non-reversible tag for a session ID."""
+    return hashlib.sha256(session_id.encode()).hexdigest()[:12]
+
+
+def format_decision_record(outcome: dict, elapsed: float) -> list[str]:
+    """Build a decision log record (see DECISION_LOG_FIELDS)."""
+    return [
+        str(int(time.time())),
+        hash_session_id(outcome.get("session_id", "default")),
+        outcome["mode"],
+        outcome["decision"],
+        ",".join(database_label(db).replace(",", " ") for db in outcome["matches"]),
+        "1" if outcome["decision"] == "escape_hatch" else "0",
+        str(int(elapsed * 1_000_000)),
+        outcome.get("arm", ""),
+    ]
+
+
+def log_decision(outcome: dict, elapsed: float) -> None:
+    """Append the hook's decision to the decision log. Never raises."""
+    max_bytes = get_decision_log_max_bytes()
+    if not max_bytes:
+        return
+    log_file = get_decision_log_file()
+    record = format_decision_record(outcome, elapsed)
+    try:
+        try:
+            append_record(log_file, record, max_bytes)
+        except FileNotFoundError:
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            append_record(log_file, record, max_bytes)
+    except OSError:
+        pass
+
+
+def pre_tool_use() -> int:
+    """PreToolUse entry point for the hook.
+
+    Runs the hook under its latency budget: if the budget runs out, the call
+    is allowed through and a budget-exceeded event is logged to stderr.
+    """
+    started = time.monotonic()
+    outcome = {"mode": "enforce", "decision": "pass", "matches": []}
+    try:
+        try:
+            return handle_pre_tool_use(started, outcome)
+        finally:
+            # The timer may still fire in here; the outer handler catches it
+            disarm_budget_timer()
+    except BudgetExceeded as e:
+        outcome["decision"] = "budget_exceeded"
+        elapsed_ms = (time.monotonic() - started) * 1000
+        print(
+            f"Warning: docsearch hook exceeded its latency budget during {e} "
+            f"after {elapsed_ms:.1f} ms; allowing the call through",
+            file=sys.stderr,
+        )
+        return 0
+    finally:
+        elapsed = time.monotonic() - started
+        record_metrics(outcome, elapsed)
+        log_decision(outcome, elapsed)
+
+
+def handle_pre_tool_use(started: float, outcome: dict) -> int:
+    """Decide on a PreToolUse call, checking the deadline between phases.
+
+    The decision and matched databases are recorded in outcome. In shadow
+    mode the whole decision is made, but no state is written and the call is
+    always allowed. An experiment arm in "off" mode allows every call unseen.
+    """
+    budget_ms = get_budget_ms()
+    deadline = started + budget_ms / 1000 if budget_ms else None
+    arm_budget_timer(deadline)
+
+    # Read and parse input from stdin
+    hook_input = read_hook_input()
+    if hook_input is None:
+        # Invalid JSON - fail open
+        return 0
+
+    # Get session ID for state management; set first so every record carries it
+    session_id = hook_input.get("session_id", "default")
+    outcome["session_id"] = session_id
+
+    # Get tool name - if not WebSearch or WebFetch, allow through
+    tool_name = hook_input.get("tool_name", "")
+    if tool_name not in TOOL_LABELS:
+        return 0
+
+    # Load compiled configuration - if missing or invalid, allow through
+    sources = get_config_sources(hook_input.get("cwd"))
+    compiled = get_compiled_config(sources, deadline=deadline)
+    if compiled is None:
+        if sources:
+            outcome["decision"] = "config_error"
+        return 0
+
+    # The config may set the budget when the environment doesn't
+    if deadline is None and (budget_ms := get_budget_ms(compiled["options"])):
+        deadline = started + budget_ms / 1000
+        arm_budget_timer(deadline)
+    mode = compiled["options"].get("mode", "enforce")
+
+    # Sessions in an experiment run their arm's mode and strategies
+    if experiment := compiled["options"].get("experiment"):
+        arm = assign_arm(experiment, session_id)
+        outcome["arm"] = arm["name"]
+        mode = arm.get("mode", mode)
+        if mode != "off" and "strategies" in arm:
+            compiled = get_compiled_config(sources, arm["strategies"], deadline)
+            if compiled is None:
+                return 0
+    check_deadline(deadline, "config")
+    outcome["mode"] = mode
+    if mode == "off":
+        return 0
+    shadow = mode == "shadow"
+
+    # Get the query (or URL, for WebFetch) from tool input
+    tool_input = hook_input.get("tool_input", {})
+    query = tool_input.get("url" if tool_name == "WebFetch" else "query", "")
+    if not query:
+        return 0
+
+    # Prune stale state unless session-start already did it for this session
+    if not state_slot_exists(session_id):
+        cleanup_stale_state_files(deadline)
+
+    # Check escape hatch - if this is a retry of the same params, allow through
+    state = load_state(session_id, deadline)
+    last_denied = state.get("last_denied")
+    similarity = compiled["options"].get("retry_similarity")
+    if last_denied and not is_state_expired(last_denied) and (
+        denied_params_match(tool_name, tool_input, last_denied)
+        or (similarity and tool_name == "WebSearch" and near_duplicate_retry(tool_input, last_denied, similarity))
+    ):
+        # Clear state and allow through
+        outcome["decision"] = "escape_hatch"
+        if not shadow:
+            save_state(session_id, {"last_denied": None})
+        return 0
+
+    # Find matching databases
+    if tool_name == "WebFetch":
+        hits = {}
+        matches = match_url(query, compiled)
+    else:
+        hits = {id(db): db_hits for db, db_hits in route_search_hits(tool_input, compiled, deadline)}
+        matches = [db for db in compiled["databases"] if id(db) in hits]
+    if not matches:
+        return 0
+    check_deadline(deadline, "match")
+
+    # Let searches for things newer than a database's index go to the web
+    if tool_name == "WebSearch":
+        matches = drop_stale_databases(query, matches, [hits[id(db)] for db in matches])
+        if not matches:
+            outcome["decision"] = "stale_database"
+            return 0
+        check_deadline(deadline, "freshness")
+
+    # Skip databases whose MCP server Claude doesn't have
+    if compiled["options"].get("verify_mcp_tools", False):
+        matches = drop_unavailable_databases(matches, load_mcp_servers(hook_input.get("cwd")))
+        if not matches:
+            outcome["decision"] = "mcp_unavailable"
+            return 0
+        check_deadline(deadline, "mcp")
+
+    # For WebFetch, the prompt says what Claude wanted from the page
+    rag_query = tool_input.get("prompt", "") if tool_name == "WebFetch" else query
+
+    # Skip databases the transcript shows Claude recently tried on this topic without luck
+    transcript_path = hook_input.get("transcript_path")
+    scan_bytes = compiled["options"].get("transcript_scan_bytes", DEFAULT_TRANSCRIPT_SCAN_BYTES)
+    if transcript_path and scan_bytes:
+        matches = drop_failed_rag_databases(
+            transcript_path, rag_query, matches, [hits.get(id(db), []) for db in matches], scan_bytes, deadline
+        )
+        if not matches:
+            outcome["decision"] = "rag_failed"
+            return 0
+
+    # Let the search go to the web rather than pile onto an overloaded RAG server
+    matches = drop_saturated_databases(matches, consume=not shadow)
+    if not matches:
+        outcome["decision"] = "rag_saturated"
+        return 0
+    check_deadline(deadline, "limits")
+
+    # Store current params in state for escape hatch
+    if not shadow:
+        denied = build_denied_params(tool_name, tool_input)
+        if similarity and tool_name == "WebSearch":
+            denied["fingerprint"] = query_fingerprint(query)
+        save_state(session_id, {"last_denied": denied})
+        # Without the saved state a retry would be denied again, cutting Claude off from the web
+        if state_backend_down():
+            outcome["decision"] = "state_unavailable"
+            return 0
+        check_deadline(deadline, "save_state")
+
+    # Deny and provide guidance - past this point the budget no longer applies
+    disarm_budget_timer()
+    outcome["decision"] = "deny"
+    outcome["matches"] = matches
+    response = json.dumps(build_deny_response(matches, tool_name, rag_query, [hits.get(id(db), []) for db in matches]))
+    if shadow:
+        return 0
+    print(response)
+    return 2
+
+
+DEFAULT_PROFILE_MAX_FILES = 200
+
+
+def get_profile_dir() -> Path:
+    """Get the directory sampled profiles are written to."""
+    if env_path := os.environ.get("DOCSEARCH_PROFILE_DIR"):
+        return Path(env_path)
+    return get_state_dir() / "docsearch-profiles"
+
+
+def get_profile_max_files() -> int:
+    """Get the number of profiles kept in the profile directory."""
+    try:
+        return max(int(os.environ.get("DOCSEARCH_PROFILE_MAX_FILES", "")), 1)
+    except ValueError:
+        return DEFAULT_PROFILE_MAX_FILES
+
+
+def should_profile(sample: str) -> bool:
+    """Decide whether this invocation is the one in DOCSEARCH_PROFILE_SAMPLE to profile."""
+    try:
+        rate = int(sample)
+    except ValueError:
+        print(f"Warning: DOCSEARCH_PROFILE_SAMPLE must be an integer, got {sample!r}", file=sys.stderr)
+        return False
+    return rate > 0 and int.from_bytes(os.urandom(4), "big") % rate == 0
+
+
+def save_profile(profiler) -> None:
+    """Write a profile to the profile directory, pruning the oldest. Never raises."""
+    profile_dir = get_profile_dir()
+    try:
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profile_file = profile_dir / f"docsearch-{time.time_ns()}-{os.getpid()}.pstats"
+        tmp_file = profile_dir / f".{profile_file.name}.tmp"
+        profiler.dump_stats(tmp_file)
+        os.replace(tmp_file, profile_file)
+
+        profiles = sorted(profile_dir.glob("docsearch-*.pstats"))
+        for old_file in profiles[:-get_profile_max_files()]:
+            old_file.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Warning: Could not save profile to {profile_dir}: {e}", file=sys.stderr)
+
+
+def run_profiled(func, *args) -> int:
+    """Run func under cProfile and save the profile."""
+    # Imported here so unsampled invocations don't pay for it
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        save_profile(profiler)
+
+
+COMMANDS = {
+    "session-start": session_start,
+}
+
+# Commands run by hand live in docsearch_cli, which the hook never imports
+CLI_COMMANDS = ["doctor", "extract-keywords", "stats", "experiment-report", "profile-report"]
+
+
+def run(argv: list[str]) -> int:
+    """Dispatch to a subcommand, or run the PreToolUse hook."""
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    if argv and argv[0] in CLI_COMMANDS:
+        import docsearch_cli
+
+        return docsearch_cli.COMMANDS[argv[0]](argv[1:])
+    return pre_tool_use()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Main entry point, profiling one in DOCSEARCH_PROFILE_SAMPLE invocations."""
+    argv = sys.argv[1:] if argv is None else argv
+    sample = os.environ.get("DOCSEARCH_PROFILE_SAMPLE")
+    if sample and argv[:1] != ["profile-report"] and should_profile(sample):
+        return run_profiled(run, argv)
+    return run(argv)
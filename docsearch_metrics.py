@@ -0,0 +1,117 @@
+"""
+Prometheus textfile rendering for the DocSearch hook's spooled metrics
+(see docsearch_hook.record_metrics).
+"""
+import fcntl  # Only imported where metrics are enabled (see get_metrics_file)
+import os
+from pathlib import Path
+
+from docsearch_hook import get_state_dir, read_json_index, write_json_atomic
+
+
+# Hook latency histogram bucket bounds, in seconds
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+# Hook decisions, as counted in metrics
+DECISIONS = [
+    "pass", "deny", "escape_hatch", "rag_failed", "mcp_unavailable", "stale_database", "rag_saturated", "config_error",
+    "budget_exceeded", "state_unavailable",
+]
+
+
+def new_metrics_totals() -> dict:
+    """Return empty aggregated metrics."""
+    return {
+        "decisions": {decision: 0 for decision in DECISIONS},
+        "databases": {},
+        "buckets": [0] * len(LATENCY_BUCKETS),
+        "duration_sum": 0.0,
+        "count": 0,
+    }
+
+
+def merge_metrics_spool(totals: dict, lines: list[str]) -> None:
+    """Merge spooled invocation records into aggregated totals."""
+    for line in lines:
+        fields = line.split("\t")
+        if len(fields) < 2 or not fields[1].isdigit():
+            continue
+        decision, elapsed = fields[0], int(fields[1]) / 1_000_000
+        totals["decisions"][decision] = totals["decisions"].get(decision, 0) + 1
+        for label in fields[2:]:
+            totals["databases"][label] = totals["databases"].get(label, 0) + 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                totals["buckets"][i] += 1
+                break
+        totals["duration_sum"] += elapsed
+        totals["count"] += 1
+
+
+def escape_label_value(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(totals: dict) -> str:
+    """Render aggregated metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP docsearch_invocations_total PreToolUse hook invocations.",
+        "# TYPE docsearch_invocations_total counter",
+        f"docsearch_invocations_total {totals['count']}",
+        "# HELP docsearch_decisions_total Hook invocations by decision.",
+        "# TYPE docsearch_decisions_total counter",
+    ]
+    for decision, count in sorted(totals["decisions"].items()):
+        lines.append(f'docsearch_decisions_total{{decision="{escape_label_value(decision)}"}} {count}')
+    lines += [
+        "# HELP docsearch_database_matches_total Denied calls that matched each database.",
+        "# TYPE docsearch_database_matches_total counter",
+    ]
+    for label, count in sorted(totals["databases"].items()):
+        lines.append(f'docsearch_database_matches_total{{database="{escape_label_value(label)}"}} {count}')
+    lines += [
+        "# HELP docsearch_hook_duration_seconds PreToolUse hook run time.",
+        "# TYPE docsearch_hook_duration_seconds histogram",
+    ]
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, totals["buckets"]):
+        cumulative += count
+        lines.append(f'docsearch_hook_duration_seconds_bucket{{le="{bound}"}} {cumulative}')
+    lines += [
+        f'docsearch_hook_duration_seconds_bucket{{le="+Inf"}} {totals["count"]}',
+        f"docsearch_hook_duration_seconds_sum {totals['duration_sum']:.6f}",
+        f"docsearch_hook_duration_seconds_count {totals['count']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def render_metrics(metrics_file: Path) -> None:
+    """Fold the spool into the aggregated totals and rewrite the .prom file.
+
+    Only one hook renders at a time; others skip rather than wait.
+    """
+    state_dir = get_state_dir()
+    totals_file = state_dir / "docsearch-metrics.json"
+    lock_fd = os.open(state_dir / "docsearch-metrics.lock", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        totals = read_json_index(totals_file) or new_metrics_totals()
+
+        with open(state_dir / "docsearch-metrics.spool", "r+") as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            lines = spool.read().splitlines()
+            spool.truncate(0)
+        merge_metrics_spool(totals, lines)
+
+        write_json_atomic(totals_file, totals)
+
+        tmp_file = metrics_file.with_name(f".{metrics_file.name}.{os.getpid()}")
+        tmp_file.write_text(format_prometheus(totals))
+        os.replace(tmp_file, metrics_file)
+    finally:
+        os.close(lock_fd)
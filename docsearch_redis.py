@@ -0,0 +1,195 @@
+"""
+Redis session state backend for the DocSearch hook (DOCSEARCH_STATE_BACKEND=redis://...).
+"""
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from docsearch_hook import (
+    SESSION_SLOT_EXPIRY_SECONDS,
+    STATE_EXPIRY_SECONDS,
+    get_state_dir,
+    read_json_index,
+    sanitize_session_id,
+    write_json_atomic,
+)
+
+
+class RedisError(Exception):
+    """Raised for Redis protocol errors and error replies."""
+
+
+class RedisConnection:
+    """One Redis connection speaking RESP over a socket."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        # Imported here so the default file backend doesn't pay for it
+        import socket
+
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def command(self, *args: str | bytes):
+        """Send a command and return its reply."""
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise RedisError("connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode(errors="replace"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise RedisError("connection closed")
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self.read_reply() for _ in range(length)]
+        raise RedisError(f"unexpected reply {line[:20]!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+# Redis operations must never hold up the hook for long
+DEFAULT_REDIS_TIMEOUT_MS = 100
+
+# After a failure, the backend isn't tried again for this long
+REDIS_RETRY_AFTER_SECONDS = 30
+
+
+def get_backoff_file() -> Path:
+    """Get the file recording until when each failed Redis server is left alone.
+
+    Every hook call is a new process, so the backoff has to outlive it.
+    """
+    return get_state_dir() / "docsearch-redis-backoff.json"
+
+
+class RedisStateBackend:
+    """Session state in Redis, shared by hooks on every host using it.
+
+    Each session's state is one key, written with an expiry (the escape-hatch
+    window, or a day for an empty slot), so Redis does the cleanup. Idle
+    connections are pooled for reuse within a process and every operation
+    has a short timeout. Any failure fails open - loads return no state,
+    saves are dropped and the backend reports itself down (see is_down) -
+    and no hook on this host tries the server again for a while.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = parts.path.strip("/") or "0"
+        self.prefix = "docsearch:state:"
+        self.timeout = timeout
+        self.idle: list[RedisConnection] = []
+        self.lock = threading.Lock()
+        # Servers are told apart without the password, which stays out of the state dir
+        self.server = f"{self.host}:{self.port}/{self.db}"
+        down_until = read_json_index(get_backoff_file()).get(self.server, 0.0)
+        self.down_until = down_until if isinstance(down_until, (int, float)) else 0.0
+
+    def is_down(self) -> bool:
+        """Whether the server failed recently and isn't being tried."""
+        return time.time() < self.down_until
+
+    def back_off(self) -> None:
+        """Leave the server alone for REDIS_RETRY_AFTER_SECONDS, in every hook on this host."""
+        now = time.time()
+        self.down_until = now + REDIS_RETRY_AFTER_SECONDS
+        backoff_file = get_backoff_file()
+        index = {
+            server: until for server, until in read_json_index(backoff_file).items()
+            if isinstance(until, (int, float)) and until > now
+        }
+        index[self.server] = self.down_until
+        write_json_atomic(backoff_file, index)
+
+    def connect(self) -> RedisConnection:
+        connection = RedisConnection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                connection.command("AUTH", self.password)
+            if self.db != "0":
+                connection.command("SELECT", self.db)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def execute(self, *args: str | bytes, default=None):
+        """Run a command on a pooled connection, failing open to default."""
+        if self.is_down():
+            return default
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        try:
+            if connection is None:
+                connection = self.connect()
+            reply = connection.command(*args)
+        except (OSError, ValueError, RedisError) as e:
+            if connection is not None:
+                connection.close()
+            self.back_off()
+            print(f"Warning: State backend {self.host}:{self.port} unavailable ({e}); "
+                  f"letting searches through for {REDIS_RETRY_AFTER_SECONDS} seconds", file=sys.stderr)
+            return default
+        except BaseException:
+            # Interrupted (say, by the budget timer) mid-reply: the connection can't be reused
+            if connection is not None:
+                connection.close()
+            raise
+        with self.lock:
+            self.idle.append(connection)
+        return reply
+
+    def key(self, session_id: str) -> str:
+        return self.prefix + sanitize_session_id(session_id)
+
+    def load(self, session_id: str) -> dict:
+        data = self.execute("GET", self.key(session_id))
+        if data is None:
+            return {}
+        try:
+            state = json.loads(data)
+        except ValueError:
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def save(self, session_id: str, state: dict) -> None:
+        ttl = STATE_EXPIRY_SECONDS if state.get("last_denied") else SESSION_SLOT_EXPIRY_SECONDS
+        self.execute("SET", self.key(session_id), json.dumps(state), "EX", str(ttl))
+
+    def exists(self, session_id: str) -> bool:
+        # Unknown counts as existing, so an unreachable server doesn't trigger cleanup work
+        return bool(self.execute("EXISTS", self.key(session_id), default=1))
+
+    def cleanup(self, deadline: float | None = None) -> None:
+        pass  # Keys expire in Redis
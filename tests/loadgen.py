@@ -0,0 +1,254 @@
+"""Multi-session load generator for the hook's state store.
+
+Simulates concurrent Claude sessions, each issuing WebSearch calls at a fixed
+rate against the real hook entry point (one docsearch.py process per call, as
+Claude Code runs it). A share of the queries match a configured database, and
+a share of the denied ones are retried to exercise the escape hatch. Sessions
+are replaced with fresh session IDs after --session-lifetime seconds, the way
+agents come and go on a busy host.
+
+Every --interval seconds it reports throughput, latency tails, the number of
+files in the state directory and the cost of one stale-state cleanup pass:
+
+    python tests/loadgen.py --sessions 24 --rate 2 --duration 120
+
+Pass hook settings (say, a different state backend) with --env KEY=VALUE.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import docsearch  # noqa: E402
+
+HOOK_SCRIPT = Path(__file__).parent.parent / "docsearch.py"
+DEFAULT_CONFIG = Path(__file__).parent / "fixtures" / "valid_config.json"
+
+FILLER_WORDS = [
+    "how", "to", "configure", "runner", "cache", "deploy", "pipeline", "error", "timeout", "install",
+    "python", "rust", "async", "weather", "recipe", "upgrade", "permissions", "volume", "ingress", "logs",
+]
+
+
+def percentile(sorted_values: list[float], quantile: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(len(sorted_values) * quantile + 0.5), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def generate_query(rng: random.Random, keywords: list[str], match_ratio: float) -> str:
+    """Build a query that contains a configured keyword with probability match_ratio."""
+    words = rng.sample(FILLER_WORDS, rng.randint(2, 4))
+    if keywords and rng.random() < match_ratio:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+    return " ".join(words)
+
+
+def session_rng(seed: int, index: int) -> random.Random:
+    """Return a session's random source: reproducible per seed, independent per session."""
+    return random.Random(f"{seed}-{index}")
+
+
+def count_state_files(state_dir: Path) -> tuple[int, int]:
+    """Return the number of files in the state directory and their total size."""
+    files = size = 0
+    try:
+        with os.scandir(state_dir) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    files += 1
+                    size += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return files, size
+
+
+def time_cleanup() -> float:
+    """Time one stale-state cleanup pass, in milliseconds, as the hook runs it."""
+    started = time.perf_counter()
+    docsearch.cleanup_stale_state_files()
+    return (time.perf_counter() - started) * 1000
+
+
+class LoadGenerator:
+    """Drives the simulated sessions and collects per-call results."""
+
+    def __init__(self, options: argparse.Namespace, env: dict, keywords: list[str]):
+        self.options = options
+        self.env = env
+        self.keywords = keywords
+        self.lock = threading.Lock()
+        self.results: list[tuple[float, str]] = []  # (latency ms, outcome) since the last report
+        self.stop_at = 0.0
+
+    def call_hook(self, session_id: str, query: str) -> tuple[float, int]:
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": query}, "session_id": session_id}
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, str(HOOK_SCRIPT)],
+            input=json.dumps(hook_input),
+            capture_output=True,
+            text=True,
+            env=self.env,
+        )
+        return (time.perf_counter() - started) * 1000, result.returncode
+
+    def run_session(self, index: int, seed: int) -> None:
+        rng = session_rng(seed, index)
+        options = self.options
+        generation = 0
+        session_id = f"loadgen-{seed}-{index}-{generation}"
+        session_started = time.monotonic()
+        next_call = session_started + rng.random() / options.rate
+        retry_query = None
+        while True:
+            now = time.monotonic()
+            if next_call >= self.stop_at:
+                return
+            if next_call > now:
+                time.sleep(next_call - now)
+            next_call += 1 / options.rate
+
+            if options.session_lifetime and time.monotonic() - session_started > options.session_lifetime:
+                generation += 1
+                session_id = f"loadgen-{seed}-{index}-{generation}"
+                session_started = time.monotonic()
+                retry_query = None
+
+            if retry_query is not None:
+                query, retry_query = retry_query, None
+                latency, exit_code = self.call_hook(session_id, query)
+                outcome = "retry_allowed" if exit_code == 0 else "retry_denied"
+            else:
+                query = generate_query(rng, self.keywords, options.match_ratio)
+                latency, exit_code = self.call_hook(session_id, query)
+                outcome = {0: "pass", 2: "deny"}.get(exit_code, "error")
+                if exit_code == 2 and rng.random() < options.retry_ratio:
+                    retry_query = query
+            with self.lock:
+                self.results.append((latency, outcome))
+
+    def take_results(self) -> list[tuple[float, str]]:
+        with self.lock:
+            results, self.results = self.results, []
+        return results
+
+
+def summarize(results: list[tuple[float, str]], seconds: float) -> dict:
+    """Summarize a batch of (latency, outcome) results over a period."""
+    latencies = sorted(latency for latency, _ in results)
+    outcomes: dict[str, int] = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        "calls": len(results),
+        "calls_per_second": len(results) / seconds if seconds > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "outcomes": outcomes,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions (default: 8)")
+    parser.add_argument("--rate", type=float, default=1.0, help="WebSearch calls per second per session (default: 1)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (default: 30)")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between reports (default: 5)")
+    parser.add_argument("--match-ratio", type=float, default=0.5, help="share of queries that match (default: 0.5)")
+    parser.add_argument("--retry-ratio", type=float, default=0.3, help="share of denies retried (default: 0.3)")
+    parser.add_argument(
+        "--session-lifetime", type=float, default=0.0, help="seconds before a session is replaced (default: never)"
+    )
+    parser.add_argument("--config", default=str(DEFAULT_CONFIG), help="hook config (default: the test fixture)")
+    parser.add_argument("--state-dir", help="state directory (default: a fresh temporary directory)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra hook environment")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print each report as a JSON line")
+    options = parser.parse_args(argv)
+
+    state_dir = Path(options.state_dir or tempfile.mkdtemp(prefix="docsearch-loadgen-"))
+    env = {
+        **os.environ,
+        "DOCSEARCH_CONFIG_PATH": options.config,
+        "DOCSEARCH_STATE_DIR": str(state_dir),
+        "DOCSEARCH_CLAUDE_JSON": str(state_dir / "no-claude.json"),
+    }
+    for setting in options.env:
+        key, _, value = setting.partition("=")
+        env[key] = value
+    # The in-process cleanup timing must see the same state directory
+    os.environ.update({key: env[key] for key in env if key.startswith("DOCSEARCH_")})
+
+    config = docsearch.load_config(Path(options.config)) or {}
+    keywords = [keyword for db in docsearch.validate_config(config) for keyword in db["keywords"]]
+    generator = LoadGenerator(options, env, keywords)
+
+    started = time.monotonic()
+    generator.stop_at = started + options.duration
+    threads = [
+        threading.Thread(target=generator.run_session, args=(i, options.seed), daemon=True)
+        for i in range(options.sessions)
+    ]
+    for thread in threads:
+        thread.start()
+
+    if not options.json:
+        print(f"State directory: {state_dir}")
+        print(
+            f"{'time s':>7} {'calls':>6} {'calls/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+            f"{'max ms':>7} {'files':>6} {'KiB':>7} {'cleanup ms':>10}"
+        )
+    all_results = []
+    last_report = started
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=max(last_report + options.interval - time.monotonic(), 0))
+        now = time.monotonic()
+        if now - last_report < options.interval and any(thread.is_alive() for thread in threads):
+            continue
+        results = generator.take_results()
+        all_results.extend(results)
+        report = summarize(results, now - last_report)
+        report["elapsed_s"] = now - started
+        report["state_files"], state_bytes = count_state_files(state_dir)
+        report["state_kib"] = state_bytes / 1024
+        report["cleanup_ms"] = time_cleanup()
+        last_report = now
+        if options.json:
+            print(json.dumps(report), flush=True)
+        else:
+            print(
+                f"{report['elapsed_s']:>7.1f} {report['calls']:>6} {report['calls_per_second']:>8.1f} "
+                f"{report['p50_ms']:>7.1f} {report['p95_ms']:>7.1f} {report['p99_ms']:>7.1f} {report['max_ms']:>7.1f} "
+                f"{report['state_files']:>6} {report['state_kib']:>7.1f} {report['cleanup_ms']:>10.2f}",
+                flush=True,
+            )
+
+    total = summarize(all_results, time.monotonic() - started)
+    if options.json:
+        print(json.dumps({"total": total}))
+    else:
+        print(
+            f"Total: {total['calls']} calls, {total['calls_per_second']:.1f} calls/s, "
+            f"p50 {total['p50_ms']:.1f} ms, p95 {total['p95_ms']:.1f} ms, p99 {total['p99_ms']:.1f} ms, "
+            f"max {total['max_ms']:.1f} ms"
+        )
+        print("Outcomes: " + ", ".join(f"{name} {count}" for name, count in sorted(total["outcomes"].items())))
+    return 1 if total["outcomes"].get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Differential fuzz and throughput harness for keyword matcher engines.
+
+The original per-keyword regex matcher, docsearch.find_matching_databases, is
+the oracle: any faster engine must return exactly the same databases for every
+query, including the edges around keywords like c++, .net and c#, punctuation
+and Unicode.
+
+An engine is a factory that takes a list of database configs and returns a
+function mapping a query to the list of matching databases. Register new
+engines in ENGINES.
+
+Run directly for a throughput and memory report:
+
+    python tests/matcher_harness.py --sizes 10 100 1000
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import docsearch  # noqa: E402
+
+# Keywords that exercise the non-word-boundary handling in build_keyword_pattern
+ADVERSARIAL_KEYWORDS = [
+    "c++", ".net", "c#", "f#", "node.js", "asp.net", "gitlab-ci", "k8s", "a", "-", "++", "#",
+    ".", "vue.js", "c", "go", "r", "straße", "İstanbul", "ıi", "日本", "naïve", "co-op", "x86_64",
+]
+
+# Characters queries are assembled from, around and between keywords
+QUERY_PIECES = [
+    " ", " ", " ", "\t", "\n", " ", "　", ".", ",", "-", "_", "+", "#", "/", "(", ")", "'", '"',
+    "?", "!", ":", "é", "ß", "İ", "ı", "日", "x", "y", "z", "1", "2",
+]
+
+WORD_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789+#.-_éßİı日"
+
+
+def random_word(rng: random.Random) -> str:
+    """Return a random keyword-like token."""
+    return "".join(rng.choice(WORD_ALPHABET) for _ in range(rng.randint(1, 8)))
+
+
+def generate_databases(rng: random.Random, keyword_count: int, per_database: int = 5) -> list[dict]:
+    """Generate databases holding keyword_count random and adversarial keywords."""
+    keywords = []
+    while len(keywords) < keyword_count:
+        keyword = rng.choice(ADVERSARIAL_KEYWORDS) if rng.random() < 0.3 else random_word(rng)
+        if rng.random() < 0.3:
+            keyword = keyword.upper() if rng.random() < 0.5 else keyword.title()
+        keywords.append(keyword)
+    return [
+        {
+            "keywords": keywords[i:i + per_database],
+            "path": f"/db/{i}",
+            "mcp_tool_name": "leann-docs",
+            "description": f"db {i}",
+        }
+        for i in range(0, len(keywords), per_database)
+    ]
+
+
+def generate_query(rng: random.Random, databases: list[dict]) -> str:
+    """Generate a query mixing keywords, near-misses and noise."""
+    parts = []
+    for _ in range(rng.randint(0, 6)):
+        roll = rng.random()
+        if roll < 0.4 and databases:
+            keyword = rng.choice(rng.choice(databases)["keywords"])
+            if rng.random() < 0.3:
+                keyword = keyword.swapcase()
+            parts.append(keyword)
+        elif roll < 0.7:
+            parts.append(random_word(rng))
+        else:
+            parts.append("".join(rng.choice(QUERY_PIECES) for _ in range(rng.randint(1, 3))))
+        parts.append(rng.choice(QUERY_PIECES))
+    return "".join(parts)
+
+
+def oracle_engine(databases: list[dict]):
+    """The reference matcher: one regex search per keyword."""
+    config = {"databases": databases}
+    return lambda query: docsearch.find_matching_databases(query, config)
+
+
+def compiled_keyword_engine(databases: list[dict]):
+    """The hook's compiled keyword strategy: one alternation per database."""
+    compiled = docsearch.compile_config([{**db, "strategies": ["keyword"]} for db in databases])
+    return lambda query: docsearch.route_search({"query": query}, compiled)
+
+
+def keyword_index_engine(databases: list[dict]):
+    """The persisted matcher's binary keyword index, searched through an mmap."""
+    with tempfile.NamedTemporaryFile(suffix=".idx", delete=False) as f:
+        f.write(docsearch.build_keyword_index(databases, [[["keyword", None]] for _ in databases]))
+    index = docsearch.KeywordIndex(Path(f.name))
+    Path(f.name).unlink()
+    return lambda query: [databases[slot] for slot in sorted(index.find(query.lower()))]
+
+
+ENGINES = {
+    "oracle": oracle_engine,
+    "compiled-keyword": compiled_keyword_engine,
+    "keyword-index": keyword_index_engine,
+}
+
+
+def differential_check(engine_name: str, seed: int, keyword_count: int, query_count: int) -> list[tuple]:
+    """Compare an engine against the oracle on generated data.
+
+    Returns (query, expected descriptions, actual descriptions) per mismatch.
+    """
+    rng = random.Random(seed)
+    databases = generate_databases(rng, keyword_count)
+    oracle = oracle_engine(databases)
+    candidate = ENGINES[engine_name](databases)
+    mismatches = []
+    for _ in range(query_count):
+        query = generate_query(rng, databases)
+        expected = [db["description"] for db in oracle(query)]
+        actual = [db["description"] for db in candidate(query)]
+        if expected != actual:
+            mismatches.append((query, expected, actual))
+    return mismatches
+
+
+def measure_engine(engine_name: str, keyword_count: int, query_count: int, seed: int = 0) -> dict:
+    """Measure an engine's build time, match throughput and peak memory."""
+    rng = random.Random(seed)
+    databases = generate_databases(rng, keyword_count)
+    queries = [generate_query(rng, databases) for _ in range(query_count)]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    engine = ENGINES[engine_name](databases)
+    engine(queries[0] if queries else "")
+    built = time.perf_counter()
+    for query in queries:
+        engine(query)
+    finished = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    match_seconds = max(finished - built, 1e-9)
+    return {
+        "engine": engine_name,
+        "keywords": keyword_count,
+        "queries": query_count,
+        "build_ms": (built - started) * 1000,
+        "matches_per_second": query_count / match_seconds,
+        "peak_memory_kib": peak / 1024,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000], help="keyword-set sizes")
+    parser.add_argument("--queries", type=int, default=2000, help="queries per measurement")
+    parser.add_argument("--fuzz-seeds", type=int, default=20, help="differential check seeds per engine")
+    options = parser.parse_args(argv)
+
+    failed = False
+    for engine_name in options.engines:
+        if engine_name == "oracle":
+            continue
+        for seed in range(options.fuzz_seeds):
+            mismatches = differential_check(engine_name, seed, 50, 500)
+            for query, expected, actual in mismatches[:5]:
+                failed = True
+                print(f"MISMATCH {engine_name} seed={seed} query={query!r} expected={expected} actual={actual}")
+
+    print(f"{'engine':<20} {'keywords':>8} {'build ms':>10} {'matches/s':>12} {'peak KiB':>10}")
+    for size in options.sizes:
+        for engine_name in options.engines:
+            result = measure_engine(engine_name, size, options.queries)
+            print(
+                f"{engine_name:<20} {size:>8} {result['build_ms']:>10.2f} "
+                f"{result['matches_per_second']:>12.0f} {result['peak_memory_kib']:>10.1f}"
+            )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
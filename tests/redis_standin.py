@@ -0,0 +1,113 @@
+"""In-process stand-in for a Redis server, for testing the Redis state backend.
+
+Speaks enough RESP for the hook: PING, AUTH, SELECT, GET, SET (with EX),
+EXISTS, DEL and TTL, with a dict store per database and expiry checked on
+read. Set stall = True to accept commands and never answer them.
+
+    with RedisStandIn() as server:
+        env["DOCSEARCH_STATE_BACKEND"] = server.url
+"""
+import socketserver
+import threading
+import time
+
+
+class RedisStandIn:
+    def __init__(self, password: str | None = None):
+        self.password = password
+        self.stall = False
+        self.databases: dict[str, dict[bytes, tuple[bytes, float | None]]] = {}
+        self.commands: list[list[bytes]] = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.server.server_address[1]}/0"
+
+    def __enter__(self) -> "RedisStandIn":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, key: bytes, db: str = "0") -> bytes | None:
+        with self.lock:
+            value, expires = self.databases.get(db, {}).get(key, (None, None))
+        if expires is not None and time.time() >= expires:
+            return None
+        return value
+
+    def make_handler(self):
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with standin.lock:
+                    standin.connections += 1
+                db = "0"
+                authenticated = standin.password is None
+                while True:
+                    args = self.read_command()
+                    if args is None:
+                        return
+                    with standin.lock:
+                        standin.commands.append(args)
+                    if standin.stall:
+                        continue
+                    name = args[0].upper()
+                    if name == b"AUTH":
+                        authenticated = args[1].decode() == standin.password
+                        self.reply(b"+OK\r\n" if authenticated else b"-WRONGPASS invalid password\r\n")
+                    elif not authenticated:
+                        self.reply(b"-NOAUTH Authentication required.\r\n")
+                    elif name == b"PING":
+                        self.reply(b"+PONG\r\n")
+                    elif name == b"SELECT":
+                        db = args[1].decode()
+                        self.reply(b"+OK\r\n")
+                    elif name == b"GET":
+                        value = standin.get(args[1], db)
+                        self.reply(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+                    elif name == b"SET":
+                        expires = None
+                        if len(args) >= 5 and args[3].upper() == b"EX":
+                            expires = time.time() + int(args[4])
+                        with standin.lock:
+                            standin.databases.setdefault(db, {})[args[1]] = (args[2], expires)
+                        self.reply(b"+OK\r\n")
+                    elif name == b"EXISTS":
+                        self.reply(b":%d\r\n" % sum(standin.get(key, db) is not None for key in args[1:]))
+                    elif name == b"DEL":
+                        with standin.lock:
+                            removed = sum(standin.databases.get(db, {}).pop(key, None) is not None for key in args[1:])
+                        self.reply(b":%d\r\n" % removed)
+                    elif name == b"TTL":
+                        with standin.lock:
+                            value, expires = standin.databases.get(db, {}).get(args[1], (None, None))
+                        ttl = -2 if value is None else -1 if expires is None else int(expires - time.time())
+                        self.reply(b":%d\r\n" % ttl)
+                    else:
+                        self.reply(b"-ERR unknown command\r\n")
+
+            def read_command(self) -> list[bytes] | None:
+                line = self.rfile.readline()
+                if not line.startswith(b"*"):
+                    return None
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                return args
+
+            def reply(self, data: bytes) -> None:
+                self.wfile.write(data)
+                self.wfile.flush()
+
+        return Handler
@@ -4,11 +4,27 @@ import os
 import subprocess
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pytest
+from redis_standin import RedisStandIn
+
 HOOK_SCRIPT = Path(__file__).parent.parent / "docsearch.py"
 FIXTURES_DIR = Path(__file__).parent / "fixtures"
 
+sys.path.insert(0, str(HOOK_SCRIPT.parent))
+
+import docsearch  # noqa: E402
+import docsearch_redis  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_state_dir(tmp_path, monkeypatch):
+    """Keep hook runs that don't pick a state dir out of ~/.claude/hooks, and away from ~/.claude.json."""
+    monkeypatch.setenv("DOCSEARCH_STATE_DIR", str(tmp_path / "default-state"))
+    monkeypatch.setenv("DOCSEARCH_CLAUDE_JSON", str(tmp_path / "no-claude.json"))
+
 
 def run_hook(stdin_data: dict, env: dict | None = None) -> tuple[int, str, str]:
     """Run the hook script with given stdin and return (exit_code, stdout, stderr)."""
@@ -22,6 +38,18 @@ def run_hook(stdin_data: dict, env: dict | None = None) -> tuple[int, str, str]:
     return result.returncode, result.stdout, result.stderr
 
 
+def run_command(args: list[str], stdin_data: dict | None = None, env: dict | None = None) -> tuple[int, str, str]:
+    """Run a docsearch.py subcommand and return (exit_code, stdout, stderr)."""
+    result = subprocess.run(
+        [sys.executable, str(HOOK_SCRIPT), *args],
+        input=json.dumps(stdin_data or {}),
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    return result.returncode, result.stdout, result.stderr
+
+
 class TestInputParsing:
     """Tests for hook input parsing."""
 
@@ -1077,4 +1105,1858 @@ class TestPermissionErrors:
             # Should still deny (state write failure is silent)
             assert exit_code == 2
         finally:
-            state_dir.chmod(0o755)  # Restore for cleanup
\ No newline at end of file
+            state_dir.chmod(0o755)  # Restore for cleanup
+
+
+class TestSessionStartHook:
+    """Tests for the session-start entry point."""
+
+    def test_session_start_persists_compiled_matcher_and_slot(self, tmp_path):
+        """session-start should write the compiled matcher and the session's state slot."""
+        state_dir = tmp_path / "state"
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+            "DOCSEARCH_STATE_DIR": str(state_dir),
+        }
+        exit_code, stdout, stderr = run_command(["session-start"], {"session_id": "start-1"}, env=env)
+        assert exit_code == 0
+
+        [compiled_file] = state_dir.glob("docsearch-compiled-*.json")
+        compiled = json.loads(compiled_file.read_text())
+        assert [db["description"] for db in compiled["databases"]] == [
+            "GitLab documentation",
+            "Kubernetes documentation",
+        ]
+        state = json.loads((state_dir / "docsearch-state-start-1.json").read_text())
+        assert state == {"last_denied": None}
+
+        # PreToolUse uses the compiled matcher
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "start-1"},
+            env=env,
+        )
+        assert exit_code == 2
+
+    def test_session_start_prunes_expired_state(self, tmp_path):
+        """session-start should prune expired state files."""
+        state_dir = tmp_path / "state"
+        state_dir.mkdir()
+        stale_file = state_dir / "docsearch-state-stale.json"
+        stale_file.write_text(json.dumps({
+            "last_denied": {"query": "old", "timestamp": int(time.time()) - 400}
+        }))
+        exit_code, stdout, stderr = run_command(
+            ["session-start"],
+            {"session_id": "start-2"},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+                "DOCSEARCH_STATE_DIR": str(state_dir),
+            },
+        )
+        assert exit_code == 0
+        assert not stale_file.exists()
+
+    def test_stale_compiled_matcher_is_ignored(self, tmp_path):
+        """Editing the config after session-start should invalidate the compiled matcher."""
+        state_dir = tmp_path / "state"
+        config_file = tmp_path / "config.json"
+        config_file.write_text((FIXTURES_DIR / "valid_config.json").read_text())
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(config_file),
+            "DOCSEARCH_STATE_DIR": str(state_dir),
+        }
+        run_command(["session-start"], {"session_id": "start-3"}, env=env)
+
+        config = json.loads(config_file.read_text())
+        config["databases"][0]["keywords"] = ["terraform"]
+        config_file.write_text(json.dumps(config))
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "terraform modules"}, "session_id": "start-3"},
+            env=env,
+        )
+        assert exit_code == 2
+
+
+class TestEntryPoint:
+    """Tests for keeping the per-call work of docsearch.py small."""
+
+    def imported_modules(self, stderr: str) -> set[str]:
+        """Module names from PYTHONPROFILEIMPORTTIME output."""
+        return {line.rsplit("|", 1)[1].strip() for line in stderr.splitlines() if line.startswith("import time:")}
+
+    def test_hook_imports_only_the_hook_module(self):
+        """A PreToolUse call shouldn't load the by-hand commands or their dependencies."""
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"), "PYTHONPROFILEIMPORTTIME": "1"}
+        exit_code, stdout, stderr = run_hook({"tool_name": "WebSearch", "tool_input": {"query": "kubectl"}}, env=env)
+        assert exit_code == 2
+        modules = self.imported_modules(stderr)
+        assert "docsearch_hook" in modules
+        assert not modules & {"docsearch_cli", "docsearch_metrics", "docsearch_redis", "argparse"}
+
+    def test_commands_run_through_the_entry_point(self, tmp_path):
+        """By-hand commands are still run as docsearch.py <command>."""
+        env = {**os.environ, "DOCSEARCH_DECISION_LOG": str(tmp_path / "decisions.log")}
+        exit_code, stdout, stderr = run_command(["stats", "--json"], env=env)
+        assert exit_code == 0
+        assert json.loads(stdout)["invocations"] == 0
+
+
+class TestWebFetchInterception:
+    """Tests for WebFetch interception by documentation domain."""
+
+    def test_fetch_of_configured_domain_denies(self):
+        """WebFetch of a configured domain should be denied with RAG guidance."""
+        hook_input = {
+            "tool_name": "WebFetch",
+            "tool_input": {"url": "https://docs.gitlab.com/ee/ci/yaml/", "prompt": "summarize"},
+        }
+        exit_code, stdout, stderr = run_hook(
+            hook_input,
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")},
+        )
+        assert exit_code == 2
+        output = json.loads(stdout)["hookSpecificOutput"]
+        assert output["permissionDecisionReason"] == "URL matches 'docs.gitlab.com' - using RAG database instead"
+        assert "Repeat the Web Fetch tool call" in output["additionalContext"]
+
+    def test_fetch_matches_subdomains_only_on_label_boundaries(self):
+        """Subdomains match, but look-alike hosts do not."""
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")}
+        for url, expected in [
+            ("https://v1-29.kubernetes.io/docs/", 2),
+            ("https://KUBERNETES.IO/docs/", 2),
+            ("https://notkubernetes.io/docs/", 0),
+            ("https://kubernetes.io.evil.com/", 0),
+            ("https://gitlab.com/explore", 0),
+        ]:
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebFetch", "tool_input": {"url": url}}, env=env
+            )
+            assert exit_code == expected, f"Failed for url: {url}"
+
+    def test_fetch_of_host_with_empty_label_allows_through(self):
+        """A malformed host should not reach the trie's terminal entries."""
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")}
+        for url in ["https://x..kubernetes.io/x", "https://..kubernetes.io/", "https://docs.gitlab.com../"]:
+            exit_code, stdout, stderr = run_hook({"tool_name": "WebFetch", "tool_input": {"url": url}}, env=env)
+            assert exit_code in (0, 2), f"Failed for url: {url}"
+            assert "Traceback" not in stderr
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebFetch", "tool_input": {"url": "https://x..kubernetes.io/x"}}, env=env
+        )
+        assert exit_code == 0
+
+    def test_configured_domain_with_empty_label_is_skipped(self, tmp_path):
+        config_file = write_config(tmp_path, domains=["docs..gitlab.com", "docs.gitlab.com"])
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file), "DOCSEARCH_STATE_DIR": str(tmp_path / "state")}
+        assert run_hook({"tool_name": "WebFetch", "tool_input": {"url": "https://docs.gitlab.com/"}}, env=env)[0] == 2
+        assert run_hook({"tool_name": "WebFetch", "tool_input": {"url": "https://gitlab.com/"}}, env=env)[0] == 0
+
+    def test_fetch_retry_allows_through(self, tmp_path):
+        """Retrying the same URL should use the escape hatch."""
+        state_dir = tmp_path / "state"
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+            "DOCSEARCH_STATE_DIR": str(state_dir),
+        }
+        hook_input = {
+            "tool_name": "WebFetch",
+            "tool_input": {"url": "https://kubernetes.io/docs/concepts/", "prompt": "what is a pod"},
+            "session_id": "fetch-session",
+        }
+        assert run_hook(hook_input, env=env)[0] == 2
+
+        hook_input["tool_input"]["prompt"] = "explain pods"
+        assert run_hook(hook_input, env=env)[0] == 0
+
+    def test_fetch_state_does_not_unlock_search(self, tmp_path):
+        """A denied fetch should not let an unrelated WebSearch through."""
+        state_dir = tmp_path / "state"
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+            "DOCSEARCH_STATE_DIR": str(state_dir),
+        }
+        run_hook(
+            {"tool_name": "WebFetch", "tool_input": {"url": "https://kubernetes.io/"}, "session_id": "mixed"},
+            env=env,
+        )
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "kubernetes pods"}, "session_id": "mixed"},
+            env=env,
+        )
+        assert exit_code == 2
+
+    def test_domains_not_array_logs_warning(self, tmp_path):
+        """Non-list domains should be rejected with a warning."""
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps({
+            "databases": [{
+                "keywords": ["gitlab"],
+                "domains": "docs.gitlab.com",
+                "path": "/test",
+                "mcp_tool_name": "test",
+                "description": "test",
+            }]
+        }))
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 0
+        assert "'domains' must be a list of strings" in stderr
+
+
+class TestSearchDomainRouting:
+    """Tests for routing WebSearch on allowed_domains/blocked_domains."""
+
+    def test_allowed_domain_routes_without_keyword(self):
+        """A search restricted to a documentation domain should match its database."""
+        hook_input = {
+            "tool_name": "WebSearch",
+            "tool_input": {"query": "cache between jobs", "allowed_domains": ["docs.gitlab.com"]},
+        }
+        exit_code, stdout, stderr = run_hook(
+            hook_input,
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")},
+        )
+        assert exit_code == 2
+        assert "GitLab documentation" in json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+
+    def test_allowed_subdomain_routes(self):
+        """Subdomains of a documentation domain should match too."""
+        hook_input = {
+            "tool_name": "WebSearch",
+            "tool_input": {"query": "pod lifecycle", "allowed_domains": ["v1-29.kubernetes.io"]},
+        }
+        exit_code, stdout, stderr = run_hook(
+            hook_input,
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")},
+        )
+        assert exit_code == 2
+
+    def test_blocked_domain_suppresses_database(self):
+        """Blocking a database's domain (or a parent of it) should suppress the database."""
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")}
+        for blocked in (["docs.gitlab.com"], ["gitlab.com"]):
+            hook_input = {
+                "tool_name": "WebSearch",
+                "tool_input": {"query": "gitlab ci cache", "blocked_domains": blocked},
+            }
+            exit_code, stdout, stderr = run_hook(hook_input, env=env)
+            assert exit_code == 0, f"Failed for blocked: {blocked}"
+
+    def test_blocked_domain_keeps_other_databases(self):
+        """Blocking one database's domain should not suppress other matches."""
+        hook_input = {
+            "tool_name": "WebSearch",
+            "tool_input": {"query": "gitlab kubernetes runner", "blocked_domains": ["docs.gitlab.com"]},
+        }
+        exit_code, stdout, stderr = run_hook(
+            hook_input,
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")},
+        )
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert "Kubernetes documentation" in context
+        assert "GitLab documentation" not in context
+
+    def test_domains_with_empty_labels_are_ignored(self):
+        """Malformed allowed or blocked domains should neither route nor crash the hook."""
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")}
+        for tool_input, expected in [
+            ({"query": "rust book", "blocked_domains": ["x..kubernetes.io"]}, 0),
+            ({"query": "kubectl logs", "blocked_domains": ["x..kubernetes.io", ".."]}, 2),
+            ({"query": "pod lifecycle", "allowed_domains": ["x..kubernetes.io"]}, 0),
+        ]:
+            exit_code, stdout, stderr = run_hook({"tool_name": "WebSearch", "tool_input": tool_input}, env=env)
+            assert exit_code == expected, f"Failed for: {tool_input}"
+            assert "Traceback" not in stderr
+
+
+class TestLatencyBudget:
+    """Tests for the fail-open latency budget."""
+
+    def test_exhausted_budget_allows_through(self, tmp_path):
+        """A matching search should be allowed through when the budget runs out."""
+        hook_input = {
+            "tool_name": "WebSearch",
+            "tool_input": {"query": "gitlab ci"},
+            "session_id": "budget-session",
+        }
+        exit_code, stdout, stderr = run_hook(
+            hook_input,
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+                "DOCSEARCH_BUDGET_MS": "0.001",
+            },
+        )
+        assert exit_code == 0
+        assert stdout == ""
+        assert "exceeded its latency budget" in stderr
+
+    def test_cold_compile_is_persisted_despite_budget(self, tmp_path):
+        """A compile longer than the budget should still be saved, so later calls are fast."""
+        databases = [
+            {"keywords": [f"kw{n}x{i}" for i in range(2000)], "path": f"/db/{n}",
+             "mcp_tool_name": "leann-docs", "description": f"Database {n}"}
+            for n in range(20)
+        ]
+        databases[0]["keywords"].append("gitlab")
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps({"databases": databases}))
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(config_file),
+            "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            "DOCSEARCH_BUDGET_MS": "50",
+        }
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "cold-1"}, env=env
+        )
+        assert exit_code == 0
+        assert "exceeded its latency budget" in stderr
+        assert list((tmp_path / "state").glob("docsearch-compiled-*.json"))
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "cold-2"},
+            env={**env, "DOCSEARCH_BUDGET_MS": "300"},
+        )
+        assert exit_code == 2
+
+    def test_generous_config_budget_still_denies(self, tmp_path):
+        """A budget that isn't exhausted should not change the decision."""
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["budget_ms"] = 60000
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(config_file),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        assert exit_code == 2
+
+    def test_invalid_budget_logs_warning(self, tmp_path):
+        """A non-numeric budget_ms should be ignored with a warning."""
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["budget_ms"] = "fast"
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(config_file),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        assert exit_code == 2
+        assert "'budget_ms' must be a positive number" in stderr
+
+
+def write_config(tmp_path: Path, **overrides) -> Path:
+    """Write the valid fixture config with overrides applied to the first database."""
+    config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+    config["databases"][0].update(overrides)
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config))
+    return config_file
+
+
+def hook_env(
+    tmp_path: Path,
+    config_file: Path | None = None,
+    options: dict | None = None,
+    state_dir: Path | None = None,
+    **extra: str,
+) -> dict:
+    """Build the hook's environment, with its state in tmp_path/state (or state_dir).
+
+    The config is config_file, the fixture with top-level options set
+    (written to tmp_path/config.json), or else the fixture itself.
+    """
+    if options is not None:
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps({**config, **options}))
+    return {
+        **os.environ,
+        "DOCSEARCH_CONFIG_PATH": str(config_file or FIXTURES_DIR / "valid_config.json"),
+        "DOCSEARCH_STATE_DIR": str(state_dir or tmp_path / "state"),
+        **extra,
+    }
+
+
+class TestRoutingStrategies:
+    """Tests for per-database routing strategies."""
+
+    def test_fuzzy_strategy_matches_typos(self, tmp_path):
+        """Opting into fuzzy matching should catch misspelled keywords."""
+        config_file = write_config(tmp_path, strategies=["keyword", "fuzzy"])
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlbab runner tags"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 2
+
+    def test_fuzzy_strategy_is_opt_in(self):
+        """Without fuzzy matching, misspelled keywords should not match."""
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlbab runner tags"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")},
+        )
+        assert exit_code == 0
+
+    def test_regex_patterns_match_phrases(self, tmp_path):
+        """Phrase/regex patterns should route queries without a keyword."""
+        config_file = write_config(tmp_path, patterns=[r"merge requests?\b", r"\.gitlab-ci\.ya?ml"])
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)}
+        for query in ["approve a merge request", "syntax of .gitlab-ci.yml"]:
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebSearch", "tool_input": {"query": query}}, env=env
+            )
+            assert exit_code == 2, f"Failed for query: {query}"
+
+    def test_strategies_select_what_runs(self, tmp_path):
+        """A database limited to domain routing should ignore its keywords."""
+        config_file = write_config(tmp_path, strategies=["domain"])
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)}
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}, env=env
+        )
+        assert exit_code == 0
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "ci", "allowed_domains": ["docs.gitlab.com"]}},
+            env=env,
+        )
+        assert exit_code == 2
+
+    def test_unknown_strategy_logs_warning(self, tmp_path):
+        """Unknown strategy names should invalidate the database entry."""
+        config_file = write_config(tmp_path, strategies=["keyword", "telepathy"])
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 0
+        assert "'strategies' must be a list of" in stderr
+
+    def test_invalid_pattern_logs_warning(self, tmp_path):
+        """A pattern that doesn't compile should invalidate the database entry."""
+        config_file = write_config(tmp_path, patterns=["(unclosed"])
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 0
+        assert "is invalid" in stderr
+
+
+class TestExtractKeywords:
+    """Tests for the extract-keywords command."""
+
+    def make_corpus(self, root: Path, pages: list[str]) -> Path:
+        root.mkdir()
+        for i, page in enumerate(pages):
+            suffix = ".html" if page.startswith("<") else ".md"
+            (root / f"page-{i}{suffix}").write_text(page)
+        return root
+
+    def test_ranks_distinctive_terms_against_background(self, tmp_path):
+        """Terms frequent in the sources but rare in the background should rank first."""
+        sources = self.make_corpus(tmp_path / "sources", [
+            "Configure the runner executor and pipeline cache.",
+            "A pipeline runs jobs on a runner.",
+            "<html><body><p>Pipeline artifacts and the runner</p><script>tracking()</script></body></html>",
+            "The pipeline editor validates configuration.",
+        ])
+        background = self.make_corpus(tmp_path / "background", [
+            "Configure the application and validates configuration.",
+            "Jobs and configuration for the application.",
+        ])
+        config_file = write_config(tmp_path, name="gitlab", sources=str(sources))
+
+        exit_code, stdout, stderr = run_command(
+            ["extract-keywords", "gitlab", "--background", str(background), "--min-df", "2"],
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 0, stderr
+        candidates = [item["keyword"] for item in json.loads(stdout)]
+        assert candidates[:2] == ["pipeline", "runner"]
+        assert "configuration" not in candidates
+        assert "tracking" not in candidates
+
+    def test_process_pool_gives_same_result(self, tmp_path):
+        """Parallel tokenization should not change the ranking."""
+        sources = self.make_corpus(tmp_path / "sources", [
+            f"kubectl apply deployment rollout {i}" for i in range(40)
+        ])
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(write_config(tmp_path, sources=str(sources)))}
+        serial = run_command(["extract-keywords", "0"], env=env)
+        parallel = run_command(["extract-keywords", "0", "--workers", "2"], env=env)
+        assert serial[0] == parallel[0] == 0
+        assert json.loads(serial[1]) == json.loads(parallel[1])
+
+    def test_unknown_database_fails(self, tmp_path):
+        """An unknown database name should exit non-zero with an error."""
+        exit_code, stdout, stderr = run_command(
+            ["extract-keywords", "terraform"],
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")},
+        )
+        assert exit_code == 1
+        assert "No database 'terraform'" in stderr
+
+
+class TestPrometheusMetrics:
+    """Tests for Prometheus textfile metrics."""
+
+    def test_metrics_rendered_with_decisions_and_histogram(self, tmp_path):
+        """Invocations should be aggregated into the .prom file."""
+        state_dir = tmp_path / "state"
+        prom_file = tmp_path / "docsearch.prom"
+        config_file = write_config(tmp_path, name="gitlab")
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(config_file),
+            "DOCSEARCH_STATE_DIR": str(state_dir),
+            "DOCSEARCH_METRICS_FILE": str(prom_file),
+            "DOCSEARCH_METRICS_INTERVAL": "0",
+        }
+        search = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "metrics"}
+        assert run_hook(search, env=env)[0] == 2
+        assert run_hook(search, env=env)[0] == 0  # escape hatch
+        assert run_hook({"tool_name": "WebSearch", "tool_input": {"query": "sandwich"}}, env=env)[0] == 0
+
+        prom = prom_file.read_text()
+        assert "docsearch_invocations_total 3" in prom
+        assert 'docsearch_decisions_total{decision="deny"} 1' in prom
+        assert 'docsearch_decisions_total{decision="escape_hatch"} 1' in prom
+        assert 'docsearch_decisions_total{decision="pass"} 1' in prom
+        assert 'docsearch_database_matches_total{database="gitlab"} 1' in prom
+        assert 'docsearch_hook_duration_seconds_bucket{le="+Inf"} 3' in prom
+        assert "docsearch_hook_duration_seconds_count 3" in prom
+
+    def test_metrics_spooled_between_renders(self, tmp_path):
+        """Within the render interval, invocations should only be spooled."""
+        state_dir = tmp_path / "state"
+        prom_file = tmp_path / "docsearch.prom"
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+            "DOCSEARCH_STATE_DIR": str(state_dir),
+            "DOCSEARCH_METRICS_FILE": str(prom_file),
+            "DOCSEARCH_METRICS_INTERVAL": "3600",
+        }
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "sandwich"}}
+        run_hook(hook_input, env=env)  # First run renders (no .prom yet)
+        run_hook(hook_input, env=env)
+        run_hook(hook_input, env=env)
+
+        assert "docsearch_invocations_total 1" in prom_file.read_text()
+        spool = (state_dir / "docsearch-metrics.spool").read_text().splitlines()
+        assert [line.split("\t")[0] for line in spool] == ["pass", "pass"]
+
+    def test_config_errors_counted(self, tmp_path):
+        """An unparseable config should be counted as a config error."""
+        config_file = tmp_path / "config.json"
+        config_file.write_text("not valid json")
+        prom_file = tmp_path / "docsearch.prom"
+        run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(config_file),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+                "DOCSEARCH_METRICS_FILE": str(prom_file),
+                "DOCSEARCH_METRICS_INTERVAL": "0",
+            },
+        )
+        assert 'docsearch_decisions_total{decision="config_error"} 1' in prom_file.read_text()
+
+
+class TestShadowMode:
+    """Tests for shadow mode, which records decisions without denying."""
+
+    def test_shadow_mode_allows_and_logs_would_be_deny(self, tmp_path):
+        """A matching search should be allowed, with the deny recorded."""
+        env = hook_env(tmp_path, options={"mode": "shadow"})
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "shadow-1"}
+        exit_code, stdout, stderr = run_hook(hook_input, env=env)
+        assert exit_code == 0
+        assert stdout == ""
+
+        log_lines = (tmp_path / "state" / "docsearch-decisions.log").read_text().splitlines()
+        assert len(log_lines) == 1
+        timestamp, session, mode, decision, databases, escape_hatch, duration_us, arm = log_lines[0].split("\t")
+        assert (mode, decision, databases, escape_hatch, arm) == ("shadow", "deny", "GitLab documentation", "0", "")
+        assert session != "shadow-1" and len(session) == 12
+        assert int(duration_us) > 0
+
+    def test_shadow_mode_writes_no_state(self, tmp_path):
+        """Shadow mode should not record denied params, so retries are predicted as denies too."""
+        env = hook_env(tmp_path, options={"mode": "shadow"})
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "shadow-2"}
+        run_hook(hook_input, env=env)
+        run_hook(hook_input, env=env)
+
+        assert not (tmp_path / "state" / "docsearch-state-shadow-2.json").exists()
+        log_lines = (tmp_path / "state" / "docsearch-decisions.log").read_text().splitlines()
+        assert [line.split("\t")[3] for line in log_lines] == ["deny", "deny"]
+
+    def test_invalid_mode_logs_warning(self, tmp_path):
+        """An unknown mode should be ignored with a warning."""
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["mode"] = "audit"
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file), "DOCSEARCH_STATE_DIR": str(tmp_path / "state")},
+        )
+        assert exit_code == 2
+        assert "'mode' must be one of enforce, shadow" in stderr
+
+
+class TestDecisionLog:
+    """Tests for the decision log and the stats command."""
+
+    def test_every_invocation_is_logged(self, tmp_path):
+        """Enforced denies, escape-hatch retries and passes should all be recorded."""
+        env = hook_env(tmp_path)
+        deny = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "log-1"}
+        run_hook(deny, env=env)
+        run_hook(deny, env=env)
+        run_hook({"tool_name": "WebSearch", "tool_input": {"query": "python"}, "session_id": "log-1"}, env=env)
+
+        records = [line.split("\t") for line in (tmp_path / "state" / "docsearch-decisions.log").read_text().splitlines()]
+        assert [(r[2], r[3], r[4], r[5]) for r in records] == [
+            ("enforce", "deny", "GitLab documentation", "0"),
+            ("enforce", "escape_hatch", "", "1"),
+            ("enforce", "pass", "", "0"),
+        ]
+
+    def test_log_rotates_at_size_cap(self, tmp_path):
+        """The log should rotate to a single .1 generation when it reaches the cap."""
+        env = hook_env(tmp_path, DOCSEARCH_DECISION_LOG_MAX_BYTES="200")
+        for i in range(8):
+            run_hook({"tool_name": "WebSearch", "tool_input": {"query": "python"}, "session_id": f"rot-{i}"}, env=env)
+
+        log_file = tmp_path / "state" / "docsearch-decisions.log"
+        rotated = tmp_path / "state" / "docsearch-decisions.log.1"
+        assert rotated.exists()
+        assert log_file.stat().st_size < 200 and rotated.stat().st_size < 300
+        assert not (tmp_path / "state" / "docsearch-decisions.log.2").exists()
+
+    def test_zero_cap_disables_log(self, tmp_path):
+        env = hook_env(tmp_path, DOCSEARCH_DECISION_LOG_MAX_BYTES="0")
+        run_hook({"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}, env=env)
+        assert not (tmp_path / "state" / "docsearch-decisions.log").exists()
+
+    def test_stats_reports_rates_and_latency(self, tmp_path):
+        """stats should summarize the rotated and current log together."""
+        log_file = tmp_path / "decisions.log"
+        rows = [
+            ["100", "s1", "enforce", "deny", "GitLab documentation", "0", "1000"],
+            ["101", "s1", "enforce", "escape_hatch", "", "1", "2000"],
+            ["102", "s2", "enforce", "deny", "GitLab documentation,Kubernetes documentation", "0", "3000"],
+            ["103", "s2", "shadow", "pass", "", "0", "100000"],
+            ["104", "s3", "shadow", "deny", "GitLab documentation", "0", "2000"],
+            ["not a record"],
+        ]
+        (tmp_path / "decisions.log.1").write_text("\t".join(rows[0]) + "\n")
+        log_file.write_text("".join("\t".join(row) + "\n" for row in rows[1:]))
+
+        exit_code, stdout, stderr = run_command(["stats", "--log", str(log_file), "--json"])
+        assert exit_code == 0
+        summary = json.loads(stdout)
+        assert summary["invocations"] == 5
+        assert summary["decisions"] == {"deny": 2, "escape_hatch": 1, "shadow_pass": 1, "shadow_deny": 1}
+        # A shadow-mode deny redirected nothing: it is reported on its own
+        assert summary["hit_rate"] == 0.4
+        assert summary["escape_hatch_rate"] == 0.5
+        assert summary["shadow_redirects"] == 1
+        assert summary["shadow_hit_rate"] == 0.5
+        assert summary["databases"] == {"GitLab documentation": 3, "Kubernetes documentation": 1}
+        assert 1900 <= summary["latency_us"]["p50"] <= 2100
+        assert 95000 <= summary["latency_us"]["p99"] <= 105000
+
+        exit_code, stdout, stderr = run_command(["stats", "--log", str(log_file)])
+        assert exit_code == 0
+        assert "Hit rate:          40.0%" in stdout
+        assert "Shadow mode:       1 calls would have been redirected (50.0% of shadow-mode calls)" in stdout
+        assert "GitLab documentation" in stdout
+
+    def test_stats_without_log(self, tmp_path):
+        exit_code, stdout, stderr = run_command(["stats", "--log", str(tmp_path / "missing.log")])
+        assert exit_code == 0
+        assert "No decisions logged" in stdout
+
+
+def session_in_arm(experiment: dict, arm_name: str) -> str:
+    """Find a session ID the experiment assigns to an arm."""
+    return next(f"ab-{i}" for i in range(10000) if docsearch.assign_arm(experiment, f"ab-{i}")["name"] == arm_name)
+
+
+def write_session_transcript(path: Path, turns: list[tuple[int, int, list[str]]]) -> Path:
+    """Write a transcript of (prompt second, answer second, tool names) turns."""
+    def stamp(second: int) -> str:
+        return f"2026-01-01T00:{second // 60:02d}:{second % 60:02d}.000Z"
+
+    lines = []
+    for prompt_at, answer_at, tools in turns:
+        lines.append({"type": "user", "timestamp": stamp(prompt_at), "message": {"role": "user", "content": "question"}})
+        for i, tool in enumerate(tools):
+            use_id = f"toolu_{prompt_at}_{i}"
+            lines.append({"type": "assistant", "timestamp": stamp(prompt_at + 1), "message": {
+                "role": "assistant", "content": [{"type": "tool_use", "id": use_id, "name": tool, "input": {}}],
+            }})
+            lines.append({"type": "user", "timestamp": stamp(prompt_at + 1), "message": {
+                "role": "user", "content": [{"type": "tool_result", "tool_use_id": use_id, "content": "ok"}],
+            }})
+        lines.append({"type": "assistant", "timestamp": stamp(answer_at), "message": {
+            "role": "assistant", "content": [{"type": "text", "text": "answer"}],
+        }})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    return path
+
+
+class TestExperiments:
+    """Tests for session-level A/B experiments and the experiment-report command."""
+
+    EXPERIMENT = {
+        "name": "rag-trial",
+        "arms": [
+            {"name": "off", "mode": "off"},
+            {"name": "shadow", "mode": "shadow"},
+            {"name": "keyword", "strategies": ["keyword"]},
+            {"name": "fuzzy", "strategies": ["keyword", "fuzzy"]},
+        ],
+    }
+
+    def test_assignment_is_stable_and_weighted(self):
+        experiment = docsearch.validate_experiment(
+            {"name": "weights", "arms": [{"name": "a"}, {"name": "b", "weight": 3}]}
+        )
+        sessions = [f"session-{i}" for i in range(4000)]
+        arms = [docsearch.assign_arm(experiment, session)["name"] for session in sessions]
+        assert arms == [docsearch.assign_arm(experiment, session)["name"] for session in sessions]
+        assert 0.22 < arms.count("a") / len(arms) < 0.28
+
+        renamed = {**experiment, "name": "weights-2"}
+        assert arms != [docsearch.assign_arm(renamed, session)["name"] for session in sessions]
+
+    def test_arms_run_their_mode_and_strategies(self, tmp_path):
+        """Each session should get its arm's mode and strategies, recorded in the decision log."""
+        env = hook_env(tmp_path, options={"experiment": self.EXPERIMENT})
+        experiment = docsearch.validate_experiment(self.EXPERIMENT)
+        session = {arm["name"]: session_in_arm(experiment, arm["name"]) for arm in experiment["arms"]}
+
+        def search(arm: str, query: str) -> int:
+            hook_input = {"tool_name": "WebSearch", "tool_input": {"query": query}, "session_id": session[arm]}
+            return run_hook(hook_input, env=env)[0]
+
+        assert search("off", "gitlab ci") == 0
+        assert search("shadow", "gitlab ci") == 0
+        assert search("keyword", "gitlab ci") == 2
+        assert search("keyword", "kubernets pods") == 0
+        assert search("fuzzy", "kubernets pods") == 2
+        # The arm's strategies replace each database's own, domain rules included
+        allowed = {"tool_name": "WebSearch", "tool_input": {"query": "ingress", "allowed_domains": ["kubernetes.io"]}}
+        assert run_hook({**allowed, "session_id": session["keyword"]}, env=env)[0] == 0
+
+        records = [line.split("\t") for line in (tmp_path / "state" / "docsearch-decisions.log").read_text().splitlines()]
+        assert [(r[7], r[2], r[3]) for r in records] == [
+            ("off", "off", "pass"),
+            ("shadow", "shadow", "deny"),
+            ("keyword", "enforce", "deny"),
+            ("keyword", "enforce", "pass"),
+            ("fuzzy", "enforce", "deny"),
+            ("keyword", "enforce", "pass"),
+        ]
+
+    def test_session_start_compiles_the_arm_matcher(self, tmp_path):
+        env = hook_env(tmp_path, options={"experiment": self.EXPERIMENT})
+        experiment = docsearch.validate_experiment(self.EXPERIMENT)
+        run_command(["session-start"], {"session_id": session_in_arm(experiment, "fuzzy")}, env=env)
+        assert len(list((tmp_path / "state").glob("docsearch-compiled-*.json"))) == 2
+
+    def test_invalid_experiment_is_ignored(self, tmp_path):
+        """A bad arm should drop the whole experiment with a warning."""
+        experiment = {"arms": [{"name": "control", "mode": "off"}, {"name": "typo", "strategies": ["fuzy"]}]}
+        env = hook_env(tmp_path, options={"experiment": experiment})
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "any"}, env=env
+        )
+        assert exit_code == 2
+        assert "arm 'typo' 'strategies' must be a non-empty list" in stderr
+
+    def test_stats_reports_arms(self, tmp_path):
+        """stats should break calls down by arm, reading records from before arms were logged too."""
+        log_file = tmp_path / "decisions.log"
+        rows = [
+            ["100", "s1", "enforce", "deny", "GitLab documentation", "0", "1000"],
+            ["101", "s2", "off", "pass", "", "0", "900", "control"],
+            ["102", "s3", "enforce", "deny", "GitLab documentation", "0", "1000", "rag"],
+            ["103", "s3", "enforce", "escape_hatch", "", "1", "1000", "rag"],
+        ]
+        log_file.write_text("".join("\t".join(row) + "\n" for row in rows))
+
+        exit_code, stdout, stderr = run_command(["stats", "--log", str(log_file), "--json"])
+        summary = json.loads(stdout)
+        assert summary["invocations"] == 4
+        assert summary["decisions"] == {"deny": 2, "off_pass": 1, "escape_hatch": 1}
+        assert summary["arms"] == {
+            "control": {"invocations": 1, "redirected": 0, "shadow_redirects": 0, "escape_hatches": 0},
+            "rag": {"invocations": 2, "redirected": 1, "shadow_redirects": 0, "escape_hatches": 1},
+        }
+
+        exit_code, stdout, stderr = run_command(["stats", "--log", str(log_file)])
+        assert "rag                      2 calls, 1 redirected, 1 escape hatches" in stdout
+
+    def test_experiment_report_joins_transcripts(self, tmp_path):
+        """experiment-report should compare arms using the transcripts of logged sessions."""
+        log_file = tmp_path / "decisions.log"
+        rows = [
+            ("control-1", "off"), ("control-2", "off"), ("rag-1", "rag"), ("rag-1", "rag"),
+            ("mixed", "off"), ("mixed", "rag"), ("untracked", ""),
+        ]
+        log_file.write_text("".join(
+            f"100\t{docsearch.hash_session_id(session)}\tenforce\tpass\t\t0\t1000\t{arm}\n" for session, arm in rows
+        ))
+        transcripts = tmp_path / "projects"
+        write_session_transcript(transcripts / "-repo-a" / "control-1.jsonl", [
+            (0, 40, ["WebSearch", "WebSearch", "WebFetch"]),
+            (60, 90, ["WebSearch", "Read"]),
+        ])
+        write_session_transcript(transcripts / "-repo-b" / "rag-1.jsonl", [(0, 10, ["mcp__leann-docs__search"])])
+        write_session_transcript(transcripts / "-repo-b" / "mixed.jsonl", [(0, 5, ["WebSearch"])])
+        write_session_transcript(transcripts / "-repo-b" / "untracked.jsonl", [(0, 5, ["WebSearch"])])
+
+        exit_code, stdout, stderr = run_command(
+            ["experiment-report", "--log", str(log_file), "--transcripts", str(transcripts), "--json"]
+        )
+        assert exit_code == 0
+        report = json.loads(stdout)
+        assert report["mixed_sessions"] == 1
+        assert report["arms"] == {
+            "off": {
+                "logged_sessions": 2, "sessions": 1, "turns": 2,
+                "answer_seconds_p50": 30.0, "answer_seconds_p90": 40.0,
+                "tool_calls_per_turn": 2.5, "web_searches_per_turn": 1.5, "web_fetches_per_turn": 0.5,
+            },
+            "rag": {
+                "logged_sessions": 1, "sessions": 1, "turns": 1,
+                "answer_seconds_p50": 10.0, "answer_seconds_p90": 10.0,
+                "tool_calls_per_turn": 1.0, "web_searches_per_turn": 0.0, "web_fetches_per_turn": 0.0,
+            },
+        }
+
+        exit_code, stdout, stderr = run_command(
+            ["experiment-report", "--log", str(log_file), "--transcripts", str(transcripts)]
+        )
+        assert "1 logged sessions had no transcript" in stdout
+        assert "1 sessions were logged under more than one arm" in stdout
+
+    def test_experiment_report_counts_sessions_driven_through_the_hook(self, tmp_path):
+        """Control-arm calls return early, but must still be logged under their own session."""
+        experiment = {"name": "control-trial", "arms": [{"name": "control", "mode": "off"}, {"name": "rag"}]}
+        env = hook_env(tmp_path, options={"experiment": experiment})
+        arms = docsearch.validate_experiment(experiment)
+        transcripts = tmp_path / "projects"
+        for arm in ("control", "rag"):
+            session = session_in_arm(arms, arm)
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": session}, env=env
+            )
+            assert exit_code == (0 if arm == "control" else 2)
+            write_session_transcript(transcripts / "-repo" / f"{session}.jsonl", [(0, 20, ["WebSearch"])])
+
+        exit_code, stdout, stderr = run_command([
+            "experiment-report", "--log", str(tmp_path / "state" / "docsearch-decisions.log"),
+            "--transcripts", str(transcripts), "--json",
+        ])
+        assert exit_code == 0
+        report = json.loads(stdout)
+        assert report["arms"]["control"]["sessions"] == 1
+        assert report["arms"]["rag"]["sessions"] == 1
+
+
+class TestSampledProfiling:
+    """Tests for DOCSEARCH_PROFILE_SAMPLE and the profile-report command."""
+
+    def test_no_profiles_without_sampling(self, tmp_path):
+        run_hook({"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}, env=hook_env(tmp_path))
+        assert not (tmp_path / "state" / "docsearch-profiles").exists()
+
+    def test_sample_one_profiles_every_call_and_keeps_decision(self, tmp_path):
+        env = hook_env(tmp_path, DOCSEARCH_PROFILE_SAMPLE="1")
+        exit_code, stdout, stderr = run_hook({"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}, env=env)
+        assert exit_code == 2
+        assert json.loads(stdout)["hookSpecificOutput"]["permissionDecision"] == "deny"
+        assert len(list((tmp_path / "state" / "docsearch-profiles").glob("*.pstats"))) == 1
+
+    def test_profile_dir_is_bounded(self, tmp_path):
+        env = hook_env(tmp_path, DOCSEARCH_PROFILE_SAMPLE="1", DOCSEARCH_PROFILE_MAX_FILES="2")
+        for _ in range(4):
+            run_hook({"tool_name": "WebSearch", "tool_input": {"query": "python"}}, env=env)
+        assert len(list((tmp_path / "state" / "docsearch-profiles").glob("*.pstats"))) == 2
+
+    def test_invalid_sample_rate_warns_and_runs(self, tmp_path):
+        env = hook_env(tmp_path, DOCSEARCH_PROFILE_SAMPLE="often")
+        exit_code, stdout, stderr = run_hook({"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}}, env=env)
+        assert exit_code == 2
+        assert "DOCSEARCH_PROFILE_SAMPLE must be an integer" in stderr
+
+    def test_profile_report_merges_profiles(self, tmp_path):
+        env = hook_env(tmp_path, DOCSEARCH_PROFILE_SAMPLE="1")
+        for query in ["gitlab ci", "python"]:
+            run_hook({"tool_name": "WebSearch", "tool_input": {"query": query}}, env=env)
+        merged = tmp_path / "merged.pstats"
+
+        exit_code, stdout, stderr = run_command(["profile-report", "--output", str(merged)], env=env)
+        assert exit_code == 0
+        assert "Merged 2 profiles" in stdout
+        assert "pre_tool_use" in stdout
+        assert merged.exists()
+        assert len(list((tmp_path / "state" / "docsearch-profiles").glob("*.pstats"))) == 2
+
+    def test_profile_report_without_profiles(self, tmp_path):
+        exit_code, stdout, stderr = run_command(["profile-report", "--dir", str(tmp_path / "none")])
+        assert exit_code == 1
+        assert "No profiles" in stdout
+
+
+class TestNearDuplicateRetries:
+    """Tests for recognizing reworded retries with retry_similarity."""
+
+    def search(self, query: str, env: dict, **tool_input) -> int:
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": query, **tool_input}, "session_id": "reword"}
+        return run_hook(hook_input, env=env)[0]
+
+    def test_reworded_retry_is_allowed(self, tmp_path):
+        env = hook_env(tmp_path, options={"retry_similarity": 0.8})
+        assert self.search("gitlab ci cache docs", env) == 2
+        state = json.loads((tmp_path / "state" / "docsearch-state-reword.json").read_text())
+        assert state["last_denied"]["fingerprint"]
+        assert self.search("GitLab CI caching documentation", env) == 0
+
+    def test_different_query_is_still_denied(self, tmp_path):
+        env = hook_env(tmp_path, options={"retry_similarity": 0.8})
+        assert self.search("gitlab ci cache docs", env) == 2
+        assert self.search("gitlab ci variables", env) == 2
+
+    def test_changed_domains_are_still_denied(self, tmp_path):
+        env = hook_env(tmp_path, options={"retry_similarity": 0.8})
+        assert self.search("gitlab ci cache docs", env) == 2
+        assert self.search("gitlab ci caching", env, blocked_domains=["example.com"]) == 2
+
+    def test_off_by_default(self, tmp_path):
+        env = hook_env(tmp_path)
+        assert self.search("gitlab ci cache docs", env) == 2
+        assert "fingerprint" not in (tmp_path / "state" / "docsearch-state-reword.json").read_text()
+        assert self.search("GitLab CI caching documentation", env) == 2
+
+    def test_invalid_threshold_logs_warning(self, tmp_path):
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}}, env=hook_env(tmp_path, options={"retry_similarity": 1.5})
+        )
+        assert exit_code == 2
+        assert "'retry_similarity' must be a number in (0, 1]" in stderr
+
+
+class TestRagQueryHints:
+    """Tests for citing the keyword that fired and suggesting the first RAG call."""
+
+    def deny(self, query: str, config_file: Path = FIXTURES_DIR / "valid_config.json") -> dict:
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": query}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 2
+        return json.loads(stdout)["hookSpecificOutput"]
+
+    def test_reason_cites_keyword_that_matched(self):
+        output = self.deny("k8s pod eviction")
+        assert output["permissionDecisionReason"] == "Query matches 'k8s' - using RAG database instead"
+
+    def test_longest_keyword_wins(self):
+        output = self.deny("gitlab-ci cache keys")
+        assert output["permissionDecisionReason"] == "Query matches 'gitlab-ci' - using RAG database instead"
+        assert "Suggested first RAG call: query 'cache keys'." in output["additionalContext"]
+
+    def test_suggested_query_strips_routing_keyword(self):
+        output = self.deny("How do I configure GitLab runners?")
+        assert "Suggested first RAG call: query 'How do I configure runners?'." in output["additionalContext"]
+
+    def test_query_of_only_keywords_is_kept(self):
+        output = self.deny("GitLab")
+        assert "query 'GitLab'" in output["additionalContext"]
+
+    def test_top_k_and_filters_hints(self, tmp_path):
+        config_file = write_config(tmp_path, top_k=8, filters={"version": "17.0"})
+        output = self.deny("gitlab runner tags", config_file)
+        assert (
+            "Suggested first RAG call: query 'runner tags', top_k 8, filters {\"version\": \"17.0\"}."
+            in output["additionalContext"]
+        )
+
+    def test_multiple_databases_get_their_own_suggestions(self):
+        output = self.deny("deploy to kubernetes from gitlab")
+        context = output["additionalContext"]
+        assert "GitLab documentation at /mock/path/gitlab (query 'deploy to kubernetes from')" in context
+        assert "Kubernetes documentation at /mock/path/kubernetes (query 'deploy to from gitlab')" in context
+
+    def test_stem_hits_are_stripped(self, tmp_path):
+        config_file = write_config(tmp_path, strategies=["stem"], keywords=["pipeline"])
+        output = self.deny("Pipelines failing on merge", config_file)
+        assert output["permissionDecisionReason"] == "Query matches 'pipelines' - using RAG database instead"
+        assert "query 'failing on merge'" in output["additionalContext"]
+
+    def test_invalid_top_k_logs_warning(self, tmp_path):
+        config_file = write_config(tmp_path, top_k=0)
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 0
+        assert "'top_k' must be a positive integer" in stderr
+
+    def test_router_explain_reports_hits_and_offsets(self):
+        router = docsearch.Router(FIXTURES_DIR / "valid_config.json")
+        [(db, hits)] = router.explain({"query": "Why does kubectl hang"})
+        assert db["description"] == "Kubernetes documentation"
+        assert hits == [{"strategy": "keyword", "keyword": "kubectl", "text": "kubectl", "start": 9, "end": 16}]
+
+
+class TestFreshnessBypass:
+    """Tests for letting searches newer than a database's index through."""
+
+    def make_database(self, tmp_path: Path, age_days: float) -> Path:
+        database = tmp_path / "gitlab-db"
+        database.mkdir(exist_ok=True)
+        (database / "index.bin").write_text("x")
+        built = time.time() - age_days * 86400
+        for path in (database / "index.bin", database):
+            os.utime(path, (built, built))
+        return database
+
+    def search(self, tmp_path: Path, query: str, **overrides) -> int:
+        config_file = write_config(tmp_path, **overrides)
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": query}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file), "DOCSEARCH_STATE_DIR": str(tmp_path / "state")},
+        )
+        return exit_code
+
+    def test_newer_version_than_indexed_goes_to_web(self, tmp_path):
+        assert self.search(tmp_path, "gitlab 18.4 release", version="17.5") == 0
+        decision = (tmp_path / "state" / "docsearch-decisions.log").read_text().split("\t")[3]
+        assert decision == "stale_database"
+
+    def test_indexed_version_is_still_redirected(self, tmp_path):
+        assert self.search(tmp_path, "gitlab 17.2 runner tags", version="17.5") == 2
+        assert self.search(tmp_path, "gitlab 17.5 runner tags", version="17.5") == 2
+
+    def test_version_of_another_product_is_still_redirected(self, tmp_path):
+        """Only a version right after the database's own hit counts."""
+        assert self.search(tmp_path, "gitlab runner on node 20.1 image", version="17.5") == 2
+        assert self.search(tmp_path, "gitlab ci with python 3.12", version="17.5") == 2
+        assert self.search(tmp_path, "node 20.1 image for gitlab", version="17.5") == 2
+        assert self.search(tmp_path, "gitlab runner 18.1 tags", version="17.5") == 0
+
+    def test_recency_cue_on_old_database_goes_to_web(self, tmp_path):
+        database = self.make_database(tmp_path, age_days=90)
+        assert self.search(tmp_path, "latest gitlab runner changes", path=str(database), max_age=30) == 0
+
+    def test_recency_cue_on_fresh_database_is_redirected(self, tmp_path):
+        database = self.make_database(tmp_path, age_days=5)
+        assert self.search(tmp_path, "latest gitlab runner changes", path=str(database), max_age=30) == 2
+
+    def test_recency_cue_without_max_age_is_redirected(self, tmp_path):
+        database = self.make_database(tmp_path, age_days=90)
+        assert self.search(tmp_path, "latest gitlab runner changes", path=str(database)) == 2
+
+    def test_year_after_build_on_old_database_goes_to_web(self, tmp_path):
+        database = self.make_database(tmp_path, age_days=800)
+        query = f"gitlab roadmap {time.gmtime().tm_year}"
+        assert self.search(tmp_path, query, path=str(database), max_age=30) == 0
+
+    def test_only_stale_database_is_dropped(self, tmp_path):
+        config_file = write_config(tmp_path, version="17.5")
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab 18.0 on kubernetes"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert "Kubernetes documentation" in context
+        assert "GitLab documentation" not in context
+
+    def test_build_times_are_cached(self, tmp_path):
+        database = self.make_database(tmp_path, age_days=90)
+        assert self.search(tmp_path, "latest gitlab news", path=str(database), max_age=30) == 0
+        index = json.loads((tmp_path / "state" / "docsearch-db-stats.json").read_text())
+        assert index[str(database)]["mtime"] < time.time() - 80 * 86400
+
+        # A rebuild inside the TTL isn't seen until the cached entry expires
+        os.utime(database / "index.bin")
+        assert self.search(tmp_path, "latest gitlab news", path=str(database), max_age=30) == 0
+
+    def test_invalid_freshness_settings_log_warnings(self, tmp_path):
+        config_file = write_config(tmp_path, max_age=-1)
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert "'max_age' must be a positive number of days" in stderr
+        config_file = write_config(tmp_path, version="latest")
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert "'version' must be a dotted version string" in stderr
+
+
+class TestRedisStateBackend:
+    """Tests for keeping session state in Redis (against an in-process stand-in)."""
+
+    def test_retry_after_failover_to_another_host_is_allowed(self, tmp_path):
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "failover"}
+        with RedisStandIn() as server:
+            exit_code, stdout, stderr = run_hook(hook_input, env=hook_env(tmp_path, state_dir=tmp_path / "host-a", DOCSEARCH_STATE_BACKEND=server.url))
+            assert exit_code == 2
+            exit_code, stdout, stderr = run_hook(hook_input, env=hook_env(tmp_path, state_dir=tmp_path / "host-b", DOCSEARCH_STATE_BACKEND=server.url))
+            assert exit_code == 0
+            assert stderr == ""
+        assert not list(tmp_path.glob("host-*/docsearch-state-*.json"))
+
+    def test_denied_state_expires_with_escape_hatch_window(self, tmp_path):
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "ttl"}
+        with RedisStandIn() as server:
+            run_hook(hook_input, env=hook_env(tmp_path, state_dir=tmp_path / "host-a", DOCSEARCH_STATE_BACKEND=server.url))
+            value, expires = server.databases["0"][b"docsearch:state:ttl"]
+            assert json.loads(value)["last_denied"]["query"] == "gitlab ci"
+            assert 290 < expires - time.time() <= 300
+
+    def test_session_start_creates_slot_in_redis(self, tmp_path):
+        with RedisStandIn() as server:
+            exit_code, stdout, stderr = run_command(
+                ["session-start"], {"session_id": "slot"}, env=hook_env(tmp_path, state_dir=tmp_path / "host-a", DOCSEARCH_STATE_BACKEND=server.url)
+            )
+            assert exit_code == 0
+            assert json.loads(server.get(b"docsearch:state:slot")) == {"last_denied": None}
+
+    def test_password_and_database_from_url(self, tmp_path):
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "auth"}
+        with RedisStandIn(password="s3cret") as server:
+            url = server.url.replace("/0", "/2")
+            assert run_hook(hook_input, env=hook_env(tmp_path, state_dir=tmp_path / "host-a", DOCSEARCH_STATE_BACKEND=url))[0] == 2
+            assert run_hook(hook_input, env=hook_env(tmp_path, state_dir=tmp_path / "host-b", DOCSEARCH_STATE_BACKEND=url))[0] == 0
+            assert server.get(b"docsearch:state:auth", db="2") is not None
+            assert [b"AUTH", b"s3cret"] in server.commands
+
+    def test_unreachable_server_fails_open(self, tmp_path):
+        """Without stored state a retry couldn't get through, so matching searches aren't denied."""
+        with RedisStandIn() as server:
+            url = server.url
+        env = hook_env(tmp_path, state_dir=tmp_path / "host-a", DOCSEARCH_STATE_BACKEND=url)
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "down"}
+        exit_code, stdout, stderr = run_hook(hook_input, env=env)
+        assert exit_code == 0
+        assert "State backend 127.0.0.1" in stderr
+        assert stderr.count("Warning: State backend") == 1
+        record = (tmp_path / "host-a" / "docsearch-decisions.log").read_text().splitlines()[-1].split("\t")
+        assert record[3] == "state_unavailable"
+
+        # Later hooks on the host back off without retrying or warning again
+        exit_code, stdout, stderr = run_hook(hook_input, env=env)
+        assert exit_code == 0
+        assert stderr == ""
+        backoff = json.loads((tmp_path / "host-a" / "docsearch-redis-backoff.json").read_text())
+        assert list(backoff) == [url.removeprefix("redis://")]
+
+    def test_stalled_server_times_out_quickly(self, tmp_path):
+        with RedisStandIn() as server:
+            server.stall = True
+            env = {**hook_env(tmp_path, state_dir=tmp_path / "host-a", DOCSEARCH_STATE_BACKEND=server.url), "DOCSEARCH_REDIS_TIMEOUT_MS": "50"}
+            started = time.monotonic()
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "session_id": "stall"}, env=env
+            )
+            assert exit_code == 0
+            assert time.monotonic() - started < 5
+            assert "unavailable" in stderr
+
+    def test_connection_is_pooled_across_operations(self):
+        with RedisStandIn() as server:
+            backend = docsearch_redis.RedisStateBackend(server.url, timeout=1.0)
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(lambda i: backend.save(f"s{i}", {"last_denied": None}), range(20)))
+            assert all(backend.exists(f"s{i}") for i in range(20))
+            assert backend.load("s3") == {"last_denied": None}
+            assert backend.load("missing") == {}
+            assert server.connections <= 4
+            assert len(backend.idle) == server.connections
+
+
+class TestRagLoadLimits:
+    """Tests for per-database max_per_minute and max_concurrent limits."""
+
+    def search(self, config_file: Path, tmp_path: Path, query: str = "gitlab ci", session: str = "s") -> tuple[int, str]:
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": query}, "session_id": session},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file), "DOCSEARCH_STATE_DIR": str(tmp_path / "state")},
+        )
+        return exit_code, stdout
+
+    def decisions(self, tmp_path: Path) -> list[str]:
+        lines = (tmp_path / "state" / "docsearch-decisions.log").read_text().splitlines()
+        return [line.split("\t")[3] for line in lines]
+
+    def test_concurrency_limit_sends_overflow_to_web(self, tmp_path):
+        config_file = write_config(tmp_path, max_concurrent=2)
+        exit_codes = [self.search(config_file, tmp_path, session=f"agent-{i}")[0] for i in range(3)]
+        assert exit_codes == [2, 2, 0]
+        assert self.decisions(tmp_path) == ["deny", "deny", "rag_saturated"]
+
+    def test_rate_limit_refills_over_time(self, tmp_path):
+        config_file = write_config(tmp_path, max_per_minute=1)
+        assert self.search(config_file, tmp_path, session="a")[0] == 2
+        assert self.search(config_file, tmp_path, session="b")[0] == 0
+
+        limits_file = tmp_path / "state" / "docsearch-limits.json"
+        limits = json.loads(limits_file.read_text())
+        limits["/mock/path/gitlab"]["updated"] -= 60
+        limits_file.write_text(json.dumps(limits))
+        assert self.search(config_file, tmp_path, session="c")[0] == 2
+
+    def test_only_saturated_database_is_dropped(self, tmp_path):
+        config_file = write_config(tmp_path, max_concurrent=1)
+        self.search(config_file, tmp_path, session="a")
+        exit_code, stdout = self.search(config_file, tmp_path, query="gitlab on kubernetes", session="b")
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert "Kubernetes documentation" in context
+        assert "GitLab documentation" not in context
+
+    def test_shadow_mode_does_not_consume_capacity(self, tmp_path):
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["mode"] = "shadow"
+        config["databases"][0]["max_concurrent"] = 1
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+        for session in ("a", "b"):
+            assert self.search(config_file, tmp_path, session=session)[0] == 0
+        assert self.decisions(tmp_path) == ["deny", "deny"]
+
+    def test_invalid_limit_logs_warning(self, tmp_path):
+        config_file = write_config(tmp_path, max_per_minute=0)
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert "'max_per_minute' must be a number of at least 1" in stderr
+
+
+class TestKeywordIndex:
+    """Tests for the binary keyword index persisted with the compiled matcher."""
+
+    def test_cached_matcher_uses_index_instead_of_keywords(self, tmp_path):
+        env = hook_env(tmp_path)
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "kubectl and gitlab-ci"}}
+        first = run_hook(hook_input, env=env)
+        [compiled_file] = (tmp_path / "state").glob("docsearch-compiled-*.json")
+        assert compiled_file.with_suffix(".idx").exists()
+        compiled = json.loads(compiled_file.read_text())
+        assert all("keywords" not in db for db in compiled["databases"])
+
+        # The second run loads the cache and matches through the index, with the same result
+        second = run_hook({**hook_input, "session_id": "other"}, env=env)
+        assert first[0] == second[0] == 2
+        assert json.loads(first[1]) == json.loads(second[1])
+
+    def test_corrupt_index_is_rebuilt(self, tmp_path):
+        env = hook_env(tmp_path)
+        run_hook({"tool_name": "WebSearch", "tool_input": {"query": "python"}}, env=env)
+        [index_file] = (tmp_path / "state").glob("docsearch-compiled-*.idx")
+        index_file.write_bytes(b"garbage")
+
+        exit_code, stdout, stderr = run_hook({"tool_name": "WebSearch", "tool_input": {"query": "k8s"}}, env=env)
+        assert exit_code == 2
+        assert index_file.read_bytes().startswith(b"DSKX")
+
+    def test_index_of_another_matcher_is_rejected(self, tmp_path):
+        """An index only pairs with the JSON it was built with, even if the database counts agree."""
+        indexes = []
+        for keyword in ("alphaterm", "betaterm"):
+            (tmp_path / keyword).mkdir()
+            config_file = write_config(tmp_path / keyword, keywords=[keyword])
+            env = hook_env(tmp_path / keyword, config_file)
+            assert run_hook({"tool_name": "WebSearch", "tool_input": {"query": f"{keyword} setup"}}, env=env)[0] == 2
+            [index_file] = (tmp_path / keyword / "state").glob("docsearch-compiled-*.idx")
+            indexes.append(index_file)
+        beta_index = indexes[1].read_bytes()
+        indexes[1].write_bytes(indexes[0].read_bytes())
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "betaterm install"}, "session_id": "cached"}, env=env
+        )
+        assert exit_code == 2
+        assert indexes[1].read_bytes() == beta_index
+
+    def test_cache_size_does_not_grow_with_keywords(self, tmp_path):
+        """The JSON part of the cache is what gets parsed on startup; keywords stay out of it."""
+        sizes = []
+        for count in (10, 5000):
+            config_file = write_config(tmp_path, keywords=[f"term{i}" for i in range(count)])
+            env = hook_env(tmp_path / str(count), config_file)
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebSearch", "tool_input": {"query": f"term{count - 1} setup"}}, env=env
+            )
+            assert exit_code == 2
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebSearch", "tool_input": {"query": "term7 setup"}, "session_id": "cached"}, env=env
+            )
+            assert exit_code == 2
+            [compiled_file] = (tmp_path / str(count) / "state").glob("docsearch-compiled-*.json")
+            sizes.append(compiled_file.stat().st_size)
+        assert sizes[1] - sizes[0] < 100
+
+
+def write_transcript(path: Path, calls: list[tuple[str, dict, dict]], timestamp: str | None = None) -> Path:
+    """Write a JSONL transcript of (tool name, input, tool_result fields) calls, optionally timestamped."""
+    stamp = {"timestamp": timestamp} if timestamp else {}
+    lines = []
+    for i, (name, tool_input, result) in enumerate(calls):
+        lines.append(json.dumps({
+            "type": "assistant",
+            **stamp,
+            "message": {"content": [{"type": "tool_use", "id": f"toolu_{i}", "name": name, "input": tool_input}]},
+        }))
+        lines.append(json.dumps({
+            "type": "user",
+            **stamp,
+            "message": {"content": [{"type": "tool_result", "tool_use_id": f"toolu_{i}", **result}]},
+        }))
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+class TestTranscriptAwareRouting:
+    """Tests for skipping databases the transcript shows a failed RAG call for."""
+
+    def test_failed_rag_call_allows_search(self, tmp_path):
+        """A recent empty RAG result for the matched database should let the search through."""
+        transcript = write_transcript(tmp_path / "transcript.jsonl", [
+            ("mcp__leann-docs__leann_search", {"index_name": "gitlab", "query": "ci cache"},
+             {"content": [{"type": "text", "text": "No results found"}]}),
+        ])
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci cache"}, "transcript_path": str(transcript)},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        assert exit_code == 0
+
+    def test_successful_rag_call_still_denies(self, tmp_path):
+        """A RAG call that returned results should not change the decision."""
+        transcript = write_transcript(tmp_path / "transcript.jsonl", [
+            ("mcp__leann-docs__leann_search", {"index_name": "gitlab", "query": "ci cache"},
+             {"content": "Use the cache: keyword in .gitlab-ci.yml to ..."}),
+        ])
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci cache"}, "transcript_path": str(transcript)},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        assert exit_code == 2
+
+    def test_failure_only_drops_the_database_it_was_for(self, tmp_path):
+        """A failed call for one index should keep other matched databases."""
+        transcript = write_transcript(tmp_path / "transcript.jsonl", [
+            ("mcp__leann-docs__leann_search", {"index_name": "gitlab", "query": "gitlab runner"},
+             {"is_error": True, "content": "boom"}),
+        ])
+        exit_code, stdout, stderr = run_hook(
+            {
+                "tool_name": "WebSearch",
+                "tool_input": {"query": "gitlab kubernetes runner"},
+                "transcript_path": str(transcript),
+            },
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert "Kubernetes documentation" in context
+        assert "GitLab documentation" not in context
+
+    def search_after(self, tmp_path: Path, transcript: Path, query: str) -> int:
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": query}, "transcript_path": str(transcript)},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        return exit_code
+
+    def test_failure_on_another_topic_still_denies(self, tmp_path):
+        """A failed call about one topic should not let unrelated searches through."""
+        transcript = write_transcript(tmp_path / "transcript.jsonl", [
+            ("mcp__leann-docs__leann_search", {"query": "gitlab ci cache"}, {"content": "No results found"}),
+        ])
+        assert self.search_after(tmp_path, transcript, "kubernetes pod security admission") == 2
+        assert self.search_after(tmp_path, transcript, "gitlab pages custom domain") == 2
+        assert self.search_after(tmp_path, transcript, "how to set up the gitlab ci cache") == 0
+
+    def test_failure_without_query_still_denies(self, tmp_path):
+        transcript = write_transcript(tmp_path / "transcript.jsonl", [
+            ("mcp__leann-docs__leann_search", {"index_name": "gitlab"}, {"content": "No results found"}),
+        ])
+        assert self.search_after(tmp_path, transcript, "gitlab ci cache") == 2
+
+    def test_old_failure_still_denies(self, tmp_path):
+        """Failed calls older than the recency limit should be ignored."""
+        call = ("mcp__leann-docs__leann_search", {"query": "gitlab ci cache"}, {"content": "No results found"})
+        old = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() - 3600))
+        transcript = write_transcript(tmp_path / "old.jsonl", [call], timestamp=old)
+        assert self.search_after(tmp_path, transcript, "gitlab ci cache") == 2
+        recent = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() - 60))
+        transcript = write_transcript(tmp_path / "recent.jsonl", [call], timestamp=recent)
+        assert self.search_after(tmp_path, transcript, "gitlab ci cache") == 0
+
+    def test_only_the_transcript_tail_is_scanned(self, tmp_path):
+        """Calls before the byte cap should be ignored."""
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["transcript_scan_bytes"] = 1024
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+        transcript = tmp_path / "transcript.jsonl"
+        write_transcript(transcript, [
+            ("mcp__leann-docs__leann_search", {"index_name": "gitlab", "query": "gitlab ci"},
+             {"content": "No results found"}),
+        ])
+        filler = json.dumps({"type": "user", "message": {"content": "x" * 2048}})
+        transcript.write_text(transcript.read_text() + filler + "\n")
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "transcript_path": str(transcript)},
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(config_file),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        assert exit_code == 2
+
+    def test_missing_transcript_still_denies(self, tmp_path):
+        """An unreadable transcript should not affect the decision."""
+        exit_code, stdout, stderr = run_hook(
+            {
+                "tool_name": "WebSearch",
+                "tool_input": {"query": "gitlab ci"},
+                "transcript_path": str(tmp_path / "missing.jsonl"),
+            },
+            env={
+                **os.environ,
+                "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+                "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+            },
+        )
+        assert exit_code == 2
+
+
+class TestProjectConfig:
+    """Tests for project-local config layered over the global config."""
+
+    def write_project_config(self, project_dir: Path, config: dict) -> Path:
+        config_dir = project_dir / ".claude"
+        config_dir.mkdir(parents=True)
+        config_file = config_dir / "docsearch-config.json"
+        config_file.write_text(json.dumps(config))
+        return config_file
+
+    def test_project_database_applies_in_subdirectories(self, tmp_path):
+        """A project's databases should apply anywhere below the project root."""
+        project_dir = tmp_path / "repo"
+        self.write_project_config(project_dir, {"databases": [{
+            "keywords": ["terraform"],
+            "path": "/mock/path/terraform",
+            "mcp_tool_name": "leann-docs",
+            "description": "Terraform documentation",
+        }]})
+        nested = project_dir / "modules" / "network"
+        nested.mkdir(parents=True)
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json")}
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "terraform gitlab backend"}, "cwd": str(nested)},
+            env=env,
+        )
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert context.index("Terraform documentation") < context.index("GitLab documentation")
+
+        # Outside the project only the global config applies
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "terraform backend"}, "cwd": str(tmp_path)},
+            env=env,
+        )
+        assert exit_code == 0
+
+    def test_project_database_overrides_global_by_name(self, tmp_path):
+        """A project database with a global database's name should replace its fields."""
+        global_config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        global_config["databases"][0]["name"] = "gitlab"
+        global_file = tmp_path / "global.json"
+        global_file.write_text(json.dumps(global_config))
+        project_dir = tmp_path / "repo"
+        self.write_project_config(project_dir, {"databases": [
+            {"name": "gitlab", "keywords": ["glab"], "description": "Self-managed GitLab docs"},
+        ]})
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(global_file)}
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "glab mr create"}, "cwd": str(project_dir)},
+            env=env,
+        )
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert "Self-managed GitLab docs" in context
+
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}, "cwd": str(project_dir)},
+            env=env,
+        )
+        assert exit_code == 0
+
+    def test_merged_config_cached_per_project_and_invalidated_on_edit(self, tmp_path):
+        """Each project gets its own cached merge, rebuilt when its config changes."""
+        state_dir = tmp_path / "state"
+        project_a = tmp_path / "a"
+        project_b = tmp_path / "b"
+        config_a = self.write_project_config(project_a, {"databases": [{
+            "keywords": ["ansible"], "path": "/a", "mcp_tool_name": "t", "description": "Ansible docs",
+        }]})
+        self.write_project_config(project_b, {"databases": [{
+            "keywords": ["helm"], "path": "/b", "mcp_tool_name": "t", "description": "Helm docs",
+        }]})
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+            "DOCSEARCH_STATE_DIR": str(state_dir),
+        }
+        for project, query in [(project_a, "ansible roles"), (project_b, "helm charts")]:
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebSearch", "tool_input": {"query": query}, "cwd": str(project)}, env=env
+            )
+            assert exit_code == 2
+        assert len(list(state_dir.glob("docsearch-compiled-*.json"))) == 2
+
+        config_a.write_text(json.dumps({"databases": [{
+            "keywords": ["ansible-lint"], "path": "/a", "mcp_tool_name": "t", "description": "Ansible docs",
+        }]}))
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "ansible-lint rules"}, "cwd": str(project_a)}, env=env
+        )
+        assert exit_code == 2
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "ansible roles"}, "cwd": str(project_a)}, env=env
+        )
+        assert exit_code == 0
+
+    def test_project_files_are_resolved_once_per_cwd(self, tmp_path):
+        """The cwd walk is cached; session-start re-resolves it for a new session."""
+        project_dir = tmp_path / "repo"
+        project_dir.mkdir()
+        env = {
+            **os.environ,
+            "DOCSEARCH_CONFIG_PATH": str(FIXTURES_DIR / "valid_config.json"),
+            "DOCSEARCH_STATE_DIR": str(tmp_path / "state"),
+        }
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "terraform backend"}, "cwd": str(project_dir)}
+        assert run_hook(hook_input, env=env)[0] == 0
+        index = json.loads((tmp_path / "state" / "docsearch-projects.json").read_text())
+        assert index[str(project_dir)]["config"] is None
+
+        self.write_project_config(project_dir, {"databases": [{
+            "keywords": ["terraform"],
+            "path": "/mock/path/terraform",
+            "mcp_tool_name": "leann-docs",
+            "description": "Terraform documentation",
+        }]})
+        assert run_hook(hook_input, env=env)[0] == 0
+        run_command(["session-start"], {"cwd": str(project_dir)}, env=env)
+        assert run_hook(hook_input, env=env)[0] == 2
+
+        # A cached project config that was removed is re-resolved straight away
+        (project_dir / ".claude" / "docsearch-config.json").unlink()
+        assert run_hook(hook_input, env=env)[0] == 0
+        index = json.loads((tmp_path / "state" / "docsearch-projects.json").read_text())
+        assert index[str(project_dir)]["config"] is None
+
+
+class TestConfigFragments:
+    """Tests for docsearch-config.d fragments."""
+
+    def make_fragments(self, tmp_path: Path) -> Path:
+        config_file = tmp_path / "docsearch-config.json"
+        config_file.write_text((FIXTURES_DIR / "valid_config.json").read_text())
+        fragment_dir = tmp_path / "docsearch-config.d"
+        fragment_dir.mkdir()
+        for name, keyword in [("10-helm.json", "helm"), ("20-terraform.json", "terraform")]:
+            (fragment_dir / name).write_text(json.dumps({"databases": [{
+                "keywords": [keyword],
+                "path": f"/mock/path/{keyword}",
+                "mcp_tool_name": "leann-docs",
+                "description": f"{keyword.title()} documentation",
+            }]}))
+        return config_file
+
+    def test_fragment_databases_are_loaded_after_global(self, tmp_path):
+        """Fragment databases should match, ordered after the global databases."""
+        config_file = self.make_fragments(tmp_path)
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "terraform helm gitlab"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert context.index("GitLab") < context.index("Helm") < context.index("Terraform")
+
+    def test_only_changed_fragment_is_recompiled(self, tmp_path):
+        """Editing one fragment should leave the other fragments' compiled state alone."""
+        config_file = self.make_fragments(tmp_path)
+        state_dir = tmp_path / "state"
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file), "DOCSEARCH_STATE_DIR": str(state_dir)}
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "helm charts"}}
+        assert run_hook(hook_input, env=env)[0] == 2
+
+        # Each fragment has its own compiled file; mark helm's, an untouched fragment keeps it
+        compiled_files = sorted(state_dir.glob("docsearch-fragment-*.json"))
+        assert len(compiled_files) == 2
+        assert all(path.with_suffix(".idx").exists() for path in compiled_files)
+        helm_file = next(path for path in compiled_files if "Helm" in path.read_text())
+        helm = json.loads(helm_file.read_text())
+        helm["databases"][0]["description"] = "Cached Helm documentation"
+        helm_file.write_text(json.dumps(helm))
+        helm_index_mtime = helm_file.with_suffix(".idx").stat().st_mtime_ns
+
+        (tmp_path / "docsearch-config.d" / "20-terraform.json").write_text(json.dumps({"databases": [{
+            "keywords": ["opentofu"], "path": "/mock/path/tofu", "mcp_tool_name": "leann-docs",
+            "description": "OpenTofu documentation",
+        }]}))
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "opentofu helm"}}, env=env
+        )
+        assert exit_code == 2
+        context = json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+        assert "Cached Helm documentation" in context
+        assert "OpenTofu documentation" in context
+        assert helm_file.with_suffix(".idx").stat().st_mtime_ns == helm_index_mtime
+
+        # The persisted matcher searches the fragments' own indexes
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "opentofu providers"}}, env=env
+        )
+        assert exit_code == 2
+        assert "OpenTofu documentation" in json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+
+    def test_invalid_fragment_entry_logs_warning_with_file(self, tmp_path):
+        """Warnings for fragment entries should name the fragment file."""
+        config_file = self.make_fragments(tmp_path)
+        (tmp_path / "docsearch-config.d" / "30-broken.json").write_text(json.dumps({"databases": [{"keywords": ["x"]}]}))
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "helm"}},
+            env={**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)},
+        )
+        assert exit_code == 2
+        assert "Database entry 0 in 30-broken.json missing required field 'path'" in stderr
+
+
+class TestMcpToolVerification:
+    """Tests for skipping databases whose MCP server isn't configured."""
+
+    def env_with_claude_json(self, tmp_path: Path, claude_json: dict, verify: bool = True) -> dict:
+        claude_json_file = tmp_path / "claude.json"
+        claude_json_file.write_text(json.dumps(claude_json))
+        return hook_env(tmp_path, options={"verify_mcp_tools": verify}, DOCSEARCH_CLAUDE_JSON=str(claude_json_file))
+
+    def test_unconfigured_server_allows_search(self, tmp_path):
+        """A database whose MCP server isn't configured should not be suggested, with a warning."""
+        env = self.env_with_claude_json(tmp_path, {"mcpServers": {"github": {"command": "gh-mcp"}}})
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}, env=env
+        )
+        assert exit_code == 0
+        assert "Not redirecting to GitLab documentation: MCP server 'leann-docs'" in stderr
+
+    def test_user_server_denies(self, tmp_path):
+        """A database whose MCP server is configured for the user should be suggested."""
+        env = self.env_with_claude_json(tmp_path, {"mcpServers": {"leann-docs": {"command": "leann_mcp"}}})
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}, env=env
+        )
+        assert exit_code == 2
+
+    def test_project_servers_apply_below_project(self, tmp_path):
+        """Project-scoped servers in ~/.claude.json and .mcp.json should count in their projects."""
+        project_dir = tmp_path / "repo"
+        (project_dir / "sub").mkdir(parents=True)
+        env = self.env_with_claude_json(tmp_path, {
+            "projects": {str(project_dir): {"mcpServers": {"leann-docs": {"command": "leann_mcp"}}}},
+        })
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}
+        assert run_hook({**hook_input, "cwd": str(project_dir / "sub")}, env=env)[0] == 2
+        assert run_hook({**hook_input, "cwd": str(tmp_path)}, env=env)[0] == 0
+
+        other_dir = tmp_path / "other"
+        other_dir.mkdir()
+        (other_dir / ".mcp.json").write_text(json.dumps({"mcpServers": {"leann-docs": {"command": "leann_mcp"}}}))
+        assert run_hook({**hook_input, "cwd": str(other_dir)}, env=env)[0] == 2
+
+    def test_verification_is_off_by_default(self, tmp_path):
+        """Servers from plugins or --mcp-config aren't visible, so nothing is skipped unless opted in."""
+        env = self.env_with_claude_json(tmp_path, {"mcpServers": {}}, verify=False)
+        exit_code, stdout, stderr = run_hook(
+            {"tool_name": "WebSearch", "tool_input": {"query": "gitlab ci"}}, env=env
+        )
+        assert exit_code == 2
+        assert stderr == ""
+
+    def test_doctor_reports_missing_servers(self, tmp_path):
+        """doctor should list each database's MCP status and fail on mismatches."""
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["databases"][0]["name"] = "gitlab"
+        config["databases"][1]["mcp_tool_name"] = "mcp__leann-k8s__leann_search"
+        config_file = tmp_path / "doctor-config.json"
+        config_file.write_text(json.dumps(config))
+        env = self.env_with_claude_json(tmp_path, {"mcpServers": {"leann-docs": {}}})
+        env["DOCSEARCH_CONFIG_PATH"] = str(config_file)
+
+        exit_code, stdout, stderr = run_command(["doctor", "--cwd", str(tmp_path)], env=env)
+        assert exit_code == 1
+        assert "OK       gitlab: leann-docs" in stdout
+        assert "MISSING  #1 Kubernetes documentation: MCP server 'leann-k8s' is not configured" in stdout
+
+
+class TestStemMatching:
+    """Tests for the opt-in normalization and stemming strategy."""
+
+    def test_inflected_and_width_variant_queries_match(self, tmp_path):
+        """Plurals, possessives and full-width text should match keyword stems."""
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["databases"][0]["keywords"] = ["gitlab", "pipeline", "merge request"]
+        config["databases"][1]["keywords"] = ["kubernetes", "deployment"]
+        for db in config["databases"]:
+            db["strategies"] = ["keyword", "stem"]
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)}
+
+        for query, description in [
+            ("rolling deployments", "Kubernetes documentation"),
+            ("Kubernetes' scheduler", "Kubernetes documentation"),
+            ("ＧｉｔＬａｂ runners", "GitLab documentation"),
+            ("parallel pipelines", "GitLab documentation"),
+            ("squash Merge Requests", "GitLab documentation"),
+        ]:
+            exit_code, stdout, stderr = run_hook(
+                {"tool_name": "WebSearch", "tool_input": {"query": query}}, env=env
+            )
+            assert exit_code == 2, f"Failed for query: {query}"
+            assert description in json.loads(stdout)["hookSpecificOutput"]["additionalContext"]
+
+    def test_stemming_is_opt_in_and_keeps_word_boundaries(self, tmp_path):
+        """Without the stem strategy plurals don't match; with it, prefixes still don't."""
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        config["databases"][0]["keywords"] = ["pipeline"]
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+        env = {**os.environ, "DOCSEARCH_CONFIG_PATH": str(config_file)}
+        hook_input = {"tool_name": "WebSearch", "tool_input": {"query": "parallel pipelines"}}
+        assert run_hook(hook_input, env=env)[0] == 0
+
+        config["databases"][0]["strategies"] = ["stem"]
+        config_file.write_text(json.dumps(config))
+        assert run_hook(hook_input, env=env)[0] == 2
+        hook_input["tool_input"]["query"] = "subpipelines execution"
+        assert run_hook(hook_input, env=env)[0] == 0
+
+
+class TestRouterLibrary:
+    """Tests for routing through the importable Router class."""
+
+    def test_routes_from_config_path(self):
+        router = docsearch.Router(FIXTURES_DIR / "valid_config.json")
+        matches = router.route({"query": "gitlab with kubernetes"})
+        assert [db["description"] for db in matches] == ["GitLab documentation", "Kubernetes documentation"]
+        assert router.route({"query": "python tutorial"}) == []
+
+    def test_routes_from_config_dict(self):
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        router = docsearch.Router(config)
+        matches = router.route({"url": "https://kubernetes.io/docs/"}, tool_name="WebFetch")
+        assert [db["description"] for db in matches] == ["Kubernetes documentation"]
+
+    def test_route_many_keeps_input_order(self):
+        router = docsearch.Router(FIXTURES_DIR / "valid_config.json")
+        results = router.route_many([{"query": "k8s pods"}, {"query": "weather"}, {"query": "gitlab runner"}])
+        assert [[db["description"] for db in matches] for matches in results] == [
+            ["Kubernetes documentation"],
+            [],
+            ["GitLab documentation"],
+        ]
+
+    def test_returned_databases_dont_alter_router(self):
+        config = json.loads((FIXTURES_DIR / "valid_config.json").read_text())
+        router = docsearch.Router(config)
+        router.route({"query": "gitlab"})[0]["description"] = "changed"
+        config["databases"][0]["description"] = "changed"
+        assert router.route({"query": "gitlab"})[0]["description"] == "GitLab documentation"
+
+    def test_deny_response_matches_hook_output(self):
+        router = docsearch.Router(FIXTURES_DIR / "valid_config.json")
+        response = router.deny_response(router.route({"query": "gitlab ci"}))
+        assert response["hookSpecificOutput"]["permissionDecision"] == "deny"
+        assert "GitLab documentation" in response["hookSpecificOutput"]["additionalContext"]
+
+    def test_concurrent_batches_match_serial_results(self):
+        router = docsearch.Router(FIXTURES_DIR / "valid_config.json")
+        queries = [{"query": q} for q in ["gitlab ci", "k8s", "kubectl and gitlab", "rust", "GL pipelines"] * 40]
+        expected = router.route_many(queries)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(router.route_many, [queries] * 16))
+        assert all(result == expected for result in results)
+
+    def test_invalid_config_raises(self, tmp_path):
+        with pytest.raises(ValueError):
+            docsearch.Router({"databases": [{"keywords": ["x"]}]})
+        with pytest.raises(ValueError):
+            docsearch.Router(tmp_path / "missing.json")
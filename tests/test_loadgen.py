@@ -0,0 +1,46 @@
+"""Smoke tests for the multi-session load generator (see loadgen.py)."""
+import json
+import random
+
+from loadgen import generate_query, main, percentile, session_rng
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.5) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_generate_query_honours_match_ratio():
+    rng = random.Random(1)
+    assert all("gitlab" in generate_query(rng, ["gitlab"], 1.0).split() for _ in range(20))
+    assert not any("gitlab" in generate_query(rng, ["gitlab"], 0.0).split() for _ in range(20))
+
+
+def test_sessions_draw_independent_queries():
+    """Sessions sharing a seed shouldn't issue the same calls in lockstep."""
+    def session_queries(seed: int, index: int) -> list[str]:
+        rng = session_rng(seed, index)
+        return [generate_query(rng, ["gitlab"], 0.5) for _ in range(5)]
+
+    assert len({tuple(session_queries(7, index)) for index in range(3)}) == 3
+    assert session_queries(7, 0) == session_queries(7, 0)
+
+
+def test_run_reports_throughput_state_files_and_cleanup(tmp_path, capsys, monkeypatch):
+    """A short run should drive the real hook and report on the state directory."""
+    # main() exports its hook settings to this process; let monkeypatch restore them
+    monkeypatch.setenv("DOCSEARCH_CONFIG_PATH", "")
+    exit_code = main([
+        "--sessions", "2", "--rate", "4", "--duration", "1.5", "--interval", "1",
+        "--match-ratio", "1", "--retry-ratio", "1", "--state-dir", str(tmp_path / "state"), "--json",
+    ])
+    assert exit_code == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    reports, total = lines[:-1], lines[-1]["total"]
+    assert reports and all(report["cleanup_ms"] >= 0 for report in reports)
+    assert reports[-1]["state_files"] >= 2
+    assert total["calls"] > 0
+    assert set(total["outcomes"]) <= {"deny", "retry_allowed"}
+    assert total["outcomes"].get("deny")
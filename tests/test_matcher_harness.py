@@ -0,0 +1,44 @@
+"""Differential fuzz tests for keyword matcher engines (see matcher_harness.py)."""
+import pytest
+
+from matcher_harness import ENGINES, differential_check, measure_engine, oracle_engine
+
+CANDIDATE_ENGINES = [name for name in ENGINES if name != "oracle"]
+
+
+@pytest.mark.parametrize("engine_name", CANDIDATE_ENGINES)
+@pytest.mark.parametrize("seed", range(10))
+def test_engine_matches_oracle_on_random_input(engine_name, seed):
+    """Candidate engines should agree with the regex oracle on generated data."""
+    assert differential_check(engine_name, seed, keyword_count=40, query_count=300) == []
+
+
+@pytest.mark.parametrize("engine_name", CANDIDATE_ENGINES)
+def test_engine_matches_oracle_on_known_edges(engine_name):
+    """Candidate engines should agree with the oracle on hand-picked edge cases."""
+    databases = [
+        {"keywords": ["c++"], "path": "/a", "mcp_tool_name": "t", "description": "cpp"},
+        {"keywords": [".net", "c#"], "path": "/b", "mcp_tool_name": "t", "description": "dotnet"},
+        {"keywords": ["node.js"], "path": "/c", "mcp_tool_name": "t", "description": "node"},
+        {"keywords": ["straße", "İstanbul"], "path": "/d", "mcp_tool_name": "t", "description": "unicode"},
+        {"keywords": ["c"], "path": "/e", "mcp_tool_name": "t", "description": "c"},
+    ]
+    queries = [
+        "c++ templates", "learn c++", "c++11", "(c++)", "c+++", ".net core", "asp.net", "c# async",
+        "c#.", "node.js streams", "nodexjs", "STRASSE", "straße", "i̇stanbul", "İSTANBUL", "c",
+        "objective-c", "c-level", "c\tc++", "", " ", "c++\n.net",
+    ]
+    oracle = oracle_engine(databases)
+    candidate = ENGINES[engine_name](databases)
+    for query in queries:
+        expected = [db["description"] for db in oracle(query)]
+        assert [db["description"] for db in candidate(query)] == expected, f"Failed for query: {query!r}"
+
+
+@pytest.mark.parametrize("engine_name", list(ENGINES))
+def test_measure_engine_reports_throughput_and_memory(engine_name):
+    """The throughput report should cover build time, rate and peak memory."""
+    result = measure_engine(engine_name, keyword_count=20, query_count=50)
+    assert result["matches_per_second"] > 0
+    assert result["peak_memory_kib"] > 0
+    assert result["build_ms"] >= 0